@@ -1,25 +1,31 @@
 import logging
-import subprocess
 import os
-import signal
-import sys
 import threading
 import requests
 import time
 import datetime
 import secrets
-from flask import Flask, jsonify, render_template, make_response, request, redirect, url_for, session
+from flask import Flask, Response, jsonify, render_template, make_response, request, redirect, url_for, session, stream_with_context
 import atexit
-from openai import OpenAI
 import os
+import socket as socket_module
 import tempfile
 
-from config import BOT_OWNER
+from config import (BOT_OWNER, ADMIN_CHAT_PAGE_SIZE, OPENAI_MODEL, OPENAI_HEALTH_INTERVAL, OPENAI_HEALTH_PROBE,
+                    OPENAI_HEALTH_TIMEOUT,
+                    BOT_MODE, BOT_RUNTIME, WEBHOOK_BASE_URL, WEBHOOK_PATH, BOT_RESTART_MIN_BACKOFF,
+                    BOT_RESTART_MAX_BACKOFF, BOT_STABLE_AFTER, WEBHOOK_SECRET, WEBHOOK_FORWARD_SOCKET,
+                    LEADER_LOCK_PATH, LEADER_STATUS_PATH, LEADER_RETRY_INTERVAL, LEADER_STATUS_INTERVAL,
+                    FLASK_SECRET_KEY, SECRET_KEY_PATH)
+from bot_supervisor import BotSupervisor
+from leader_election import LeaderElection, SharedStatus
+from webhook_receiver import verify_secret, forward_update
+from openai_health import OpenAIHealthProber, STATUS_DISPLAY
+from openai_clients import get_pool_stats
 # Per windows, ricorda di attivare anche su config.py
 # from dotenv import load_dotenv
 # load_dotenv('secrets.env')
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
 BOT_OWNER = "@ityttmom"
 
@@ -32,19 +38,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def load_secret_key(path):
+    """
+    Chiave di sessione condivisa dai worker: letta dal file, creato dal primo worker che la cerca.
+
+    Il file viene scritto per intero su un file temporaneo e poi collegato al nome
+    definitivo con os.link, che fallisce se esiste già: tutti i worker leggono
+    così la stessa chiave, mai un file scritto a metà.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+            logger.info(f"Creata la chiave di sessione condivisa in {path}")
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(tmp_path)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
 # Create a Flask app
 app = Flask(__name__)
-# Configurazione della sessione (necessaria per l'autenticazione)
-app.secret_key = secrets.token_hex(16)
-
-# Global variable to keep track of bot process
-bot_process = None
+# Configurazione della sessione (necessaria per l'autenticazione): la chiave deve essere la stessa
+# in tutti i worker, altrimenti una sessione creata da un worker non è valida negli altri
+app.secret_key = FLASK_SECRET_KEY or load_secret_key(SECRET_KEY_PATH)
+
+# Supervisore del processo del bot: riavvio automatico con backoff esponenziale
+bot_supervisor = BotSupervisor(
+    log_dir=tempfile.gettempdir(),
+    min_backoff=BOT_RESTART_MIN_BACKOFF,
+    max_backoff=BOT_RESTART_MAX_BACKOFF,
+    stable_after=BOT_STABLE_AFTER
+)
+# Ricevitore degli update in modalità webhook (il bot gira in questo processo, senza subprocess)
+webhook_receiver = None
+
+# Con più worker (gunicorn -w N) solo il leader avvia bot, controlli e keep-alive
+leader = LeaderElection(LEADER_LOCK_PATH, retry_interval=LEADER_RETRY_INTERVAL)
+# Stato pubblicato dal leader e letto dagli altri worker
+shared_status = SharedStatus(LEADER_STATUS_PATH)
+
+def is_bot_running():
+    """Indica se il bot è attivo (processo di polling vivo o webhook impostato)"""
+    if BOT_MODE == "webhook":
+        return webhook_receiver is not None
+    return bot_supervisor.is_running()
+
+def collect_status():
+    """Stato del bot e dell'API OpenAI di questo processo (significativo solo nel leader)"""
+    return {
+        "leader_pid": os.getpid(),
+        "bot_running": is_bot_running(),
+        "supervisor": bot_supervisor.stats(),
+        "webhook": webhook_receiver.stats() if webhook_receiver else None,
+        "openai": health_prober.get_status(),
+    }
+
+def get_status():
+    """Stato da mostrare: quello locale nel leader, quello pubblicato dal leader negli altri worker"""
+    if leader.is_leader:
+        return collect_status()
+    status = shared_status.read()
+    if status is None:
+        # Il leader non ha ancora pubblicato nulla
+        return {
+            "leader_pid": leader.leader_pid(),
+            "bot_running": False,
+            "supervisor": bot_supervisor.stats(),
+            "webhook": None,
+            "openai": health_prober.get_status(),
+        }
+    return status
 
 @app.route('/')
 def index():
     """Main page showing bot status and information"""
+    # Stato del bot e dell'API OpenAI (dal leader, se questo worker non lo è)
+    status = get_status()
+
+    # Riavvii e uptime del processo del bot, mostrati sotto lo stato
+    supervisor_stats = status["supervisor"]
+    if BOT_MODE == "webhook":
+        bot_status_details = "Modalità webhook"
+    elif supervisor_stats["running"]:
+        bot_status_details = (f"Attivo da {datetime.timedelta(seconds=supervisor_stats['uptime_seconds'])}, "
+                              f"riavvii automatici: {supervisor_stats['restarts']}")
+    else:
+        bot_status_details = f"Riavvii automatici: {supervisor_stats['restarts']}"
+
     # Check if the bot process is running
-    if bot_process and bot_process.poll() is None:
+    if status["bot_running"]:
         bot_status = "running"
         status_color = "success"
         status_text = "Attivo"
@@ -53,33 +149,14 @@ def index():
         status_color = "danger"
         status_text = "Fermo"
 
-    # Check OpenAI API status
-    try:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-        # Send a minimal request to check API status
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": "Hello, are you working?"}
-            ],
-            max_tokens=3
-        )
-
-        openai_status = "active"
-        openai_status_color = "success"
-        openai_status_text = "Attivo"
-    except Exception as e:
-        error_message = str(e)
-        if "insufficient_quota" in error_message:
-            openai_status = "quota_exceeded"
-            openai_status_color = "warning"
-            openai_status_text = "Quota superata"
-        else:
-            openai_status = "error"
-            openai_status_color = "danger"
-            openai_status_text = "Errore"
+    # OpenAI API status from the background prober cache (no API call here)
+    openai_health = status["openai"]
+    openai_status = openai_health["status"]
+    openai_status_color, openai_status_text = STATUS_DISPLAY[openai_status]
+    if openai_health["checked_at"]:
+        openai_status_details = f"Ultimo controllo: {openai_health['checked_at'].replace('T', ' ')} ({openai_health['latency_ms']} ms)"
+    else:
+        openai_status_details = "Primo controllo in corso..."
 
     # Create HTML response
     html_content = f"""
@@ -118,11 +195,13 @@ def index():
                         <div class="card-body">
                             <div class="bot-status text-center">
                                 <p>Stato del Bot: <span class="badge bg-{status_color}">{status_text}</span></p>
+                                <p class="small text-muted">{bot_status_details}</p>
                                 <button class="btn btn-primary" onclick="location.href='/restart-bot'">Riavvia Bot</button>
                             </div>
                             
                             <div class="api-status text-center">
                                 <p>Stato API OpenAI: <span class="badge bg-{openai_status_color}">{openai_status_text}</span></p>
+                                <p class="small text-muted">{openai_status_details}</p>
                                 <button class="btn btn-secondary" onclick="location.href='/check-openai'">Controlla API</button>
                             </div>
                             
@@ -172,8 +251,13 @@ def index():
 @app.route('/restart-bot')
 def restart_bot():
     """Endpoint to restart the bot if it crashed"""
-    stop_bot()
-    start_bot()
+    if not leader.is_leader:
+        # Il bot gira nel worker leader: gli si passa la richiesta
+        shared_status.request_restart()
+    elif BOT_MODE == "webhook":
+        start_webhook_mode()
+    else:
+        bot_supervisor.restart()
 
     # Redirect to home page with success message
     html_content = """
@@ -204,22 +288,11 @@ def restart_bot():
 @app.route('/check-openai')
 def check_openai():
     """Check if OpenAI API is working correctly"""
-    try:
-        # Initialize OpenAI client with the API key
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-        # Send a minimal request to check API status
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": "Hello, are you working?"}
-            ],
-            max_tokens=5  # Minimal tokens to save quota
-        )
-
-        # If we get here, the API is working
-        html_content = """
+    # Explicit check requested by the user: probe now and refresh the cached status
+    result = health_prober.probe()
+
+    if result["status"] == "active":
+        html_content = f"""
         <!DOCTYPE html>
         <html lang="it" data-bs-theme="dark">
         <head>
@@ -233,7 +306,7 @@ def check_openai():
             <div class="container py-5 text-center">
                 <div class="alert alert-success">
                     <h4>API OpenAI funzionante!</h4>
-                    <p>L'API OpenAI è attiva e funzionante correttamente.</p>
+                    <p>L'API OpenAI è attiva e funzionante correttamente ({result['latency_ms']} ms).</p>
                     <p>Stai per essere reindirizzato alla home page...</p>
                 </div>
             </div>
@@ -244,10 +317,10 @@ def check_openai():
         response = make_response(html_content)
         response.headers['Content-Type'] = 'text/html'
         return response
-    except Exception as e:
-        error_message = str(e)
+    else:
+        error_message = result["error"]
 
-        if "insufficient_quota" in error_message:
+        if result["status"] == "quota_exceeded":
             error_type = "Quota API superata"
             error_details = "La quota dell'API OpenAI è stata superata. È necessario aggiornare la chiave API."
         else:
@@ -281,79 +354,95 @@ def check_openai():
         return response
 
 def start_bot():
-    """Start the bot in a separate process."""
-    global bot_process
+    """Start the bot in a separate, supervised process."""
+    return bot_supervisor.start()
+
+def start_webhook_mode():
+    """Avvia il bot in modalità webhook nel processo del server web e imposta il webhook su Telegram."""
+    global webhook_receiver
+    if not WEBHOOK_BASE_URL:
+        logger.error("BOT_MODE=webhook richiede WEBHOOK_BASE_URL (o RENDER_EXTERNAL_URL)")
+        return False
+    if BOT_RUNTIME == "async":
+        logger.warning("La modalità webhook usa il runtime telebot, BOT_RUNTIME=async viene ignorato")
     try:
-        # Start bot_runner.py as a separate process
-        logger.info("Starting Telegram bot process...")
-
-        # Create log files for stdout and stderr
-        # stdout_log = open('/tmp/bot_stdout.log', 'w')
-        # stderr_log = open('/tmp/bot_stderr.log', 'w')
-        # Per windows locale
-        # stdout_log = open('bot_stdout.log', 'w')
-        # stderr_log = open('bot_stderr.log', 'w')
-
-        # Per render
-        log_dir = tempfile.gettempdir()
-        stdout_log = open(os.path.join(log_dir, 'bot_stdout.log'), 'w')
-        stderr_log = open(os.path.join(log_dir, 'bot_stderr.log'), 'w')
-
-        bot_process = subprocess.Popen(
-            [sys.executable, "bot_runner.py"],
-            stdout=stdout_log,
-            stderr=stderr_log,
-            text=True
-        )
-
-        # Log output reader thread
-        def log_reader():
-            while bot_process and bot_process.poll() is None:
-                try:
-                    # Check if process has terminated
-                    exit_code = bot_process.poll()
-                    if exit_code is not None:
-                        logger.warning(f"Bot process terminated with exit code {exit_code}")
-                        break
-                except:
-                    pass
-
-        # Start log reader in a daemon thread
-        log_thread = threading.Thread(target=log_reader, daemon=True)
-        log_thread.start()
-
-        logger.info(f"Telegram bot started with PID {bot_process.pid}")
+        if webhook_receiver is None:
+            # Import differito: il bot (e il client OpenAI) vive in questo processo solo in modalità webhook
+            from telegram_bot import start_webhook
+            webhook_receiver = start_webhook(WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH)
+            # Update ricevuti dagli altri worker del server web
+            if hasattr(socket_module, "AF_UNIX"):
+                webhook_receiver.listen(WEBHOOK_FORWARD_SOCKET)
+        else:
+            webhook_receiver.register(WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH)
         return True
     except Exception as e:
-        logger.error(f"Error starting Telegram bot: {e}")
+        logger.error(f"Errore nell'avvio della modalità webhook: {e}")
         return False
 
+# Endpoint che riceve gli update di Telegram in modalità webhook
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Valida, accoda e conferma subito un update inviato da Telegram"""
+    if BOT_MODE != "webhook":
+        return jsonify({"error": "webhook non attivo"}), 404
+    if not verify_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token'), WEBHOOK_SECRET):
+        logger.warning("Richiesta webhook con token segreto non valido")
+        return jsonify({"error": "forbidden"}), 403
+    payload = request.get_data(as_text=True)
+    if webhook_receiver is not None:
+        if not webhook_receiver.submit(payload):
+            logger.warning("Coda degli update piena, Telegram ritenterà la consegna")
+            return jsonify({"error": "busy"}), 503
+        return '', 200
+    # Il bot gira nel worker leader: l'update gli viene inoltrato, e se l'inoltro non riesce
+    # si risponde con un errore perché Telegram consegni di nuovo l'update
+    if leader.is_leader or not forward_update(WEBHOOK_FORWARD_SOCKET, payload):
+        logger.warning("Update non inoltrato al worker leader, Telegram ritenterà la consegna")
+        return jsonify({"error": "leader non disponibile"}), 503
+    return '', 200
+
+@app.route('/bot-stats')
+def bot_stats():
+    """Stato del processo del bot: riavvii, ultimo codice di uscita e uptime"""
+    status = get_status()
+    return jsonify({"mode": BOT_MODE, "leader_pid": status["leader_pid"], **status["supervisor"]})
+
+@app.route('/webhook-stats')
+def webhook_stats():
+    """Contatori degli update ricevuti via webhook"""
+    status = get_status()
+    return jsonify({"mode": BOT_MODE, "leader_pid": status["leader_pid"], **(status["webhook"] or {})})
+
 def stop_bot():
     """Stop the bot process if it's running."""
-    global bot_process
-    if bot_process and bot_process.poll() is None:
-        logger.info(f"Stopping Telegram bot process (PID {bot_process.pid})...")
-        try:
-            os.kill(bot_process.pid, signal.SIGTERM)
-            bot_process.wait(timeout=5)  # Wait up to 5 seconds for process to terminate
-            logger.info("Telegram bot process stopped")
-        except subprocess.TimeoutExpired:
-            logger.warning("Telegram bot process did not terminate gracefully, forcing...")
-            os.kill(bot_process.pid, signal.SIGKILL)
-        except Exception as e:
-            logger.error(f"Error stopping Telegram bot: {e}")
-
-    bot_process = None
+    bot_supervisor.stop()
 
 # Health check e riavvio automatico del bot
 def check_bot_health():
     """Controlla lo stato del bot e lo riavvia se necessario."""
-    global bot_process
+    # Il bot è gestito solo dal leader
+    if not leader.is_leader:
+        status = shared_status.read()
+        return bool(status and status["bot_running"])
+
+    # In modalità webhook non c'è un processo da controllare
+    if BOT_MODE == "webhook":
+        if webhook_receiver is None:
+            logger.warning("Webhook non attivo, nuovo tentativo di impostazione...")
+            start_webhook_mode()
+            return False
+        return True
 
-    # Se il processo non esiste o è terminato, riavvialo
-    if bot_process is None or bot_process.poll() is not None:
+    # Dopo un crash il supervisore riavvia il bot al termine dell'attesa: avviarlo qui la salterebbe
+    if bot_supervisor.is_restart_pending():
+        logger.info("Bot in attesa di riavvio da parte del supervisore")
+        return False
+
+    # Se il processo non esiste o è terminato, riavvialo (i crash sono già gestiti dal supervisore,
+    # questo controllo copre il caso in cui il bot sia stato fermato o non sia mai partito)
+    if not bot_supervisor.is_running():
         logger.warning("Bot non in esecuzione, riavvio automatico...")
-        stop_bot()  # Per sicurezza, fermalo in ogni caso
         start_bot()
         return False
     return True
@@ -366,9 +455,20 @@ def ping():
     is_running = check_bot_health()
 
     # Restituisci lo stato del bot
-    status = "up" if is_running else "restarted"
+    if is_running:
+        status = "up"
+    elif get_status()["supervisor"].get("restart_pending"):
+        status = "restarting"
+    else:
+        status = "restarted"
     return jsonify({"status": status, "timestamp": str(datetime.datetime.now())})
 
+# Metriche del pool di connessioni verso OpenAI di questo processo
+@app.route('/openai-pool-stats')
+def openai_pool_stats():
+    """Restituisce le metriche del client OpenAI condiviso"""
+    return jsonify(get_pool_stats())
+
 @app.route('/keep-alive-info')
 def keep_alive_info():
     """Pagina informativa sul sistema di keep-alive"""
@@ -469,22 +569,65 @@ def start_health_checker():
     health_thread.start()
     logger.info("Thread di controllo salute del bot avviato")
 
+# Controllo periodico dell'API OpenAI, letto dalla dashboard
+health_prober = OpenAIHealthProber(
+    interval=OPENAI_HEALTH_INTERVAL,
+    probe=OPENAI_HEALTH_PROBE,
+    model=OPENAI_MODEL,
+    timeout=OPENAI_HEALTH_TIMEOUT
+)
+
 # Importa e inizializza il sistema di keep-alive
 from keep_alive import init_keep_alive
 
-# Start the Telegram bot when Flask app starts
-start_bot()
+def start_status_publisher():
+    """Avvia il thread con cui il leader pubblica il suo stato ed esegue i riavvii chiesti dagli altri worker"""
+    def publish_loop():
+        while True:
+            try:
+                if shared_status.consume_restart_request():
+                    logger.info("Riavvio del bot richiesto da un altro worker")
+                    if BOT_MODE == "webhook":
+                        start_webhook_mode()
+                    else:
+                        bot_supervisor.restart()
+                shared_status.write(collect_status())
+            except Exception as e:
+                logger.error(f"Errore nella pubblicazione dello stato del leader: {e}")
+            time.sleep(LEADER_STATUS_INTERVAL)
+
+    threading.Thread(target=publish_loop, name="leader-status", daemon=True).start()
+
+def start_leader_services():
+    """Servizi eseguiti una sola volta per host, nel worker leader"""
+    global keep_alive
+
+    # Start the Telegram bot when Flask app starts
+    if BOT_MODE == "webhook":
+        start_webhook_mode()
+    else:
+        start_bot()
+
+    # Avvia il thread di controllo salute del bot
+    start_health_checker()
+
+    # Avvia il controllo periodico dell'API OpenAI
+    health_prober.start()
+
+    # Inizializza il sistema di keep-alive (ping ogni 5 minuti)
+    keep_alive = init_keep_alive(interval=300)
 
-# Avvia il thread di controllo salute del bot
-start_health_checker()
+    # Stato condiviso con gli altri worker
+    start_status_publisher()
 
-# Inizializza il sistema di keep-alive (ping ogni 5 minuti)
-keep_alive = init_keep_alive(interval=300)
+keep_alive = None
+leader.start(on_elected=start_leader_services)
 
 # Register cleanup function to stop the bot when the app exits
 def cleanup():
     logger.info("Shutting down application...")
-    stop_bot()
+    if leader.is_leader:
+        stop_bot()
     # Il keep-alive è un daemon thread, si fermerà automaticamente
 
 atexit.register(cleanup)
@@ -682,23 +825,39 @@ def admin_chats():
 
 @app.route('/admin/chat/<int:user_id>')
 def admin_view_chat(user_id):
-    """Visualizza la chat di un utente specifico"""
+    """Visualizza la chat di un utente specifico, una pagina alla volta"""
     # Verifica che l'utente sia autenticato
     if not session.get('admin_authenticated'):
         return redirect('/admin')
 
-    # Ottieni la chat dell'utente
-    chats = chat_logger.get_user_chats(user_id)
-    user_chat = chats.get(user_id, [])
+    # Parametri di paginazione: ?offset=N&limit=M&order=desc|asc (di default i più recenti per primi)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', ADMIN_CHAT_PAGE_SIZE, type=int), 1), 500)
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    newest_first = order == 'desc'
 
-    # Se la chat esiste, prendi il nome utente dal primo messaggio
+    # Legge solo la finestra richiesta e il conteggio, non l'intera cronologia
+    total_messages = chat_logger.count_user_messages(user_id)
+    user_chat = chat_logger.get_user_chat_page(user_id, offset=offset, limit=limit, newest_first=newest_first)
+
+    # Se la chat esiste, prendi il nome utente dal primo messaggio della pagina
     username = "Utente sconosciuto"
     first_name = "Utente"
     if user_chat and user_chat[0].get('username'):
         username = user_chat[0].get('username', 'Nessun username')
         first_name = user_chat[0].get('first_name', 'Nessun nome')
 
-    html_content = f"""
+    # Link alle pagine adiacenti
+    base_url = f"/admin/chat/{user_id}?limit={limit}&order={order}"
+    previous_link = f'<a href="{base_url}&offset={max(offset - limit, 0)}" class="btn btn-sm btn-outline-secondary">Pagina precedente</a>' if offset > 0 else ""
+    next_link = f'<a href="{base_url}&offset={offset + limit}" class="btn btn-sm btn-outline-secondary ms-2">Pagina successiva</a>' if offset + limit < total_messages else ""
+    order_label = "Dal più vecchio" if newest_first else "Dal più recente"
+    order_link = f'<a href="/admin/chat/{user_id}?limit={limit}&order={"asc" if newest_first else "desc"}" class="btn btn-sm btn-outline-info ms-2">{order_label}</a>'
+    first_shown = offset + 1 if user_chat else 0
+    last_shown = offset + len(user_chat)
+
+    def generate():
+        yield f"""
     <!DOCTYPE html>
     <html lang="it" data-bs-theme="dark">
     <head>
@@ -746,30 +905,31 @@ def admin_view_chat(user_id):
                             <a href="/admin/logout" class="btn btn-outline-danger ms-2">Logout</a>
                         </div>
                     </div>
-                    <p class="text-muted">ID Utente: {user_id} - Totale messaggi: {len(user_chat)}</p>
+                    <p class="text-muted">ID Utente: {user_id} - Totale messaggi: {total_messages} - Visualizzati: {first_shown}-{last_shown}</p>
                 </div>
             </div>
             
             <div class="row">
                 <div class="col">
                     <div class="card">
-                        <div class="card-header">
+                        <div class="card-header d-flex justify-content-between align-items-center">
                             <h4 class="mb-0">Cronologia Messaggi</h4>
+                            <div>{order_link}</div>
                         </div>
                         <div class="card-body message-container">
     """
 
-    if user_chat:
-        html_content += """
+        if user_chat:
+            yield """
                             <div class="d-flex flex-column">
         """
 
-        for message in user_chat:
-            timestamp = message.get('timestamp', '').replace('T', ' ').split('.')[0]  # Formatta la data
-            user_message = message.get('user_message', '')
-            bot_response = message.get('bot_response', '')
+            for message in user_chat:
+                timestamp = message.get('timestamp', '').replace('T', ' ').split('.')[0]  # Formatta la data
+                user_message = message.get('user_message', '')
+                bot_response = message.get('bot_response', '')
 
-            html_content += f"""
+                yield f"""
                                 <div class="user-message align-self-end">
                                     <div>{user_message}</div>
                                     <div class="timestamp">{timestamp}</div>
@@ -780,26 +940,18 @@ def admin_view_chat(user_id):
                                 </div>
             """
 
-        html_content += """
+            yield """
                             </div>
         """
-    else:
-        html_content += """
+        else:
+            yield """
                             <div class="alert alert-info">
                                 <p class="mb-0">Nessun messaggio trovato per questo utente.</p>
                             </div>
         """
 
-    html_content += """
-                        </div>
-                        <div class="card-footer text-center">
-                            <small>Fine della conversazione</small>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
+        # Con l'ordine cronologico la pagina parte dal fondo, come una chat
+        scroll_script = """
         <script>
             // Scroll to bottom of messages on load
             document.addEventListener('DOMContentLoaded', function() {
@@ -807,13 +959,25 @@ def admin_view_chat(user_id):
                 messageContainer.scrollTop = messageContainer.scrollHeight;
             });
         </script>
+        """ if not newest_first else ""
+
+        yield f"""
+                        </div>
+                        <div class="card-footer text-center">
+                            {previous_link}{next_link}
+                            {"" if previous_link or next_link else "<small>Fine della conversazione</small>"}
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+        {scroll_script}
     </body>
     </html>
     """
 
-    response = make_response(html_content)
-    response.headers['Content-Type'] = 'text/html'
-    return response
+    # La risposta viene inviata a blocchi man mano che i messaggi vengono formattati
+    return Response(stream_with_context(generate()), mimetype='text/html')
 
 @app.route('/admin/logout')
 def admin_logout():
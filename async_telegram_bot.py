@@ -0,0 +1,264 @@
+"""
+Runtime asincrono del bot basato su python-telegram-bot e sul client OpenAI asincrono.
+
+A differenza del runtime telebot, gli update vengono elaborati in parallelo in un
+unico event loop: una risposta lenta di OpenAI non blocca le altre chat.
+`OrderedUpdateProcessor` limita le richieste in corso (ASYNC_MAX_IN_FLIGHT) e,
+a seconda di ASYNC_UPDATE_ORDERING, garantisce che gli update della stessa chat
+(o dello stesso utente) vengano elaborati nell'ordine di arrivo.
+
+Si attiva con BOT_RUNTIME=async.
+"""
+import asyncio
+import logging
+from telegram import Update
+from telegram.constants import ChatAction
+from telegram.ext import (ApplicationBuilder, BaseUpdateProcessor, ContextTypes, MessageHandler,
+                          filters)
+from config import (TELEGRAM_TOKEN, ASYNC_MAX_IN_FLIGHT, ASYNC_MAX_PENDING_UPDATES,
+                    ASYNC_UPDATE_ORDERING, IMAGE_TARGET_SIZE, IMAGE_MAX_DOWNLOAD_BYTES,
+                    IMAGE_SPOOL_MAX_MEMORY, IMAGE_JPEG_QUALITY, IMAGE_DOWNLOAD_TIMEOUT)
+from openai_handler import OpenAIHandler, IMAGE_ERROR_RESPONSE
+from chat_logger import chat_logger
+from message_router import MessageRouter, parse_message
+from image_pipeline import fetch_photo_base64
+from rate_limiter import PRIORITY_PRIVATE, PRIORITY_GROUP
+from bot_messages import (build_welcome_message, build_help_message, build_debug_message,
+                          get_fallback_response, is_owner, EMPTY_TRIGGER_RESPONSE,
+                          DEBUG_FORBIDDEN_RESPONSE)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Initialize the OpenAI handler
+openai_handler = OpenAIHandler()
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor con ordinamento per chiave e limite globale di richieste in corso.
+
+    Il semaforo della classe base limita gli update accettati (in attesa o in
+    elaborazione); il lock per chiave viene acquisito prima del semaforo interno,
+    così gli update in coda dietro una chat lenta non occupano posti "in volo".
+    """
+
+    def __init__(self, max_in_flight=ASYNC_MAX_IN_FLIGHT, max_pending=ASYNC_MAX_PENDING_UPDATES,
+                 ordering=ASYNC_UPDATE_ORDERING):
+        """
+        Args:
+            max_in_flight: numero massimo di update elaborati contemporaneamente
+            max_pending: numero massimo di update accettati, in attesa compresi
+            ordering: "chat", "user" o "none"
+        """
+        super().__init__(max(max_pending, max_in_flight))
+        if ordering not in ("chat", "user", "none"):
+            logger.warning(f"Ordinamento update sconosciuto '{ordering}', utilizzo 'chat'")
+            ordering = "chat"
+        self.ordering = ordering
+        self.max_in_flight = max_in_flight
+        self._in_flight = None
+        self._locks = {}  # chiave -> [lock, numero di update che lo usano]
+
+    def _ordering_key(self, update):
+        """Chiave di serializzazione dell'update, None se non serve ordinamento"""
+        if not isinstance(update, Update) or self.ordering == "none":
+            return None
+        if self.ordering == "user":
+            return update.effective_user.id if update.effective_user else None
+        return update.effective_chat.id if update.effective_chat else None
+
+    async def initialize(self):
+        # Il semaforo va creato dentro l'event loop che lo userà
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def shutdown(self):
+        self._locks.clear()
+
+    async def do_process_update(self, update, coroutine):
+        key = self._ordering_key(update)
+        if key is None:
+            async with self._in_flight:
+                await coroutine
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._in_flight:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # Nessun altro update in attesa per questa chiave: libera il lock
+                self._locks.pop(key, None)
+
+
+# Tabella dei comandi condivisa da tutti gli update
+router = MessageRouter()
+
+
+async def route_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Entry point of every message: parse it once and dispatch it through the router."""
+    # Lo username del bot è già in cache dall'inizializzazione dell'applicazione
+    routed = parse_message(update.effective_message, context.bot.username)
+    if routed is None:
+        return
+    handler = router.resolve(routed)
+    if handler is not None:
+        await handler(routed, context)
+
+
+@router.command('start')
+async def start_command(routed, context: ContextTypes.DEFAULT_TYPE):
+    """Send a message when the command /start is issued."""
+    logger.info(f"Comando /start ricevuto da {routed.user_id} in {routed.chat_type}")
+    welcome_message = build_welcome_message(routed.first_name, routed.is_group)
+    await routed.message.reply_text(welcome_message)
+
+
+@router.command('help')
+async def help_command(routed, context: ContextTypes.DEFAULT_TYPE):
+    """Send a message when the command /help is issued."""
+    logger.info(f"Comando /help ricevuto da {routed.user_id} in {routed.chat_type}")
+    help_message = build_help_message(routed.is_group, context.bot.username)
+    await routed.message.reply_text(help_message)
+
+
+@router.command('reset')
+async def reset_command(routed, context: ContextTypes.DEFAULT_TYPE):
+    """Reset the conversation history for a user."""
+    logger.info(f"Comando /reset ricevuto da {routed.user_id} in {routed.chat_type}")
+    response = openai_handler.reset_conversation(routed.user_id)
+    await routed.message.reply_text(response)
+
+
+@router.command('debug')
+async def debug_command(routed, context: ContextTypes.DEFAULT_TYPE):
+    """Comando per debugging del bot - riservato agli sviluppatori"""
+    logger.info(f"Comando /debug ricevuto da {routed.username} (ID: {routed.user_id})")
+
+    # Solo il proprietario del bot può usare questo comando
+    if not is_owner(routed.user_id, routed.username):
+        logger.info(f"Tentativo di accesso al comando debug da utente non autorizzato: {routed.username}")
+        await routed.message.reply_text(DEBUG_FORBIDDEN_RESPONSE)
+        return
+
+    debug_message = build_debug_message(
+        context.bot.username, routed.chat_id, routed.chat_type, routed.user_id, routed.username
+    )
+    await routed.message.reply_text(debug_message, parse_mode="Markdown")
+
+
+@router.photo
+async def handle_photo(routed, context: ContextTypes.DEFAULT_TYPE):
+    """Download the photo at the smallest adequate resolution, analyze it, reply and log it."""
+    await context.bot.send_chat_action(routed.chat_id, ChatAction.TYPING)
+
+    loop = asyncio.get_running_loop()
+
+    def get_file_url(file_id):
+        # getFile è una coroutine del bot: dal thread di lavoro va eseguita nell'event loop
+        future = asyncio.run_coroutine_threadsafe(context.bot.get_file(file_id), loop)
+        return future.result(timeout=IMAGE_DOWNLOAD_TIMEOUT).file_path
+
+    def analyze_photo():
+        encoded_image = fetch_photo_base64(
+            routed.message.photo,
+            get_file_url,
+            target_size=IMAGE_TARGET_SIZE,
+            max_bytes=IMAGE_MAX_DOWNLOAD_BYTES,
+            spool_size=IMAGE_SPOOL_MAX_MEMORY,
+            quality=IMAGE_JPEG_QUALITY,
+            timeout=IMAGE_DOWNLOAD_TIMEOUT
+        )
+        priority = PRIORITY_GROUP if routed.is_group else PRIORITY_PRIVATE
+        return openai_handler.analyze_image(routed.user_id, encoded_image, routed.text, priority)
+
+    try:
+        # Download, ricodifica e chiamata a OpenAI sono bloccanti: fuori dall'event loop
+        response = await asyncio.to_thread(analyze_photo)
+    except Exception as e:
+        logger.error(f"Errore nella preparazione della foto: {e}")
+        response = IMAGE_ERROR_RESPONSE
+
+    await routed.message.reply_text(response)
+
+    await asyncio.to_thread(
+        chat_logger.log_message,
+        user_id=routed.user_id,
+        user_message=f"[Immagine] {routed.text}" if routed.text else "[Immagine]",
+        bot_response=response,
+        username=routed.username,
+        first_name=routed.first_name
+    )
+
+
+@router.default
+async def handle_message(routed, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle incoming messages and generate responses.
+    In group chats, only messages starting with 'toniai' get here, without the prefix.
+    In private chats, respond to all messages.
+    """
+    message = routed.message
+    user_id = routed.user_id
+    message_text = routed.text
+
+    if not message_text:
+        # Nei gruppi: il messaggio contiene solo "toniai"; chiedi come posso aiutare
+        await message.reply_text(EMPTY_TRIGGER_RESPONSE)
+        return
+
+    # Send typing action to indicate the bot is processing
+    await context.bot.send_chat_action(routed.chat_id, ChatAction.TYPING)
+
+    logger.info(f"Elaborazione messaggio da utente {user_id}: {message_text}")
+
+    try:
+        # Nel rate limiter le chat private passano prima del traffico dei gruppi
+        priority = PRIORITY_GROUP if routed.is_group else PRIORITY_PRIVATE
+        response = await openai_handler.generate_response_async(user_id, message_text, priority)
+    except Exception as e:
+        logger.error(f"Error generating response: {e}")
+        # Use fallback response system when OpenAI is not available
+        response = get_fallback_response(message_text)
+
+    await message.reply_text(response)
+
+    # La scrittura su disco non deve bloccare l'event loop
+    await asyncio.to_thread(
+        chat_logger.log_message,
+        user_id=user_id,
+        user_message=message_text,
+        bot_response=response,
+        username=routed.username,
+        first_name=routed.first_name
+    )
+
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """Log degli errori non gestiti dagli handler"""
+    logger.error(f"Errore durante l'elaborazione di un update: {context.error}")
+
+
+def run_async_bot():
+    """Run the bot on the asyncio runtime."""
+    logger.info("Starting Telegram bot (async runtime)...")
+
+    application = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(OrderedUpdateProcessor())
+        .build()
+    )
+
+    # Comandi e messaggi passano tutti dal router (filters.TEXT include anche i comandi)
+    application.add_handler(MessageHandler(filters.TEXT | filters.PHOTO, route_message))
+    application.add_error_handler(error_handler)
+
+    # run_polling gestisce initialize/start/stop e i segnali di terminazione
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+    logger.info("Bot polling stopped")
@@ -0,0 +1,65 @@
+"""
+Identità del bot (id e username) in cache.
+
+Il runtime telebot chiedeva `bot.get_me()` a Telegram a ogni /help e /debug.
+L'identità viene ora letta una sola volta all'avvio e riletta solo dopo
+`refresh_interval` secondi; se Telegram non risponde resta in uso l'ultimo
+valore noto e il tentativo successivo viene rimandato di `retry_interval`
+secondi, così un errore non aggiunge una chiamata di rete a ogni messaggio.
+"""
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BotIdentity:
+    """Cache aggiornabile del risultato di getMe"""
+
+    def __init__(self, fetch, refresh_interval=6 * 3600, retry_interval=60):
+        """
+        Args:
+            fetch: funzione senza argomenti che restituisce l'utente del bot (es. bot.get_me)
+            refresh_interval: secondi dopo i quali l'identità viene riletta
+            retry_interval: secondi di attesa dopo una lettura fallita
+        """
+        self.fetch = fetch
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._me = None
+        self._next_fetch = 0.0
+
+    def refresh(self):
+        """Rilegge subito l'identità da Telegram; restituisce l'ultimo valore noto"""
+        with self._lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self):
+        try:
+            self._me = self.fetch()
+            self._next_fetch = time.monotonic() + self.refresh_interval
+        except Exception as e:
+            logger.error(f"Impossibile ottenere l'identità del bot: {e}")
+            self._next_fetch = time.monotonic() + self.retry_interval
+        return self._me
+
+    def get(self):
+        """Identità del bot, riletta solo se scaduta (None se non è mai stato possibile leggerla)"""
+        if self._me is not None and time.monotonic() < self._next_fetch:
+            return self._me
+        with self._lock:
+            if time.monotonic() >= self._next_fetch:
+                self._refresh_locked()
+            return self._me
+
+    @property
+    def username(self):
+        me = self.get()
+        return me.username if me is not None else None
+
+    @property
+    def id(self):
+        me = self.get()
+        return me.id if me is not None else None
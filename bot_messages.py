@@ -0,0 +1,153 @@
+"""
+Testi delle risposte del bot, condivisi tra il runtime telebot e quello asincrono.
+"""
+import datetime
+import functools
+from config import BOT_OWNER, OPENAI_MODEL, FALLBACK_RESPONSES_PATH, FALLBACK_RELOAD_INTERVAL
+from fallback_responder import FallbackResponder
+
+# Prefisso che attiva il bot nelle chat di gruppo
+GROUP_TRIGGER = "toniai"
+
+# Tipi di chat Telegram considerati gruppi
+GROUP_CHAT_TYPES = ('group', 'supergroup')
+
+# Risposta quando nei gruppi il messaggio contiene solo il prefisso
+EMPTY_TRIGGER_RESPONSE = "Ciao! Sono qui per aiutarti. Cosa vorresti sapere?"
+
+# Risposta quando la coda dei messaggi è piena
+BUSY_RESPONSE = "Sto ricevendo troppi messaggi in questo momento. Riprova tra qualche istante."
+
+# Risposta di riserva quando OpenAI non è disponibile e nessuna frase nota corrisponde
+FALLBACK_DEFAULT_RESPONSE = (
+    "Mi dispiace, al momento non posso generare risposte personalizzate a causa di limitazioni tecniche. "
+    "Prova a usare /help per vedere i comandi disponibili o riprova più tardi."
+)
+
+# Frasi riconosciute quando OpenAI non è disponibile, ricaricate quando il file cambia
+fallback_responder = FallbackResponder(FALLBACK_RESPONSES_PATH, FALLBACK_DEFAULT_RESPONSE,
+                                       reload_interval=FALLBACK_RELOAD_INTERVAL)
+
+# Risposta al comando /debug per chi non è il proprietario
+DEBUG_FORBIDDEN_RESPONSE = "Comando riservato allo sviluppatore del bot."
+
+# Proprietario del bot, per l'accesso al comando /debug
+OWNER_USER_ID = "713164389"
+OWNER_USERNAME = "ityttmom"
+
+
+def is_group_chat(chat_type):
+    """Indica se il tipo di chat è un gruppo"""
+    return chat_type in GROUP_CHAT_TYPES
+
+
+def is_owner(user_id, username):
+    """Controlla sia per ID che per username se l'utente è il proprietario del bot"""
+    return str(user_id) == OWNER_USER_ID or username == OWNER_USERNAME
+
+
+def _welcome_body(is_group):
+    """Parte del messaggio di benvenuto che non dipende dall'utente"""
+    welcome_message = (
+        f"Sono un bot alimentato da intelligenza artificiale utilizzando il modello {OPENAI_MODEL} di OpenAI.\n\n"
+        f"Sono stato creato da {BOT_OWNER} su Telegram.\n\n"
+    )
+
+    # Aggiungi istruzioni specifiche in base al tipo di chat
+    if is_group:
+        welcome_message += (
+            "In questa chat di gruppo risponderò solo ai messaggi che iniziano con 'toniai'.\n\n"
+            "Esempi:\n"
+            "toniai raccontami una storia\n"
+            "toniai qual è la capitale dell'Italia?\n\n"
+            "Puoi anche usare:\n"
+            "toniai /reset - Per cancellare la cronologia della conversazione\n"
+            "toniai /help - Per vedere questa guida e altre informazioni"
+        )
+    else:
+        welcome_message += (
+            "Puoi chiedermi qualsiasi cosa e cercherò di aiutarti nel migliore dei modi.\n\n"
+            "Usa /reset per cancellare la cronologia della conversazione e iniziare una nuova chat.\n"
+            "Usa /help per vedere l'elenco dei comandi disponibili e informazioni sull'uso nei gruppi."
+        )
+
+    return welcome_message
+
+
+# Testi di benvenuto precalcolati per tipo di chat (gruppo / privata)
+WELCOME_BODIES = {True: _welcome_body(True), False: _welcome_body(False)}
+
+
+def build_welcome_message(user_first_name, is_group):
+    """Messaggio di benvenuto per il comando /start"""
+    return f"Ciao {user_first_name}! 👋\n\n" + WELCOME_BODIES[bool(is_group)]
+
+
+@functools.lru_cache(maxsize=8)
+def build_help_message(is_group, bot_username):
+    """Messaggio di aiuto per il comando /help (calcolato una volta per tipo di chat e username)"""
+    if is_group:
+        return (
+            "Ecco come utilizzarmi in questa chat di gruppo:\n\n"
+            "Inizia sempre il tuo messaggio con 'toniai' per farmi rispondere.\n\n"
+            "Comandi disponibili:\n"
+            "toniai /start - Mostra messaggio di benvenuto\n"
+            "toniai /help - Mostra questa lista di comandi\n"
+            "toniai /reset - Cancella la cronologia della conversazione\n\n"
+            "Puoi anche usare: /comando@" + (bot_username or "nome_bot") + "\n\n"
+            "Esempio: toniai raccontami una storia\n\n"
+            f"Questo bot utilizza il modello AI: {OPENAI_MODEL}\n"
+            f"Sviluppato da {BOT_OWNER} su Telegram."
+        )
+
+    return (
+        "Ecco i comandi disponibili:\n\n"
+        "/start - Inizia una conversazione con il bot\n"
+        "/help - Mostra questa lista di comandi\n"
+        "/reset - Cancella la cronologia della conversazione\n\n"
+        "Puoi semplicemente scrivermi un messaggio e io risponderò!\n\n"
+        "Nei gruppi, inizia sempre i messaggi con 'toniai' per farmi rispondere.\n\n"
+        f"Questo bot utilizza il modello AI: {OPENAI_MODEL}\n"
+        f"Sviluppato da {BOT_OWNER} su Telegram."
+    )
+
+
+def build_debug_message(bot_username, chat_id, chat_type, user_id, username):
+    """Messaggio Markdown con le informazioni di debug del bot"""
+    return f"""
+🔍 *Informazioni di Debug del Bot*
+
+👤 *Bot Username:* @{bot_username}
+⚙️ *Versione:* 1.0.2 (Debug patch 4)
+🕒 *Ultimo riavvio:* {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+🤖 *Modello AI:* {OPENAI_MODEL}
+
+*Stati interni:*
+- Chat ID attuale: `{chat_id}`
+- Tipo di chat: `{chat_type}`
+- User ID: `{user_id}`
+- Username: `{username}`
+
+*Formato comandi nei gruppi:*
+Per usare comandi in gruppo puoi usare:
+1. `toniai /comando`
+2. `/comando@{bot_username}`
+
+*Esempio funzionamento in gruppi:*
+• `toniai ciao` → risponde al messaggio
+• `toniai` → chiede cosa può fare
+• `toniai /reset` → cancella la conversazione
+• `/reset@{bot_username}` → cancella la conversazione
+• Messaggio senza "toniai" → viene ignorato
+
+*Log estesi:* Attivati
+*Supporto menzioni:* Attivato
+*Diagnostica gruppi:* Attivata
+
+*Per assistenza contatta {BOT_OWNER}*
+"""
+
+
+def get_fallback_response(message_text):
+    """Provide basic responses for common queries when OpenAI is not available"""
+    return fallback_responder.respond(message_text)
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
+import os
+import sys
+import time
+import signal
 import logging
-from telegram_bot import run_bot
-from config import TELEGRAM_TOKEN
+import threading
+from config import (TELEGRAM_TOKEN, BOT_RUNTIME, BOT_MODE, BOT_LOCK_PATH, BOT_PARENT_CHECK_INTERVAL,
+                    LEADER_RETRY_INTERVAL)
+from leader_election import LeaderElection
+from bot_supervisor import SUPERVISOR_PID_ENV
 
 # Configure logging
 logging.basicConfig(
@@ -10,10 +17,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def watch_supervisor(supervisor_pid, interval):
+    """Termina il processo (SIGTERM) quando il supervisore che lo ha avviato non è più il padre"""
+    def check_loop():
+        while True:
+            time.sleep(interval)
+            # Se il padre muore il processo viene adottato da un altro (init o un subreaper)
+            if os.getppid() != supervisor_pid:
+                logger.warning(f"Supervisore {supervisor_pid} terminato, arresto del bot")
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+    threading.Thread(target=check_loop, name="supervisor-watch", daemon=True).start()
+
+
+def acquire_bot_lock():
+    """Attende il lock del bot: un altro processo di polling sullo stesso host deve terminare prima"""
+    bot_lock = LeaderElection(BOT_LOCK_PATH)
+    while not bot_lock.try_acquire():
+        logger.warning(f"Un altro processo del bot è attivo ({BOT_LOCK_PATH}), "
+                       f"nuovo tentativo tra {LEADER_RETRY_INTERVAL:g}s")
+        time.sleep(LEADER_RETRY_INTERVAL)
+    return bot_lock
+
+
 if __name__ == '__main__':
+    # SIGTERM (stop/restart from app.py) exits normally, so atexit handlers such as the
+    # conversation store flush still run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if BOT_MODE == "webhook":
+        # Gli update arrivano al server Flask: un processo in polling rimuoverebbe il webhook
+        logger.error("BOT_MODE=webhook: il bot viene eseguito da app.py, bot_runner.py non serve")
+        sys.exit(1)
+
+    supervisor_pid = os.environ.get(SUPERVISOR_PID_ENV)
+    if supervisor_pid:
+        watch_supervisor(int(supervisor_pid), BOT_PARENT_CHECK_INTERVAL)
+    # Il riferimento tiene aperto il descrittore, quindi il lock, fino alla fine del processo
+    bot_lock = acquire_bot_lock()
+
     try:
-        logger.info("Starting bot runner...")
-        run_bot()
+        logger.info(f"Starting bot runner (runtime: {BOT_RUNTIME})...")
+        if BOT_RUNTIME == "async":
+            from async_telegram_bot import run_async_bot
+            run_async_bot()
+        else:
+            from telegram_bot import run_bot
+            run_bot()
     except KeyboardInterrupt:
         logger.info("Bot stopped by keyboard interrupt")
     except Exception as e:
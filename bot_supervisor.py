@@ -0,0 +1,191 @@
+"""
+Supervisione del processo del bot (bot_runner.py) avviato dal server web.
+
+Per ogni processo avviato un thread resta bloccato in `wait()` finché il
+processo non termina, quindi nessun ciclo di polling occupa la CPU. Se il
+bot termina senza che sia stato chiesto, viene riavviato dopo un'attesa che
+raddoppia a ogni crash ravvicinato (da `min_backoff` fino a `max_backoff`
+secondi) e torna al minimo quando il processo era rimasto attivo almeno
+`stable_after` secondi.
+
+Il processo riceve il PID del supervisore nella variabile d'ambiente
+`SUPERVISOR_PID_ENV`: se il supervisore muore senza fermarlo (es. SIGKILL),
+bot_runner.py se ne accorge e termina, invece di restare in polling accanto
+al bot avviato dal nuovo leader.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import datetime
+import tempfile
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Variabile d'ambiente con il PID del processo che ha avviato il bot
+SUPERVISOR_PID_ENV = "TONIAI_SUPERVISOR_PID"
+
+
+class BotSupervisor:
+    """Avvia, arresta e riavvia automaticamente il processo del bot"""
+
+    def __init__(self, command=None, log_dir=None, min_backoff=1.0, max_backoff=300.0, stable_after=60.0):
+        """
+        Args:
+            command: comando del processo (default: bot_runner.py con l'interprete corrente)
+            log_dir: cartella dei file bot_stdout.log e bot_stderr.log (default: cartella temporanea)
+            min_backoff: secondi di attesa prima del primo riavvio dopo un crash
+            max_backoff: attesa massima tra due riavvii
+            stable_after: secondi di attività dopo i quali un processo è considerato stabile
+        """
+        self.command = command or [sys.executable, "bot_runner.py"]
+        self.log_dir = log_dir or tempfile.gettempdir()
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._process = None
+        self._generation = 0  # incrementata a ogni avvio, per ignorare i watcher di processi precedenti
+        self._started_at = None
+        self._backoff = min_backoff
+        self._restart_pending = False  # True durante l'attesa prima di un riavvio automatico
+        self.restarts = 0  # riavvii automatici dopo un crash
+        self.manual_restarts = 0
+        self.last_exit_code = None
+        self.last_exit_at = None
+
+    def _open_log(self, name):
+        """Apre un file di log del bot, conservando quello dell'esecuzione precedente come .1"""
+        path = os.path.join(self.log_dir, name)
+        if os.path.exists(path):
+            os.replace(path, path + ".1")
+        return open(path, 'w')
+
+    def _spawn(self):
+        """Avvia il processo; va chiamato con il lock acquisito"""
+        stdout_log = self._open_log('bot_stdout.log')
+        stderr_log = self._open_log('bot_stderr.log')
+        try:
+            env = dict(os.environ, **{SUPERVISOR_PID_ENV: str(os.getpid())})
+            process = subprocess.Popen(self.command, stdout=stdout_log, stderr=stderr_log, text=True, env=env)
+        finally:
+            # Il processo figlio ha i suoi descrittori: quelli del padre si possono chiudere
+            stdout_log.close()
+            stderr_log.close()
+
+        self._process = process
+        self._generation += 1
+        self._started_at = time.monotonic()
+        threading.Thread(target=self._watch, args=(process, self._generation),
+                         name=f"bot-watch-{process.pid}", daemon=True).start()
+        logger.info(f"Telegram bot started with PID {process.pid}")
+
+    def start(self):
+        """Avvia il bot se non è già in esecuzione; restituisce True se è attivo o in riavvio"""
+        with self._lock:
+            self._stopping.clear()
+            if self._process is not None and self._process.poll() is None:
+                return True
+            if self._restart_pending:
+                # Il riavvio è già programmato: avviare subito salterebbe l'attesa dopo il crash
+                return True
+            try:
+                logger.info("Starting Telegram bot process...")
+                self._spawn()
+                return True
+            except Exception as e:
+                logger.error(f"Error starting Telegram bot: {e}")
+                return False
+
+    def stop(self, timeout=5):
+        """Arresta il bot (SIGTERM, poi SIGKILL dopo `timeout` secondi) senza riavviarlo"""
+        with self._lock:
+            self._stopping.set()
+            self._restart_pending = False
+            process = self._process
+            self._process = None
+            if process is None or process.poll() is not None:
+                return
+            logger.info(f"Stopping Telegram bot process (PID {process.pid})...")
+            try:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=timeout)
+                logger.info("Telegram bot process stopped")
+            except subprocess.TimeoutExpired:
+                logger.warning("Telegram bot process did not terminate gracefully, forcing...")
+                process.kill()
+                process.wait()
+            except Exception as e:
+                logger.error(f"Error stopping Telegram bot: {e}")
+
+    def restart(self):
+        """Riavvio richiesto dall'utente: riparte subito e azzera l'attesa tra i riavvii"""
+        self.stop()
+        with self._lock:
+            self.manual_restarts += 1
+            self._backoff = self.min_backoff
+        return self.start()
+
+    def is_running(self):
+        with self._lock:
+            return self._process is not None and self._process.poll() is None
+
+    def is_restart_pending(self):
+        """Indica se il bot è in attesa di un riavvio automatico dopo un crash"""
+        with self._lock:
+            return self._restart_pending
+
+    def _watch(self, process, generation):
+        """Attende la fine del processo (bloccante) e lo riavvia se non è stato fermato di proposito"""
+        exit_code = process.wait()
+
+        with self._lock:
+            if generation != self._generation or self._stopping.is_set():
+                return
+            uptime = time.monotonic() - self._started_at
+            self.last_exit_code = exit_code
+            self.last_exit_at = datetime.datetime.now().isoformat(timespec="seconds")
+            self._process = None
+            # Un processo rimasto attivo a lungo non è un crash ripetuto: si riparte dall'attesa minima
+            if uptime >= self.stable_after:
+                self._backoff = self.min_backoff
+            delay = self._backoff
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            self._restart_pending = True
+
+        logger.warning(f"Bot process terminated with exit code {exit_code} after {uptime:.0f}s, "
+                       f"restarting in {delay:g}s")
+        # L'attesa si interrompe se nel frattempo viene chiesto l'arresto
+        if self._stopping.wait(delay):
+            return
+
+        with self._lock:
+            if generation != self._generation or self._stopping.is_set() or self._process is not None:
+                return
+            self._restart_pending = False
+            try:
+                self._spawn()
+                self.restarts += 1
+            except Exception as e:
+                logger.error(f"Error restarting Telegram bot: {e}")
+
+    def stats(self):
+        """Stato del processo, riavvii e uptime"""
+        with self._lock:
+            running = self._process is not None and self._process.poll() is None
+            return {
+                "running": running,
+                "restart_pending": self._restart_pending,
+                "pid": self._process.pid if running else None,
+                "uptime_seconds": round(time.monotonic() - self._started_at) if running else None,
+                "restarts": self.restarts,
+                "manual_restarts": self.manual_restarts,
+                "last_exit_code": self.last_exit_code,
+                "last_exit_at": self.last_exit_at,
+                "next_backoff_seconds": self._backoff
+            }
@@ -0,0 +1,198 @@
+"""
+Indice persistente dei riepiloghi utente per il backend delle chat su file.
+
+Per ogni utente viene salvato un piccolo record in chats/index/user_<id>.json con
+username, first_name, last_message_time, message_count e dimensione/mtime/inode del
+file chat a cui si riferisce. Il record viene aggiornato a ogni messaggio
+registrato; se manca o non corrisponde più al file chat (confronto di dimensione e
+mtime) viene ricostruito al volo, leggendo solo le righe aggiunte quando il file è
+lo stesso jsonl (stesso inode) cresciuto per append.
+
+In questo modo l'elenco utenti del pannello admin costa O(numero di utenti) e
+non O(messaggi totali).
+"""
+import os
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Campi del record esposti come riepilogo utente
+SUMMARY_FIELDS = ("user_id", "username", "first_name", "last_message_time", "message_count")
+
+
+class UserSummaryIndex:
+    """Record di riepilogo per utente, validati rispetto a dimensione e mtime del file chat."""
+
+    def __init__(self, index_dir: str):
+        """
+        Args:
+            index_dir: directory in cui salvare i record dell'indice
+        """
+        self.index_dir = index_dir
+        if not os.path.exists(self.index_dir):
+            os.makedirs(self.index_dir)
+            logger.info(f"Creata directory per l'indice delle chat: {self.index_dir}")
+
+    def _record_path(self, user_id: int) -> str:
+        return os.path.join(self.index_dir, f"user_{user_id}.json")
+
+    def load(self, user_id: int) -> Optional[Dict]:
+        """Legge il record di un utente, None se assente o illeggibile."""
+        try:
+            with open(self._record_path(user_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Record indice non valido per l'utente {user_id}: {e}")
+            return None
+
+    def save(self, record: Dict):
+        """Salva un record in modo atomico (file temporaneo + rename)."""
+        path = self._record_path(record["user_id"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, user_id: int):
+        """Rimuove il record di un utente, se presente."""
+        try:
+            os.remove(self._record_path(user_id))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def is_fresh(record: Optional[Dict], chat_file: str, stat: os.stat_result) -> bool:
+        """Indica se il record descrive esattamente lo stato attuale del file chat."""
+        return (record is not None
+                and record.get("source") == os.path.basename(chat_file)
+                and record.get("size") == stat.st_size
+                and record.get("mtime_ns") == stat.st_mtime_ns)
+
+    def record_append(self, user_id: int, chat_file: str, previous_stat: Optional[os.stat_result],
+                      message_data: Dict):
+        """
+        Aggiorna il record dopo l'append di un messaggio al file jsonl.
+
+        Se il record era allineato allo stato del file prima dell'append basta
+        incrementare il contatore; altrimenti il record viene ricostruito.
+        """
+        record = self.load(user_id)
+        stat = os.stat(chat_file)
+
+        if previous_stat is not None and self.is_fresh(record, chat_file, previous_stat):
+            record.update(
+                username=message_data.get("username"),
+                first_name=message_data.get("first_name"),
+                last_message_time=message_data.get("timestamp", ""),
+                message_count=record["message_count"] + 1,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                inode=stat.st_ino
+            )
+            self.save(record)
+        else:
+            self.rebuild(user_id, chat_file, stat)
+
+    def record_messages(self, user_id: int, chat_file: str, messages: List[Dict]):
+        """Aggiorna il record a partire dall'elenco completo dei messaggi già in memoria."""
+        stat = os.stat(chat_file)
+        record = self._empty_record(user_id, chat_file)
+        if messages:
+            self._apply_message(record, messages[-1])
+        record.update(message_count=len(messages), size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                      inode=stat.st_ino)
+        self.save(record)
+
+    def get_summary(self, user_id: int, chat_file: str, stat: os.stat_result) -> Optional[Dict]:
+        """Restituisce il riepilogo di un utente, ricostruendo il record se non è aggiornato."""
+        record = self.load(user_id)
+        if not self.is_fresh(record, chat_file, stat):
+            record = self.rebuild(user_id, chat_file, stat, previous=record)
+        if not record or not record.get("message_count"):
+            return None
+        return {field: record.get(field) for field in SUMMARY_FIELDS}
+
+    def rebuild(self, user_id: int, chat_file: str, stat: os.stat_result,
+                previous: Optional[Dict] = None) -> Dict:
+        """
+        Ricostruisce il record di un utente dal file chat.
+
+        Per un jsonl cresciuto rispetto al record precedente vengono lette solo le
+        righe nuove; negli altri casi il file viene riletto per intero. Un file
+        riscritto (es. da `--migrate`, che lo sostituisce con un rename) ha un inode
+        diverso: anche se è più grande del precedente non va letto a partire dal
+        vecchio offset, altrimenti i messaggi già contati verrebbero contati due volte.
+        """
+        if chat_file.endswith(".jsonl"):
+            if (previous is not None
+                    and previous.get("source") == os.path.basename(chat_file)
+                    and previous.get("inode") == stat.st_ino
+                    and 0 < previous.get("size", 0) <= stat.st_size):
+                record = dict(previous)
+                offset = previous["size"]
+            else:
+                record = self._empty_record(user_id, chat_file)
+                offset = 0
+            self._scan_jsonl(record, chat_file, offset)
+        else:
+            record = self._empty_record(user_id, chat_file)
+            with open(chat_file, 'r', encoding='utf-8') as f:
+                messages = json.load(f)
+            if messages:
+                self._apply_message(record, messages[-1])
+            record["message_count"] = len(messages)
+            record["size"] = stat.st_size
+
+        # La dimensione letta può precedere un eventuale append parziale: in quel caso il record
+        # resta "non aggiornato" e la riga verrà letta alla prossima ricostruzione incrementale
+        record["mtime_ns"] = stat.st_mtime_ns
+        record["inode"] = stat.st_ino
+        self.save(record)
+        return record
+
+    @staticmethod
+    def _empty_record(user_id: int, chat_file: str) -> Dict:
+        return {
+            "user_id": user_id,
+            "username": None,
+            "first_name": None,
+            "last_message_time": "",
+            "message_count": 0,
+            "source": os.path.basename(chat_file),
+            "size": 0,
+            "mtime_ns": 0,
+            "inode": None
+        }
+
+    @staticmethod
+    def _apply_message(record: Dict, message: Dict):
+        record["username"] = message.get("username", "")
+        record["first_name"] = message.get("first_name", "")
+        record["last_message_time"] = message.get("timestamp", "")
+
+    def _scan_jsonl(self, record: Dict, chat_file: str, offset: int):
+        """Legge le righe complete a partire da `offset` aggiornando contatore e ultimo messaggio."""
+        last_message = None
+        with open(chat_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Append ancora in corso: la riga verrà contata alla prossima lettura
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    last_message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.error(f"Riga non valida nel file {chat_file}, ignorata")
+                    continue
+                record["message_count"] += 1
+
+        if last_message is not None:
+            self._apply_message(record, last_message)
+        record["size"] = offset
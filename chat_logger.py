@@ -1,60 +1,55 @@
 """
 Modulo per la registrazione e gestione delle conversazioni degli utenti con il bot.
+
+L'archiviazione vera e propria è delegata a un backend di `chat_storage`
+(file jsonl/json oppure SQLite), scelto con CHAT_STORAGE_BACKEND.
+
+Migrazioni una tantum:
+- `python chat_logger.py --migrate`: converte le chat legacy (array JSON) in jsonl
+- `python chat_logger.py --import-sqlite`: copia tutte le chat su file nel database SQLite
+  (gli utenti già presenti nel database vengono saltati, quindi può essere rieseguito)
 """
-import os
-import json
+import sys
 import logging
 import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional
 from config import BOT_OWNER
+from chat_storage import ChatStorage, FileChatStorage, SQLiteChatStorage, create_chat_storage
 
 logger = logging.getLogger(__name__)
 
-# Directory per salvare i file delle conversazioni
-CHATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chats")
-
-# Assicurati che la directory esista
-if not os.path.exists(CHATS_DIR):
-    os.makedirs(CHATS_DIR)
-    logger.info(f"Creata directory per le chat: {CHATS_DIR}")
-
 
 class ChatLogger:
     """Classe per registrare e gestire le conversazioni degli utenti con il bot."""
 
-    def __init__(self):
-        """Inizializza il logger delle chat."""
-        self.ensure_chats_dir()
+    def __init__(self, storage: Optional[ChatStorage] = None):
+        """
+        Inizializza il logger delle chat.
 
-    @staticmethod
-    def ensure_chats_dir():
-        """Assicura che la directory per le chat esista."""
-        if not os.path.exists(CHATS_DIR):
-            os.makedirs(CHATS_DIR)
-            logger.info(f"Creata directory per le chat: {CHATS_DIR}")
+        Args:
+            storage: backend di archiviazione; se omesso viene creato quello configurato
+        """
+        self.storage = storage if storage is not None else create_chat_storage()
 
-    def log_message(self, user_id: int, user_message: str, bot_response: str, 
+    def log_message(self, user_id: int, user_message: str, bot_response: str,
                    username: Optional[str] = None, first_name: Optional[str] = None) -> bool:
         """
         Registra un messaggio dell'utente e la risposta del bot.
-        
+
         Args:
             user_id: ID dell'utente Telegram
             user_message: Messaggio inviato dall'utente
             bot_response: Risposta inviata dal bot
             username: Nome utente Telegram (opzionale)
             first_name: Nome dell'utente (opzionale)
-            
+
         Returns:
             bool: True se il messaggio è stato registrato correttamente, False altrimenti
         """
         try:
-            # Nome del file basato sull'ID utente
-            chat_file = os.path.join(CHATS_DIR, f"chat_{user_id}.json")
-            
             # Timestamp corrente
             timestamp = datetime.datetime.now().isoformat()
-            
+
             # Dati del messaggio
             message_data = {
                 "timestamp": timestamp,
@@ -64,103 +59,132 @@ class ChatLogger:
                 "user_message": user_message,
                 "bot_response": bot_response
             }
-            
-            # Carica i messaggi esistenti o crea un nuovo array
-            if os.path.exists(chat_file):
-                with open(chat_file, 'r', encoding='utf-8') as f:
-                    try:
-                        messages = json.load(f)
-                    except json.JSONDecodeError:
-                        logger.error(f"Errore nel decodificare il file chat {chat_file}, creazione nuovo file")
-                        messages = []
-            else:
-                messages = []
-            
-            # Aggiungi il nuovo messaggio
-            messages.append(message_data)
-            
-            # Salva il file aggiornato
-            with open(chat_file, 'w', encoding='utf-8') as f:
-                json.dump(messages, f, ensure_ascii=False, indent=2)
-            
+
+            self.storage.append_message(message_data)
             return True
         except Exception as e:
             logger.error(f"Errore durante la registrazione del messaggio: {e}")
             return False
 
+    def migrate_to_jsonl(self) -> Dict[int, int]:
+        """
+        Migra tutte le chat legacy nel formato jsonl (solo backend su file).
+
+        Returns:
+            Dict: Numero di messaggi migrati per ogni utente
+        """
+        if not isinstance(self.storage, FileChatStorage):
+            logger.warning("La migrazione jsonl è disponibile solo con il backend su file")
+            return {}
+        return self.storage.migrate_to_jsonl()
+
     def get_user_chats(self, user_id: Optional[int] = None) -> Dict[int, List[Dict]]:
         """
         Ottiene le conversazioni degli utenti.
-        
+
         Args:
             user_id: Se specificato, ottiene solo le conversazioni di un utente specifico
-            
+
         Returns:
             Dict: Dizionario con le conversazioni degli utenti
         """
         chats = {}
-        
+
         try:
             if user_id:
                 # Leggi solo la chat di un utente specifico
-                chat_file = os.path.join(CHATS_DIR, f"chat_{user_id}.json")
-                if os.path.exists(chat_file):
-                    with open(chat_file, 'r', encoding='utf-8') as f:
-                        chats[user_id] = json.load(f)
+                messages = self.storage.get_messages(user_id)
+                if messages is not None:
+                    chats[user_id] = messages
             else:
                 # Leggi tutte le chat
-                for filename in os.listdir(CHATS_DIR):
-                    if filename.startswith("chat_") and filename.endswith(".json"):
-                        try:
-                            # Estrai l'ID utente dal nome del file
-                            user_id = int(filename.replace("chat_", "").replace(".json", ""))
-                            
-                            # Leggi il file
-                            with open(os.path.join(CHATS_DIR, filename), 'r', encoding='utf-8') as f:
-                                chats[user_id] = json.load(f)
-                        except (ValueError, json.JSONDecodeError) as e:
-                            logger.error(f"Errore nel leggere il file {filename}: {e}")
+                for chat_user_id in self.storage.list_user_ids():
+                    try:
+                        messages = self.storage.get_messages(chat_user_id)
+                        if messages is not None:
+                            chats[chat_user_id] = messages
+                    except ValueError as e:
+                        logger.error(f"Errore nel leggere la chat {chat_user_id}: {e}")
         except Exception as e:
             logger.error(f"Errore durante il recupero delle chat: {e}")
-        
+
         return chats
 
+    def get_user_chat_page(self, user_id: int, offset: int = 0, limit: int = 50,
+                           newest_first: bool = True) -> List[Dict]:
+        """
+        Ottiene una pagina della conversazione di un utente senza leggere l'intera cronologia.
+
+        Args:
+            user_id: ID dell'utente Telegram
+            offset: numero di messaggi da saltare nell'ordine richiesto
+            limit: numero massimo di messaggi della pagina
+            newest_first: se True i messaggi sono ordinati dal più recente
+
+        Returns:
+            List: Messaggi della pagina richiesta
+        """
+        try:
+            return self.storage.get_messages_page(user_id, offset, limit, newest_first)
+        except Exception as e:
+            logger.error(f"Errore durante il recupero della pagina di chat: {e}")
+            return []
+
+    def count_user_messages(self, user_id: int) -> int:
+        """
+        Conta i messaggi registrati per un utente.
+
+        Returns:
+            int: Numero di messaggi (0 se la chat non esiste o non è leggibile)
+        """
+        try:
+            return self.storage.count_messages(user_id)
+        except Exception as e:
+            logger.error(f"Errore durante il conteggio dei messaggi: {e}")
+            return 0
+
     def get_user_info(self) -> List[Dict]:
         """
         Ottiene informazioni su tutti gli utenti che hanno interagito con il bot.
-        
+
         Returns:
             List: Lista di dizionari con le informazioni degli utenti
         """
         users = []
-        
+
         try:
-            # Leggi tutte le chat per estrarre le informazioni degli utenti
-            chats = self.get_user_chats()
-            
-            for user_id, messages in chats.items():
-                if messages:
-                    # Prendi le informazioni dal messaggio più recente
-                    latest_message = messages[-1]
-                    
-                    # Crea il dizionario con le informazioni dell'utente
-                    user_info = {
-                        "user_id": user_id,
-                        "username": latest_message.get("username", ""),
-                        "first_name": latest_message.get("first_name", ""),
-                        "last_message_time": latest_message.get("timestamp", ""),
-                        "message_count": len(messages)
-                    }
-                    
-                    users.append(user_info)
+            users = self.storage.get_user_summaries()
         except Exception as e:
             logger.error(f"Errore durante il recupero delle informazioni degli utenti: {e}")
-        
+
         # Ordina gli utenti per data dell'ultimo messaggio (dal più recente)
         users.sort(key=lambda x: x.get("last_message_time", ""), reverse=True)
-        
+
         return users
 
 
 # Singleton per il logger delle chat
-chat_logger = ChatLogger()
\ No newline at end of file
+chat_logger = ChatLogger()
+
+
+if __name__ == '__main__':
+    if "--migrate" in sys.argv:
+        result = chat_logger.migrate_to_jsonl()
+        total = sum(result.values())
+        print(f"Migrate {len(result)} chat ({total} messaggi) nel formato jsonl")
+    elif "--import-sqlite" in sys.argv:
+        source = FileChatStorage()
+        target = SQLiteChatStorage()
+        total = 0
+        skipped = 0
+        for chat_user_id in source.list_user_ids():
+            # Ogni utente è importato in un'unica transazione: se ha già delle righe è già stato copiato
+            if target.count_messages(chat_user_id):
+                skipped += 1
+                continue
+            total += target.import_messages(source.get_messages(chat_user_id) or [])
+        target.close()
+        print(f"Importati {total} messaggi nel database SQLite {target.db_path} "
+              f"({skipped} utenti già presenti saltati)")
+    else:
+        print("Uso: python chat_logger.py --migrate | --import-sqlite")
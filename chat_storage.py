@@ -0,0 +1,513 @@
+"""
+Backend di archiviazione per le chat registrate dal bot.
+
+Tutti i backend implementano l'interfaccia `ChatStorage`, usata da `ChatLogger`:
+- `FileChatStorage`: un file per utente nella directory chats/ (jsonl append-only
+  oppure array JSON legacy).
+- `SQLiteChatStorage`: database SQLite embedded in modalità WAL, con indici su
+  user_id e timestamp, così elenco utenti e conteggi sono query indicizzate.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Iterable
+from chat_index import UserSummaryIndex
+from config import (CHAT_STORAGE_BACKEND, CHAT_STORAGE_FORMAT, CHAT_FSYNC_POLICY,
+                    CHAT_FSYNC_INTERVAL, CHAT_SQLITE_PATH)
+
+logger = logging.getLogger(__name__)
+
+# Directory per salvare i file delle conversazioni
+CHATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chats")
+
+
+class ChatStorage:
+    """Interfaccia comune per i backend di archiviazione delle chat."""
+
+    def append_message(self, message_data: Dict[str, Any]):
+        """Registra un messaggio (dizionario con almeno user_id e timestamp)."""
+        raise NotImplementedError
+
+    def get_messages(self, user_id: int) -> Optional[List[Dict]]:
+        """Restituisce i messaggi di un utente in ordine cronologico, None se la chat non esiste."""
+        raise NotImplementedError
+
+    def list_user_ids(self) -> List[int]:
+        """Restituisce gli ID di tutti gli utenti con una chat registrata."""
+        raise NotImplementedError
+
+    def get_messages_page(self, user_id: int, offset: int = 0, limit: int = 50,
+                          newest_first: bool = True) -> List[Dict]:
+        """
+        Restituisce una finestra di al massimo `limit` messaggi di un utente.
+
+        Args:
+            user_id: ID dell'utente
+            offset: numero di messaggi da saltare, contati nell'ordine richiesto
+            limit: numero massimo di messaggi da restituire
+            newest_first: se True l'ordine è dal più recente al più vecchio
+        """
+        messages = self.get_messages(user_id) or []
+        if newest_first:
+            messages = messages[::-1]
+        return messages[offset:offset + limit]
+
+    def count_messages(self, user_id: int) -> int:
+        """Restituisce il numero di messaggi registrati per un utente."""
+        messages = self.get_messages(user_id)
+        return len(messages) if messages else 0
+
+    def get_user_summaries(self) -> List[Dict]:
+        """
+        Restituisce un riepilogo per utente: user_id, username, first_name,
+        last_message_time e message_count.
+        """
+        summaries = []
+        for user_id in self.list_user_ids():
+            try:
+                messages = self.get_messages(user_id)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Errore nel leggere la chat {user_id}: {e}")
+                continue
+            if messages:
+                summaries.append(summarize_messages(user_id, messages))
+        return summaries
+
+    def close(self):
+        """Rilascia le risorse del backend."""
+
+
+def summarize_messages(user_id: int, messages: List[Dict]) -> Dict:
+    """Costruisce il riepilogo di un utente a partire dai suoi messaggi."""
+    # Prendi le informazioni dal messaggio più recente
+    latest_message = messages[-1]
+    return {
+        "user_id": user_id,
+        "username": latest_message.get("username", ""),
+        "first_name": latest_message.get("first_name", ""),
+        "last_message_time": latest_message.get("timestamp", ""),
+        "message_count": len(messages)
+    }
+
+
+class FileChatStorage(ChatStorage):
+    """
+    Backend su file: un file chat_<id>.jsonl (o chat_<id>.json legacy) per utente.
+
+    I riepiloghi per il pannello admin sono serviti da un `UserSummaryIndex`
+    salvato in chats/index/, aggiornato a ogni messaggio.
+    """
+
+    def __init__(self, chats_dir: str = CHATS_DIR, storage_format: str = CHAT_STORAGE_FORMAT,
+                 fsync_policy: str = CHAT_FSYNC_POLICY, fsync_interval: float = CHAT_FSYNC_INTERVAL):
+        """
+        Args:
+            chats_dir: directory dei file delle chat
+            storage_format: "jsonl" (append-only) oppure "json" (array legacy)
+            fsync_policy: "always", "interval" o "never" (solo per il formato jsonl)
+            fsync_interval: secondi minimi tra due fsync con la politica "interval"
+        """
+        if storage_format not in ("jsonl", "json"):
+            logger.warning(f"Formato chat sconosciuto '{storage_format}', utilizzo 'jsonl'")
+            storage_format = "jsonl"
+        if fsync_policy not in ("always", "interval", "never"):
+            logger.warning(f"Politica di fsync sconosciuta '{fsync_policy}', utilizzo 'interval'")
+            fsync_policy = "interval"
+
+        self.chats_dir = chats_dir
+        self.storage_format = storage_format
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._last_fsync = 0.0
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.chats_dir):
+            os.makedirs(self.chats_dir)
+            logger.info(f"Creata directory per le chat: {self.chats_dir}")
+
+        self.index = UserSummaryIndex(os.path.join(self.chats_dir, "index"))
+
+    def _json_path(self, user_id: int) -> str:
+        """Percorso del file chat in formato legacy (array JSON)."""
+        return os.path.join(self.chats_dir, f"chat_{user_id}.json")
+
+    def _jsonl_path(self, user_id: int) -> str:
+        """Percorso del file chat in formato append-only (JSON lines)."""
+        return os.path.join(self.chats_dir, f"chat_{user_id}.jsonl")
+
+    def append_message(self, message_data: Dict[str, Any]):
+        user_id = message_data["user_id"]
+        with self._lock:
+            # Una chat già in formato jsonl resta in jsonl anche se il formato configurato è "json"
+            if self.storage_format == "jsonl" or os.path.exists(self._jsonl_path(user_id)):
+                self._append_jsonl(user_id, message_data)
+            else:
+                self._rewrite_json(user_id, message_data)
+
+    def _append_jsonl(self, user_id: int, message_data: Dict[str, Any]):
+        """Aggiunge un messaggio in coda al file jsonl dell'utente (costo costante)."""
+        chat_file = self._jsonl_path(user_id)
+
+        # Migra la cronologia legacy prima del primo append, così nessun messaggio va perso
+        if not os.path.exists(chat_file) and os.path.exists(self._json_path(user_id)):
+            self._migrate_user(user_id)
+
+        previous_stat = os.stat(chat_file) if os.path.exists(chat_file) else None
+
+        line = json.dumps(message_data, ensure_ascii=False) + "\n"
+        with open(chat_file, 'a', encoding='utf-8') as f:
+            f.write(line)
+            if self._should_fsync():
+                f.flush()
+                os.fsync(f.fileno())
+                self._last_fsync = time.monotonic()
+
+        # Un indice non aggiornato viene ricostruito alla lettura: non deve far fallire la registrazione
+        try:
+            self.index.record_append(user_id, chat_file, previous_stat, message_data)
+        except (OSError, ValueError) as e:
+            logger.error(f"Errore nell'aggiornamento dell'indice per l'utente {user_id}: {e}")
+
+    def _should_fsync(self) -> bool:
+        """Indica se l'append corrente deve essere sincronizzato su disco."""
+        if self.fsync_policy == "always":
+            return True
+        if self.fsync_policy == "interval":
+            return time.monotonic() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _rewrite_json(self, user_id: int, message_data: Dict[str, Any]):
+        """Aggiunge un messaggio riscrivendo l'intero array JSON (formato legacy)."""
+        chat_file = self._json_path(user_id)
+
+        # Carica i messaggi esistenti o crea un nuovo array
+        if os.path.exists(chat_file):
+            with open(chat_file, 'r', encoding='utf-8') as f:
+                try:
+                    messages = json.load(f)
+                except json.JSONDecodeError:
+                    logger.error(f"Errore nel decodificare il file chat {chat_file}, creazione nuovo file")
+                    messages = []
+        else:
+            messages = []
+
+        # Aggiungi il nuovo messaggio
+        messages.append(message_data)
+
+        # Salva il file aggiornato
+        with open(chat_file, 'w', encoding='utf-8') as f:
+            json.dump(messages, f, ensure_ascii=False, indent=2)
+
+        try:
+            self.index.record_messages(user_id, chat_file, messages)
+        except (OSError, ValueError) as e:
+            logger.error(f"Errore nell'aggiornamento dell'indice per l'utente {user_id}: {e}")
+
+    @staticmethod
+    def _read_jsonl(chat_file: str) -> List[Dict]:
+        """Legge un file jsonl ignorando le righe corrotte (es. un append interrotto)."""
+        messages = []
+        with open(chat_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.error(f"Riga {line_number} non valida nel file {chat_file}, ignorata")
+        return messages
+
+    def get_messages(self, user_id: int) -> Optional[List[Dict]]:
+        jsonl_file = self._jsonl_path(user_id)
+        if os.path.exists(jsonl_file):
+            return self._read_jsonl(jsonl_file)
+
+        json_file = self._json_path(user_id)
+        if os.path.exists(json_file):
+            with open(json_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        return None
+
+    def _chat_files(self) -> Dict[int, str]:
+        """Mappa user_id -> file chat, preferendo il jsonl al json legacy."""
+        chat_files = {}
+        for filename in os.listdir(self.chats_dir):
+            if not filename.startswith("chat_"):
+                continue
+            if filename.endswith(".jsonl"):
+                raw_id = filename[len("chat_"):-len(".jsonl")]
+            elif filename.endswith(".json"):
+                raw_id = filename[len("chat_"):-len(".json")]
+            else:
+                continue
+            try:
+                # Estrai l'ID utente dal nome del file
+                user_id = int(raw_id)
+            except ValueError as e:
+                logger.error(f"Errore nel leggere il file {filename}: {e}")
+                continue
+            if user_id not in chat_files or filename.endswith(".jsonl"):
+                chat_files[user_id] = os.path.join(self.chats_dir, filename)
+        return chat_files
+
+    def list_user_ids(self) -> List[int]:
+        return list(self._chat_files())
+
+    def get_messages_page(self, user_id: int, offset: int = 0, limit: int = 50,
+                          newest_first: bool = True) -> List[Dict]:
+        jsonl_file = self._jsonl_path(user_id)
+        if not os.path.exists(jsonl_file):
+            # Il formato legacy va comunque letto per intero
+            return super().get_messages_page(user_id, offset, limit, newest_first)
+
+        # Per il jsonl vengono decodificate solo le righe della finestra richiesta
+        lines = _iter_lines_reversed(jsonl_file) if newest_first else _iter_lines(jsonl_file)
+        page = []
+        skipped = 0
+        for line in lines:
+            if skipped < offset:
+                skipped += 1
+                continue
+            try:
+                page.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.error(f"Riga non valida nel file {jsonl_file}, ignorata")
+                continue
+            if len(page) >= limit:
+                break
+        return page
+
+    def count_messages(self, user_id: int) -> int:
+        chat_file = self._chat_file_for(user_id)
+        if chat_file is None:
+            return 0
+        summary = self.index.get_summary(user_id, chat_file, os.stat(chat_file))
+        return summary["message_count"] if summary else 0
+
+    def _chat_file_for(self, user_id: int) -> Optional[str]:
+        """File chat di un utente (jsonl se presente, altrimenti json legacy), None se assente."""
+        for chat_file in (self._jsonl_path(user_id), self._json_path(user_id)):
+            if os.path.exists(chat_file):
+                return chat_file
+        return None
+
+    def get_user_summaries(self) -> List[Dict]:
+        summaries = []
+        for user_id, chat_file in self._chat_files().items():
+            try:
+                summary = self.index.get_summary(user_id, chat_file, os.stat(chat_file))
+            except (OSError, ValueError) as e:
+                logger.error(f"Errore nel leggere la chat {user_id}: {e}")
+                continue
+            if summary:
+                summaries.append(summary)
+        return summaries
+
+    def _migrate_user(self, user_id: int) -> int:
+        """
+        Converte la chat legacy di un utente nel formato jsonl.
+
+        Il file jsonl viene scritto su un file temporaneo e poi rinominato in modo atomico;
+        l'array originale viene conservato come chat_<id>.json.bak.
+
+        Returns:
+            int: Numero di messaggi migrati
+        """
+        json_file = self._json_path(user_id)
+        jsonl_file = self._jsonl_path(user_id)
+
+        with open(json_file, 'r', encoding='utf-8') as f:
+            try:
+                messages = json.load(f)
+            except json.JSONDecodeError:
+                logger.error(f"Errore nel decodificare il file chat {json_file}, migrazione saltata")
+                messages = []
+
+        tmp_file = jsonl_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, jsonl_file)
+        os.replace(json_file, json_file + ".bak")
+
+        logger.info(f"Migrata chat {user_id} in formato jsonl ({len(messages)} messaggi)")
+        return len(messages)
+
+    def migrate_to_jsonl(self) -> Dict[int, int]:
+        """
+        Migra in un'unica passata tutte le chat legacy nel formato jsonl.
+
+        Returns:
+            Dict: Numero di messaggi migrati per ogni utente
+        """
+        migrated = {}
+
+        with self._lock:
+            for filename in os.listdir(self.chats_dir):
+                if not (filename.startswith("chat_") and filename.endswith(".json")):
+                    continue
+                try:
+                    user_id = int(filename[len("chat_"):-len(".json")])
+                except ValueError:
+                    logger.error(f"Nome file chat non valido: {filename}")
+                    continue
+
+                if os.path.exists(self._jsonl_path(user_id)):
+                    logger.warning(f"Chat {user_id} già presente in formato jsonl, {filename} non migrato")
+                    continue
+
+                try:
+                    migrated[user_id] = self._migrate_user(user_id)
+                except OSError as e:
+                    logger.error(f"Errore durante la migrazione del file {filename}: {e}")
+
+        return migrated
+
+
+def _iter_lines(path: str):
+    """Itera le righe non vuote di un file dal principio."""
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def _iter_lines_reversed(path: str, block_size: int = 64 * 1024):
+    """Itera le righe non vuote di un file dalla fine, leggendo a blocchi all'indietro."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            # Il primo frammento può essere una riga tagliata dal blocco: completata al giro successivo
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
+
+class SQLiteChatStorage(ChatStorage):
+    """Backend SQLite embedded (WAL) con indici su user_id e timestamp."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            user_message TEXT,
+            bot_response TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages (user_id, id);
+        CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);
+    """
+
+    COLUMNS = ("timestamp", "user_id", "username", "first_name", "user_message", "bot_response")
+
+    def __init__(self, db_path: str = CHAT_SQLITE_PATH):
+        """
+        Args:
+            db_path: percorso del file di database
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        # Una sola connessione condivisa tra i thread, serializzata dal lock;
+        # la modalità WAL permette ad altri processi (es. il pannello admin) di leggere in parallelo
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        logger.info(f"Database chat SQLite pronto: {db_path}")
+
+    def _row_to_message(self, row: sqlite3.Row) -> Dict:
+        return {column: row[column] for column in self.COLUMNS}
+
+    def append_message(self, message_data: Dict[str, Any]):
+        self.import_messages([message_data])
+
+    def import_messages(self, messages: Iterable[Dict[str, Any]]) -> int:
+        """Inserisce più messaggi in un'unica transazione, restituisce il numero di righe inserite."""
+        rows = [tuple(message.get(column) for column in self.COLUMNS) for message in messages]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO messages ({', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def get_messages(self, user_id: int) -> Optional[List[Dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+        if not rows:
+            return None
+        return [self._row_to_message(row) for row in rows]
+
+    def get_messages_page(self, user_id: int, offset: int = 0, limit: int = 50,
+                          newest_first: bool = True) -> List[Dict]:
+        order = "DESC" if newest_first else "ASC"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM messages WHERE user_id = ? ORDER BY id {order} LIMIT ? OFFSET ?",
+                (user_id, limit, offset)
+            ).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    def list_user_ids(self) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM messages").fetchall()
+        return [row["user_id"] for row in rows]
+
+    def count_messages(self, user_id: int) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS total FROM messages WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row["total"]
+
+    def get_user_summaries(self) -> List[Dict]:
+        # Il raggruppamento usa l'indice (user_id, id): nessuna scansione dei contenuti dei messaggi
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT m.user_id, m.username, m.first_name, m.timestamp AS last_message_time,
+                       s.message_count
+                FROM (SELECT user_id, MAX(id) AS last_id, COUNT(*) AS message_count
+                      FROM messages GROUP BY user_id) AS s
+                JOIN messages AS m ON m.id = s.last_id
+                ORDER BY m.timestamp DESC
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_chat_storage(backend: str = CHAT_STORAGE_BACKEND) -> ChatStorage:
+    """Crea il backend di archiviazione configurato ("file" o "sqlite")."""
+    if backend == "sqlite":
+        return SQLiteChatStorage()
+    if backend != "file":
+        logger.warning(f"Backend chat sconosciuto '{backend}', utilizzo 'file'")
+    return FileChatStorage()
@@ -1,5 +1,7 @@
 import os
+import hashlib
 import logging
+import tempfile
 # per windows
 # from dotenv import load_dotenv
 # load_dotenv('secrets.env')
@@ -42,13 +44,239 @@ DEFAULT_SYSTEM_MESSAGE = (
     "If users ask who created you or who is your owner, tell them it's {BOT_OWNER} on Telegram."
 )
 
-# Maximum number of messages to keep in the conversation history
-MAX_CONVERSATION_HISTORY = 10
+# Shared OpenAI HTTP connection pool (openai_clients.py)
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+# Seconds an idle connection is kept open for reuse
+OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Overall and connect timeouts of each API request, in seconds
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+# Use HTTP/2 when the h2 package is installed
+OPENAI_HTTP2 = os.environ.get("OPENAI_HTTP2", "true").lower() == "true"
+
+# OpenAI health check shown on the dashboard
+# Seconds between two background checks
+OPENAI_HEALTH_INTERVAL = int(os.environ.get("OPENAI_HEALTH_INTERVAL", "300"))
+# "models" (models list, no tokens used) or "completion" (1-token completion, also detects exhausted quota)
+OPENAI_HEALTH_PROBE = os.environ.get("OPENAI_HEALTH_PROBE", "models")
+# Timeout in seconds of a single health check
+OPENAI_HEALTH_TIMEOUT = float(os.environ.get("OPENAI_HEALTH_TIMEOUT", "10"))
+
+# Maximum number of messages to keep in the conversation history (system prompt excluded)
+MAX_CONVERSATION_HISTORY = int(os.environ.get("MAX_CONVERSATION_HISTORY", "10"))
+
+# Token budget of the prompt (system prompt + summary + history); older turns are dropped beyond it
+CONVERSATION_TOKEN_BUDGET = int(os.environ.get("CONVERSATION_TOKEN_BUDGET", "3000"))
+# Fold dropped turns into a short local summary kept at the top of the prompt
+CONVERSATION_SUMMARIZE_EVICTED = os.environ.get("CONVERSATION_SUMMARIZE_EVICTED", "false").lower() == "true"
+# Token budget of that summary
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_TOKENS", "300"))
+
+# Conversation cache limits (OpenAIHandler)
+# Maximum number of conversations kept in memory
+CONVERSATION_CACHE_MAX_ENTRIES = int(os.environ.get("CONVERSATION_CACHE_MAX_ENTRIES", "1000"))
+# Seconds of inactivity after which a conversation is dropped (0 = never)
+CONVERSATION_CACHE_TTL = int(os.environ.get("CONVERSATION_CACHE_TTL", "3600"))
+# Maximum estimated size in bytes of the cached conversations (0 = no limit)
+CONVERSATION_CACHE_MAX_BYTES = int(os.environ.get("CONVERSATION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Conversation persistence across bot restarts
+CONVERSATION_PERSISTENCE_ENABLED = os.environ.get("CONVERSATION_PERSISTENCE_ENABLED", "true").lower() == "true"
+# SQLite database holding the saved conversation histories
+CONVERSATION_DB_PATH = os.environ.get(
+    "CONVERSATION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "chats", "conversations.db")
+)
+# Seconds between two batched writes of the modified conversations
+CONVERSATION_FLUSH_INTERVAL = float(os.environ.get("CONVERSATION_FLUSH_INTERVAL", "5"))
+
+# Response cache for repeated prompts (OpenAIHandler)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+# Maximum number of cached responses
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+# Seconds a cached response stays valid
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "600"))
+# Only turns with at most this many earlier messages in the conversation are cached (0 = first turn only)
+RESPONSE_CACHE_MAX_HISTORY = int(os.environ.get("RESPONSE_CACHE_MAX_HISTORY", "0"))
+
+# Identical context-free requests in flight at the same time share one API call (same turns as the response cache)
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Semantic cache: answers to single-turn questions similar to ones already answered (needs numpy)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Minimum cosine similarity (0-1) for a cached answer to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+# Maximum number of question/answer pairs in the index
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+# Size of the hashed question vectors
+SEMANTIC_CACHE_DIMENSIONS = int(os.environ.get("SEMANTIC_CACHE_DIMENSIONS", "1024"))
+# Fill the index at startup with the question/answer pairs of the chat logs
+SEMANTIC_CACHE_MINE_CHATS = os.environ.get("SEMANTIC_CACHE_MINE_CHATS", "true").lower() == "true"
+
+# Client-side rate limiting of the OpenAI calls (token buckets, 0 = no limit)
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "false").lower() == "true"
+# Requests and tokens per minute allowed for the whole bot (keep them below the provider limits)
+RATE_LIMIT_RPM = int(os.environ.get("RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM = int(os.environ.get("RATE_LIMIT_TPM", "30000"))
+# Requests and tokens per minute allowed for a single user
+RATE_LIMIT_USER_RPM = int(os.environ.get("RATE_LIMIT_USER_RPM", "10"))
+RATE_LIMIT_USER_TPM = int(os.environ.get("RATE_LIMIT_USER_TPM", "10000"))
+# Maximum seconds a request waits for capacity: private chats have priority over group traffic
+RATE_LIMIT_PRIVATE_MAX_WAIT = float(os.environ.get("RATE_LIMIT_PRIVATE_MAX_WAIT", "20"))
+RATE_LIMIT_GROUP_MAX_WAIT = float(os.environ.get("RATE_LIMIT_GROUP_MAX_WAIT", "5"))
+
+# Retries and circuit breaker around the completion calls (resilience.py)
+# Seconds allowed for a whole call, retries and waits included
+OPENAI_REQUEST_DEADLINE = float(os.environ.get("OPENAI_REQUEST_DEADLINE", "30"))
+# Attempts per call for transient errors (timeouts, connection errors, 429 rate limits, 5xx)
+OPENAI_RETRY_ATTEMPTS = int(os.environ.get("OPENAI_RETRY_ATTEMPTS", "3"))
+# Base and maximum wait between two attempts (exponential, with random jitter)
+OPENAI_RETRY_BASE_DELAY = float(os.environ.get("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.environ.get("OPENAI_RETRY_MAX_DELAY", "8"))
+# Share of failed calls in the window that opens the circuit (0 disables the circuit breaker)
+CIRCUIT_FAILURE_RATIO = float(os.environ.get("CIRCUIT_FAILURE_RATIO", "0.5"))
+# Minimum calls in the window before the failure share is evaluated
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", "10"))
+# Seconds of history considered
+CIRCUIT_WINDOW = float(os.environ.get("CIRCUIT_WINDOW", "60"))
+# Seconds the circuit stays open (fallback responses only) before a trial call
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+
+# Hedged requests for private chats: if the first token is late, a second request races the first
+HEDGING_ENABLED = os.environ.get("HEDGING_ENABLED", "false").lower() == "true"
+# Model of the second request (same model by default, can be a cheaper or faster one)
+HEDGE_MODEL = os.environ.get("HEDGE_MODEL", OPENAI_MODEL)
+# Percentile of the recent time-to-first-token after which the second request is sent
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+# Recent samples considered, and samples needed before the percentile is used
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+# Threshold in seconds while samples are too few, and bounds of the computed threshold
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "3"))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.environ.get("HEDGE_MAX_DELAY", "10"))
+
+# Fallback responses used when OpenAI is not available
+# JSON file with the recognised phrases, their priority and response
+FALLBACK_RESPONSES_PATH = os.environ.get(
+    "FALLBACK_RESPONSES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fallback_responses.json")
+)
+# Minimum seconds between two checks of that file for changes
+FALLBACK_RELOAD_INTERVAL = float(os.environ.get("FALLBACK_RELOAD_INTERVAL", "5"))
 
 # Response generation settings
 MAX_TOKENS = 500
 TEMPERATURE = 0.7
 
+# Bot runtime settings
+# Runtime del bot: "telebot" (polling sincrono) o "async" (python-telegram-bot + client OpenAI asincrono)
+BOT_RUNTIME = os.environ.get("BOT_RUNTIME", "telebot")
+# Runtime async: numero massimo di richieste elaborate contemporaneamente
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get("ASYNC_MAX_IN_FLIGHT", "16"))
+# Runtime async: numero massimo di update accettati (in elaborazione o in attesa)
+ASYNC_MAX_PENDING_UPDATES = int(os.environ.get("ASYNC_MAX_PENDING_UPDATES", "256"))
+# Runtime async: ordinamento garantito degli update, "chat", "user" o "none"
+ASYNC_UPDATE_ORDERING = os.environ.get("ASYNC_UPDATE_ORDERING", "chat")
+
+# Supervisione del processo del bot avviato da app.py
+# Secondi di attesa prima del riavvio dopo un crash, raddoppiati a ogni crash ravvicinato
+BOT_RESTART_MIN_BACKOFF = float(os.environ.get("BOT_RESTART_MIN_BACKOFF", "1"))
+BOT_RESTART_MAX_BACKOFF = float(os.environ.get("BOT_RESTART_MAX_BACKOFF", "300"))
+# Secondi di attività dopo i quali il processo è considerato stabile (l'attesa torna al minimo)
+BOT_STABLE_AFTER = float(os.environ.get("BOT_STABLE_AFTER", "60"))
+
+# Elezione del leader tra i worker del server web: solo il leader avvia bot, controlli e keep-alive
+# I file sono distinti per bot (id numerico del token), così più bot possono convivere sullo stesso host
+_RUNTIME_PREFIX = os.path.join(tempfile.gettempdir(), f"toniai-{TELEGRAM_TOKEN.split(':')[0]}")
+LEADER_LOCK_PATH = os.environ.get("LEADER_LOCK_PATH", _RUNTIME_PREFIX + ".lock")
+# File in cui il leader pubblica lo stato letto dalla dashboard degli altri worker
+LEADER_STATUS_PATH = os.environ.get("LEADER_STATUS_PATH", _RUNTIME_PREFIX + "-status.json")
+# Lock tenuto dal processo del bot per tutta la sua vita: due processi non possono mai fare polling insieme,
+# nemmeno se un processo rimasto orfano (leader terminato con SIGKILL) è ancora in esecuzione
+BOT_LOCK_PATH = os.environ.get("BOT_LOCK_PATH", _RUNTIME_PREFIX + "-bot.lock")
+# Secondi tra due controlli del processo padre da parte del bot avviato dal supervisore
+BOT_PARENT_CHECK_INTERVAL = float(os.environ.get("BOT_PARENT_CHECK_INTERVAL", "2"))
+
+# Chiave delle sessioni del pannello admin: deve essere la stessa in tutti i worker del server web.
+# Se non è impostata viene generata una volta e salvata (permessi 0600) nel file SECRET_KEY_PATH
+FLASK_SECRET_KEY = os.environ.get("FLASK_SECRET_KEY")
+SECRET_KEY_PATH = os.environ.get("SECRET_KEY_PATH", _RUNTIME_PREFIX + "-secret.key")
+# Secondi tra due tentativi di diventare leader
+LEADER_RETRY_INTERVAL = float(os.environ.get("LEADER_RETRY_INTERVAL", "10"))
+# Secondi tra due pubblicazioni dello stato (e controlli delle richieste di riavvio)
+LEADER_STATUS_INTERVAL = float(os.environ.get("LEADER_STATUS_INTERVAL", "5"))
+
+# Ricezione degli update (runtime telebot): "polling" (processo bot_runner.py) o
+# "webhook" (Telegram invia gli update all'endpoint del server Flask)
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+# URL pubblico del server a cui Telegram invia gli update
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", os.environ.get("RENDER_EXTERNAL_URL", ""))
+# Percorso dell'endpoint webhook
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram-webhook")
+# Token segreto che Telegram invia in ogni richiesta; se non impostato viene derivato dal token del bot,
+# così è lo stesso in tutti i processi
+WEBHOOK_SECRET = os.environ.get(
+    "WEBHOOK_SECRET",
+    hashlib.sha256(f"webhook:{TELEGRAM_TOKEN}".encode("utf-8")).hexdigest()
+)
+# Socket Unix con cui i worker non leader inoltrano gli update ricevuti al leader
+WEBHOOK_FORWARD_SOCKET = os.environ.get("WEBHOOK_FORWARD_SOCKET", _RUNTIME_PREFIX + "-webhook.sock")
+# Update ricevuti in attesa di elaborazione oltre i quali l'endpoint risponde 503 (Telegram ritenta)
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Runtime telebot: secondi dopo i quali l'identità del bot (getMe) viene riletta da Telegram
+BOT_IDENTITY_REFRESH_INTERVAL = int(os.environ.get("BOT_IDENTITY_REFRESH_INTERVAL", str(6 * 3600)))
+
+# Runtime telebot: pool di thread per i messaggi, serializzato per utente
+MESSAGE_WORKER_POOL_ENABLED = os.environ.get("MESSAGE_WORKER_POOL_ENABLED", "true").lower() == "true"
+# Numero di thread che generano risposte in parallelo
+MESSAGE_WORKER_POOL_SIZE = int(os.environ.get("MESSAGE_WORKER_POOL_SIZE", "8"))
+# Messaggi accettati (in elaborazione o in attesa) oltre i quali si risponde "occupato"
+MESSAGE_WORKER_POOL_MAX_PENDING = int(os.environ.get("MESSAGE_WORKER_POOL_MAX_PENDING", "100"))
+
+# Runtime telebot: analisi delle foto in un pool separato, così non rallentano i messaggi di testo
+IMAGE_WORKER_POOL_SIZE = int(os.environ.get("IMAGE_WORKER_POOL_SIZE", "2"))
+# Foto accettate (in elaborazione o in attesa) oltre le quali si risponde "occupato"
+IMAGE_WORKER_POOL_MAX_PENDING = int(os.environ.get("IMAGE_WORKER_POOL_MAX_PENDING", "20"))
+# Lato lungo in pixel sufficiente per l'analisi: si scarica la risoluzione più piccola che lo raggiunge
+IMAGE_TARGET_SIZE = int(os.environ.get("IMAGE_TARGET_SIZE", "1024"))
+# Dimensione massima in byte di una foto scaricata
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.environ.get("IMAGE_MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024)))
+# Byte di una foto tenuti in memoria durante il download prima di passare a un file temporaneo
+IMAGE_SPOOL_MAX_MEMORY = int(os.environ.get("IMAGE_SPOOL_MAX_MEMORY", str(1024 * 1024)))
+# Qualità JPEG della foto ricodificata (con Pillow installato)
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
+# Secondi massimi di attesa durante il download
+IMAGE_DOWNLOAD_TIMEOUT = float(os.environ.get("IMAGE_DOWNLOAD_TIMEOUT", "30"))
+# Token stimati per l'immagine di una richiesta di analisi, riservati nel rate limiter
+# (GPT-4o: 85 token di base più 170 per ogni riquadro 512x512 di una foto ridotta a IMAGE_TARGET_SIZE)
+IMAGE_TOKEN_ESTIMATE = int(os.environ.get("IMAGE_TOKEN_ESTIMATE", "1105"))
+
+# Runtime telebot: risposte in streaming, mostrate modificando progressivamente un solo messaggio
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "false").lower() == "true"
+# Secondi minimi tra due modifiche del messaggio in streaming (limiti di Telegram)
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Chat log storage settings
+# Backend di archiviazione delle chat: "file" (una chat per file in chats/) o "sqlite"
+CHAT_STORAGE_BACKEND = os.environ.get("CHAT_STORAGE_BACKEND", "file")
+# Percorso del database per il backend "sqlite"
+CHAT_SQLITE_PATH = os.environ.get(
+    "CHAT_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "chats", "chats.db")
+)
+# Formato dei file delle chat: "jsonl" (append-only, un messaggio per riga) o "json" (array legacy)
+CHAT_STORAGE_FORMAT = os.environ.get("CHAT_STORAGE_FORMAT", "jsonl")
+# Politica di fsync per i file jsonl: "always", "interval" o "never"
+CHAT_FSYNC_POLICY = os.environ.get("CHAT_FSYNC_POLICY", "interval")
+# Secondi minimi tra due fsync con la politica "interval"
+CHAT_FSYNC_INTERVAL = float(os.environ.get("CHAT_FSYNC_INTERVAL", "5"))
+
+# Numero di messaggi per pagina nella vista chat del pannello admin
+ADMIN_CHAT_PAGE_SIZE = 50
+
 # Admin password per accedere al pannello di controllo
 # In un ambiente di produzione, questa dovrebbe essere in una variabile d'ambiente
 ADMIN_PASSWORD = "admin123"  # È preferibile sostituire questa password con una più complessa
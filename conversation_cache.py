@@ -0,0 +1,143 @@
+"""
+Cache limitata delle conversazioni attive di OpenAIHandler.
+
+Le conversazioni sono tenute in ordine LRU: oltre `max_entries` voci, oltre
+`max_bytes` di contenuto stimato o dopo `ttl` secondi di inattività le meno
+recenti vengono scartate, così la memoria del processo resta piatta anche con
+una base utenti in crescita.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationCache:
+    """Cache LRU con scadenza per inattività e contabilità della memoria"""
+
+    def __init__(self, factory, max_entries=1000, ttl=3600, max_bytes=50 * 1024 * 1024, on_change=None):
+        """
+        Args:
+            factory: funzione user_id -> nuova conversazione, usata in caso di miss
+            max_entries: numero massimo di conversazioni in memoria
+            ttl: secondi di inattività dopo i quali una conversazione viene scartata (0 = mai)
+            max_bytes: dimensione stimata massima delle conversazioni in memoria (0 = nessun limite)
+            on_change: callback(user_id, conversazione) chiamata quando una conversazione
+                in cache viene modificata o sostituita
+        """
+        self.factory = factory
+        self.on_change = on_change
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # user_id -> (conversazione, ultimo accesso), dal meno recente
+        self._lock = threading.RLock()
+        self._resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id):
+        """Restituisce la conversazione di un utente, creandola se non è in cache"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self.hits += 1
+                conversation = entry[0]
+                self._entries[user_id] = (conversation, now)
+                self._entries.move_to_end(user_id)
+                return conversation
+
+            self.misses += 1
+            conversation = self.factory(user_id)
+            self._insert(user_id, conversation, now)
+            return conversation
+
+    def set(self, user_id, conversation):
+        """Sostituisce (o inserisce) la conversazione di un utente"""
+        with self._lock:
+            self._remove(user_id)
+            self._insert(user_id, conversation, time.monotonic())
+        if self.on_change is not None:
+            self.on_change(user_id, conversation)
+
+    def pop(self, user_id):
+        """Rimuove la conversazione di un utente, restituendola se presente"""
+        with self._lock:
+            return self._remove(user_id)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Statistiche della cache: hit, miss, evizioni e memoria stimata"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "resident_bytes": self._resident_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def _insert(self, user_id, conversation, now):
+        conversation.on_resize = lambda delta: self._account(user_id, conversation, delta)
+        self._entries[user_id] = (conversation, now)
+        self._resident_bytes += conversation.size_bytes
+        self._enforce_limits()
+
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return None
+        conversation = entry[0]
+        conversation.on_resize = None
+        self._resident_bytes -= conversation.size_bytes
+        return conversation
+
+    def _account(self, user_id, conversation, delta):
+        """Callback delle conversazioni: aggiorna la memoria stimata quando cambiano dimensione"""
+        with self._lock:
+            self._resident_bytes += delta
+            if delta > 0:
+                self._enforce_limits()
+        if self.on_change is not None:
+            self.on_change(user_id, conversation)
+
+    def _expire(self, now):
+        """Scarta le conversazioni inattive da più di ttl secondi (sono in testa all'ordine LRU)"""
+        if not self.ttl:
+            return
+        while self._entries:
+            user_id, (_, last_access) = next(iter(self._entries.items()))
+            if now - last_access < self.ttl:
+                break
+            self._remove(user_id)
+            self.expirations += 1
+
+    def _enforce_limits(self):
+        """Scarta le conversazioni meno recenti finché i limiti non sono rispettati"""
+        # La conversazione più recente (quella in uso) non viene mai scartata, anche se da sola supera il limite
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or
+                (self.max_bytes and self._resident_bytes > self.max_bytes)):
+            user_id = next(iter(self._entries))
+            self._remove(user_id)
+            self.evictions += 1
+            logger.debug(f"Conversazione dell'utente {user_id} scartata dalla cache")
@@ -0,0 +1,127 @@
+"""
+Persistenza delle conversazioni di OpenAIHandler tra un riavvio e l'altro del bot.
+
+Le conversazioni modificate vengono segnate come "sporche" e scritte su SQLite
+in blocco da un thread in background ogni `flush_interval` secondi
+(write-behind), così la generazione delle risposte non attende il disco. Dopo
+un riavvio una conversazione viene ricaricata solo al primo messaggio del suo
+utente, quindi il costo di avvio è proporzionale agli utenti attivi.
+
+Viene salvata solo la cronologia utente/assistente: il system prompt è sempre
+quello della configurazione corrente.
+"""
+import os
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """Archivio SQLite delle cronologie delle conversazioni con scrittura differita"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            user_id INTEGER PRIMARY KEY,
+            messages TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path, flush_interval=5.0):
+        """
+        Args:
+            db_path: percorso del file di database
+            flush_interval: secondi tra due scritture in blocco delle conversazioni modificate
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self._lock = threading.Lock()
+        self._dirty = {}  # user_id -> conversazione da salvare al prossimo flush
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="conversation-store", daemon=True)
+        self._thread.start()
+        # Ultimo flush alla chiusura del processo, per non perdere le modifiche recenti
+        atexit.register(self.close)
+        logger.info(f"Archivio conversazioni pronto: {db_path} (flush ogni {self.flush_interval}s)")
+
+    def load(self, user_id):
+        """Restituisce la cronologia salvata di un utente (lista di messaggi) o None"""
+        with self._lock:
+            pending = self._dirty.get(user_id)
+            if pending is not None:
+                # Modifica non ancora scritta: è più recente di quanto c'è su disco
+                return _history(pending)
+            row = self._conn.execute(
+                "SELECT messages FROM conversations WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError as e:
+            logger.error(f"Cronologia salvata non valida per l'utente {user_id}: {e}")
+            return None
+
+    def mark_dirty(self, user_id, conversation):
+        """Segna una conversazione da salvare al prossimo flush"""
+        with self._lock:
+            self._dirty[user_id] = conversation
+
+    def flush(self):
+        """Scrive in un'unica transazione tutte le conversazioni modificate"""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+            now = time.time()
+            rows = [(user_id, json.dumps(_history(conversation), ensure_ascii=False), now)
+                    for user_id, conversation in dirty.items()]
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO conversations (user_id, messages, updated_at) VALUES (?, ?, ?)",
+                        rows
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Errore nel salvataggio delle conversazioni: {e}")
+                # Rimetti in coda le conversazioni non salvate, senza sovrascrivere modifiche più recenti
+                for user_id, conversation in dirty.items():
+                    self._dirty.setdefault(user_id, conversation)
+                return 0
+        return len(rows)
+
+    def _flush_loop(self):
+        """Loop del thread di scrittura differita"""
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Ferma il thread di scrittura e salva le modifiche in sospeso"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        saved = self.flush()
+        with self._lock:
+            self._conn.close()
+        logger.info(f"Archivio conversazioni chiuso ({saved} conversazioni salvate alla chiusura)")
+
+
+def _history(conversation):
+    """Copia della cronologia di una conversazione senza il system prompt"""
+    return [dict(message) for message in conversation.messages if message["role"] != "system"]
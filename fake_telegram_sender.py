@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Invia update Telegram finti all'endpoint webhook locale, per provare BOT_MODE=webhook
+senza Telegram.
+
+Esempio:
+    python fake_telegram_sender.py --text "ciao" --count 5
+    python fake_telegram_sender.py --chat-type group --text "toniai /help"
+
+Le risposte del bot vengono comunque inviate all'API di Telegram: con chat e
+utenti finti falliranno (errore nei log), ma ricezione, validazione e
+smistamento degli update sono verificati.
+"""
+import sys
+import time
+import argparse
+import requests
+from config import WEBHOOK_PATH, WEBHOOK_SECRET
+
+
+def build_update(update_id, text, chat_id, chat_type, user_id, username):
+    """Update Telegram minimale con un messaggio di testo"""
+    chat = {"id": chat_id, "type": chat_type}
+    if chat_type in ("group", "supergroup"):
+        chat["title"] = "Gruppo di prova"
+    else:
+        chat["first_name"] = username
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": user_id, "is_bot": False, "first_name": username, "username": username},
+            "text": text
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invia update Telegram finti all'endpoint webhook")
+    parser.add_argument("--url", default=f"http://localhost:5000{WEBHOOK_PATH}", help="URL dell'endpoint webhook")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET, help="token segreto (default: quello configurato)")
+    parser.add_argument("--text", default="ciao", help="testo del messaggio")
+    parser.add_argument("--count", type=int, default=1, help="numero di update da inviare")
+    parser.add_argument("--chat-type", default="private", choices=["private", "group", "supergroup"])
+    parser.add_argument("--chat-id", type=int, default=100000001)
+    parser.add_argument("--user-id", type=int, default=100000001)
+    parser.add_argument("--username", default="tester")
+    args = parser.parse_args()
+
+    failures = 0
+    start = time.perf_counter()
+    for i in range(args.count):
+        update_id = int(time.time() * 1000) + i
+        update = build_update(update_id, args.text, args.chat_id, args.chat_type, args.user_id, args.username)
+        response = requests.post(
+            args.url,
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": args.secret},
+            timeout=10
+        )
+        if response.status_code != 200:
+            failures += 1
+            print(f"Update {update_id}: HTTP {response.status_code} {response.text.strip()}")
+
+    elapsed = time.perf_counter() - start
+    print(f"{args.count} update inviati in {elapsed:.3f}s, {failures} rifiutati")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
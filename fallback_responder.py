@@ -0,0 +1,160 @@
+"""
+Risposte di riserva per quando OpenAI non è disponibile.
+
+Le frasi riconosciute e le relative risposte sono lette da un file JSON
+(FALLBACK_RESPONSES_PATH), una lista di voci del tipo:
+
+    {"phrases": ["chi sei", "chi siete"], "priority": 10, "response": "..."}
+
+Le risposte possono contenere il segnaposto {BOT_OWNER}. Tutte le frasi sono
+compilate in un automa di Aho–Corasick, quindi la ricerca richiede una sola
+passata sul messaggio, qualunque sia il numero di frasi. Se più frasi
+compaiono nel messaggio vince quella con priorità più alta (a parità, la voce
+che viene prima nel file). Il file viene ricaricato automaticamente quando
+cambia, senza riavviare il bot.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from config import BOT_OWNER
+
+logger = logging.getLogger(__name__)
+
+
+class PhraseMatcher:
+    """Automa di Aho–Corasick che restituisce la risposta della frase migliore trovata nel testo"""
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: lista di (frasi, priorità, risposta), in ordine di preferenza a parità di priorità
+        """
+        self._goto = [{}]  # transizioni per carattere di ogni nodo
+        self._fail = [0]
+        self._best = [None]  # (priorità, -ordine, risposta) migliore che termina in ogni nodo
+
+        for order, (phrases, priority, response) in enumerate(entries):
+            for phrase in phrases:
+                phrase = phrase.lower()
+                if not phrase:
+                    continue
+                node = 0
+                for char in phrase:
+                    next_node = self._goto[node].get(char)
+                    if next_node is None:
+                        next_node = len(self._goto)
+                        self._goto[node][char] = next_node
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._best.append(None)
+                    node = next_node
+                self._best[node] = _better(self._best[node], (priority, -order, response))
+
+        self._build_fail_links()
+
+    def _build_fail_links(self):
+        """Collegamenti di fallimento in ampiezza; ogni nodo eredita la migliore uscita del suo suffisso"""
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0) if node else 0
+                self._best[child] = _better(self._best[child], self._best[self._fail[child]])
+                queue.append(child)
+
+    def match(self, text):
+        """Risposta della frase con priorità più alta contenuta nel testo, o None"""
+        goto, fail, best_out = self._goto, self._fail, self._best
+        node = 0
+        best = None
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if best_out[node] is not None:
+                best = _better(best, best_out[node])
+        return best[2] if best else None
+
+
+def _better(current, candidate):
+    """La migliore tra due uscite (priorità più alta, poi voce più in alto nel file)"""
+    if candidate is None:
+        return current
+    if current is None or candidate[:2] > current[:2]:
+        return candidate
+    return current
+
+
+class FallbackResponder:
+    """Tabella delle risposte di riserva caricata da file e ricaricata quando il file cambia"""
+
+    def __init__(self, path, default_response, reload_interval=5.0):
+        """
+        Args:
+            path: file JSON con le frasi e le risposte
+            default_response: risposta quando nessuna frase corrisponde
+            reload_interval: secondi minimi tra due controlli di modifica del file
+        """
+        self.path = path
+        self.default_response = default_response
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._matcher = PhraseMatcher([])
+        self._responses = ()
+        self._mtime_ns = None
+        self._last_check = 0.0
+        self.reload()
+
+    def reload(self):
+        """Rilegge il file delle frasi; in caso di errore resta in uso la tabella precedente"""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            entries = [
+                (entry["phrases"], entry.get("priority", 0), entry["response"].replace("{BOT_OWNER}", BOT_OWNER))
+                for entry in table
+            ]
+            matcher = PhraseMatcher(entries)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Errore nel caricamento delle risposte di riserva da {self.path}: {e}")
+            return False
+
+        with self._lock:
+            self._matcher = matcher
+            self._responses = tuple(response for _, _, response in entries)
+            self._mtime_ns = mtime_ns
+        logger.info(f"Risposte di riserva caricate: {len(entries)} voci da {self.path}")
+        return True
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime_ns != self._mtime_ns:
+            # Una versione non valida del file viene segnalata una sola volta, non a ogni controllo
+            self._mtime_ns = mtime_ns
+            self.reload()
+
+    def respond(self, message_text):
+        """Risposta di riserva per un messaggio"""
+        self._reload_if_changed()
+        response = self._matcher.match(message_text or "")
+        return response if response is not None else self.default_response
+
+    def responses(self):
+        """Tutte le risposte che il responder può restituire, predefinita compresa"""
+        self._reload_if_changed()
+        with self._lock:
+            return self._responses + (self.default_response,)
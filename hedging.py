@@ -0,0 +1,308 @@
+"""
+Richieste "hedged" per le risposte in cui conta la latenza (chat private).
+
+La richiesta principale viene inviata in streaming; se il primo token non
+arriva entro una soglia pari a un percentile (es. p95) dei tempi al primo
+token osservati di recente, parte una seconda richiesta identica, anche verso
+un modello diverso (più economico o più veloce). Vince la prima che produce
+testo: l'altra viene annullata chiudendone lo stream, così la connessione
+viene liberata e non si consumano altri token. Se la richiesta principale
+fallisce prima del primo token, la seconda parte subito (catena di riserva
+di un solo anello).
+
+La soglia si adatta al carico: finché non ci sono abbastanza campioni si usa
+un valore fisso, poi il percentile della finestra, sempre entro un minimo e
+un massimo configurati.
+"""
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_text(chunk):
+    """Testo contenuto in un frammento di una risposta in streaming ("" se assente)"""
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def stream_text(stream):
+    """Frammenti di testo di uno stream di chat.completions"""
+    for chunk in stream:
+        text = chunk_text(chunk)
+        if text:
+            yield text
+
+
+class LatencyTracker:
+    """Tempi al primo token recenti e soglia di hedging calcolata come percentile"""
+
+    def __init__(self, window=200, percentile=95, min_samples=20, default_delay=3.0, min_delay=0.5, max_delay=10.0):
+        """
+        Args:
+            window: numero di campioni recenti considerati
+            percentile: percentile (0-100) dei campioni usato come soglia
+            min_samples: campioni necessari prima di usare il percentile
+            default_delay: soglia in secondi finché i campioni sono pochi
+            min_delay, max_delay: limiti della soglia in secondi
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self):
+        """Secondi di attesa del primo token oltre i quali parte la seconda richiesta"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.default_delay
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, ordered[index]))
+
+
+class _StreamAttempt:
+    """Richiesta in streaming letta in un thread, che inoltra i frammenti su una coda comune"""
+
+    def __init__(self, name, open_stream, events):
+        self.name = name
+        self._open_stream = open_stream
+        self._events = events
+        self._lock = threading.Lock()
+        self._stream = None
+        self.cancelled = False
+        threading.Thread(target=self._run, name=f"hedge-{name}", daemon=True).start()
+
+    def _run(self):
+        try:
+            stream = self._open_stream()
+            with self._lock:
+                self._stream = stream
+                cancelled = self.cancelled
+            if cancelled:
+                stream.close()
+                return
+            for text in stream_text(stream):
+                if self.cancelled:
+                    return
+                self._events.put((self, "text", text))
+            self._events.put((self, "done", None))
+        except Exception as e:
+            # Un tentativo annullato fallisce per la chiusura dello stream: non è un errore
+            if not self.cancelled:
+                self._events.put((self, "error", e))
+
+    def cancel(self):
+        """Interrompe il tentativo chiudendo la connessione dello stream"""
+        with self._lock:
+            self.cancelled = True
+            stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+async def _first_fragment(open_stream):
+    """Apre uno stream asincrono e attende il primo frammento di testo (None se la risposta è vuota)"""
+    stream = await open_stream()
+    try:
+        async for chunk in stream:
+            text = chunk_text(chunk)
+            if text:
+                return stream, text
+        return stream, None
+    except BaseException:
+        # Anche se il task viene annullato perché ha vinto l'altra richiesta
+        await stream.close()
+        raise
+
+
+class Hedger:
+    """Esegue una richiesta principale e, se lenta, una seconda richiesta in concorrenza"""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0  # seconde richieste inviate per lentezza della principale
+        self.fallbacks = 0  # seconde richieste inviate perché la principale è fallita
+        self.hedge_wins = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _finish(self, winner_is_hedge, elapsed):
+        """Aggiorna contatori e campioni quando una delle richieste produce il primo testo"""
+        # Se vince la seconda richiesta, la principale non aveva ancora risposto dopo `elapsed`
+        # secondi: il campione è una stima per difetto, ma tiene la soglia aggiornata
+        self.tracker.add(elapsed)
+        if winner_is_hedge:
+            self._count("hedge_wins")
+
+    def stream(self, open_primary, open_hedge, allow_hedge=None, on_loser=None):
+        """
+        Frammenti della risposta vincente.
+
+        Args:
+            open_primary, open_hedge: funzioni senza argomenti che aprono lo stream di chat.completions
+            allow_hedge: funzione che autorizza l'invio della seconda richiesta (es. rate limiter)
+            on_loser: funzione chiamata per la richiesta perdente, quando ce n'è una
+                (es. per restituire i token riservati per la sua risposta)
+        """
+        self._count("requests")
+        events = queue.Queue()
+        start = time.monotonic()
+        primary = _StreamAttempt("primary", open_primary, events)
+        attempts = [primary]
+        live = {primary}
+        hedge = None
+        hedge_refused = False
+        winner = None
+        threshold = self.tracker.threshold()
+
+        def start_hedge(reason):
+            nonlocal hedge
+            if allow_hedge is not None and not allow_hedge():
+                return
+            self._count(reason)
+            hedge = _StreamAttempt("hedge", open_hedge, events)
+            attempts.append(hedge)
+            live.add(hedge)
+
+        try:
+            while winner is None:
+                waiting_hedge = hedge is None and not hedge_refused
+                timeout = max(0.0, start + threshold - time.monotonic()) if waiting_hedge else None
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    logger.info(f"Nessun token dopo {threshold:.2f}s, invio della richiesta di riserva")
+                    start_hedge("hedged")
+                    # Senza capacità per la seconda richiesta si attende solo la principale
+                    hedge_refused = hedge is None
+                    continue
+                if kind == "error":
+                    live.discard(attempt)
+                    if attempt is primary and hedge is None and not isinstance(payload, CircuitOpenError):
+                        logger.warning(f"Richiesta principale fallita ({payload}), invio della richiesta di riserva")
+                        start_hedge("fallbacks")
+                    if not live:
+                        raise payload
+                    continue
+                winner = attempt
+
+            for other in attempts:
+                if other is not winner:
+                    other.cancel()
+                    if on_loser is not None:
+                        on_loser()
+            self._finish(winner is hedge, time.monotonic() - start)
+
+            while True:
+                if kind == "text":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+                attempt, kind, payload = events.get()
+                while attempt is not winner:
+                    attempt, kind, payload = events.get()
+        finally:
+            # Anche se chi legge smette prima della fine
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def complete_async(self, open_primary, open_hedge, allow_hedge=None, on_loser=None):
+        """
+        Testo completo della risposta vincente (runtime asyncio).
+
+        Args:
+            open_primary, open_hedge: coroutine function che aprono lo stream asincrono di chat.completions
+            allow_hedge: funzione che autorizza l'invio della seconda richiesta
+            on_loser: funzione chiamata per la richiesta perdente, quando ce n'è una
+        """
+        self._count("requests")
+        start = time.monotonic()
+        primary = asyncio.ensure_future(_first_fragment(open_primary))
+        pending = {primary}
+        hedge = None
+        error = None
+
+        def start_hedge(reason):
+            nonlocal hedge
+            if allow_hedge is not None and not allow_hedge():
+                return
+            self._count(reason)
+            hedge = asyncio.ensure_future(_first_fragment(open_hedge))
+            pending.add(hedge)
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.tracker.threshold())
+            if not done:
+                logger.info("Nessun token entro la soglia, invio della richiesta di riserva")
+                start_hedge("hedged")
+
+            winner = None
+            while winner is None:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        if winner is None:
+                            winner = task
+                        else:
+                            # Entrambe pronte nello stesso momento: si chiude la seconda
+                            await task.result()[0].close()
+                        continue
+                    error = task.exception()
+                    if task is primary and hedge is None and not isinstance(error, CircuitOpenError):
+                        logger.warning(f"Richiesta principale fallita ({error}), invio della richiesta di riserva")
+                        start_hedge("fallbacks")
+                if winner is None and not pending:
+                    raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if hedge is not None and on_loser is not None:
+            on_loser()
+        self._finish(winner is hedge, time.monotonic() - start)
+        stream, first = winner.result()
+        parts = [first] if first else []
+        async for chunk in stream:
+            text = chunk_text(chunk)
+            if text:
+                parts.append(text)
+        return "".join(parts)
+
+    def stats(self):
+        """Richieste, seconde richieste inviate e vinte, soglia attuale in millisecondi"""
+        with self._lock:
+            stats = {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "fallbacks": self.fallbacks,
+                "hedge_wins": self.hedge_wins,
+            }
+        stats["hedge_rate"] = round((stats["hedged"] + stats["fallbacks"]) / stats["requests"], 3) \
+            if stats["requests"] else 0.0
+        stats["threshold_ms"] = round(self.tracker.threshold() * 1000, 1)
+        return stats
@@ -0,0 +1,161 @@
+"""
+Preparazione delle foto ricevute per l'analisi con il modello di visione.
+
+Telegram invia ogni foto in più risoluzioni (`PhotoSize`, dalla più piccola
+alla più grande): si scarica la più piccola che raggiunge `target_size` sul
+lato lungo, invece dell'originale a piena risoluzione. Il download avviene a
+blocchi in un file temporaneo che resta in memoria solo finché è piccolo,
+con un limite di dimensione. Se è installato `Pillow` l'immagine viene poi
+ridotta a `target_size` e ricodificata in JPEG; infine viene codificata in
+base64 una sola volta, per l'URL data: inviato all'API.
+
+L'URL di download di Telegram contiene il token del bot, e i messaggi delle
+eccezioni di `requests` lo riportano: gli errori di rete vengono quindi
+convertiti in `ImageDownloadError`, che indica solo il file_id e il codice
+HTTP (o il tipo di errore).
+"""
+import time
+import base64
+import logging
+import tempfile
+import requests
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    logger.warning("Pillow non installato: le foto vengono inviate senza essere ridotte e ricodificate")
+
+# Dimensione dei blocchi letti durante il download
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ImageTooLargeError(Exception):
+    """Il file supera la dimensione massima consentita"""
+
+
+class ImageDownloadError(Exception):
+    """Download non riuscito; il messaggio non contiene l'URL (né quindi il token del bot)"""
+
+
+def _describe_request_error(error):
+    """Causa di un errore di `requests` senza l'URL: codice HTTP o tipo di errore"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    return type(error).__name__
+
+
+def select_photo_size(photo_sizes, target_size=1024):
+    """
+    Risoluzione da scaricare tra quelle offerte da Telegram.
+
+    Args:
+        photo_sizes: lista di PhotoSize (message.photo)
+        target_size: lato lungo in pixel sufficiente per l'analisi
+
+    Returns:
+        la più piccola con il lato lungo >= target_size, altrimenti la più grande
+    """
+    ordered = sorted(photo_sizes, key=lambda size: size.width * size.height)
+    for size in ordered:
+        if max(size.width, size.height) >= target_size:
+            return size
+    return ordered[-1]
+
+
+def download_to_spool(url, max_bytes=10 * 1024 * 1024, spool_size=1024 * 1024, timeout=30, file_id=None):
+    """
+    Scarica un file a blocchi in un SpooledTemporaryFile.
+
+    Args:
+        url: indirizzo del file
+        max_bytes: dimensione massima; oltre viene sollevata ImageTooLargeError
+        spool_size: byte tenuti in memoria prima di passare a un file su disco
+        timeout: secondi massimi per l'intero download (e per la connessione e ogni blocco)
+        file_id: identificativo del file riportato negli errori al posto dell'URL
+
+    Returns:
+        il file temporaneo, riposizionato all'inizio (va chiuso dal chiamante)
+    """
+    deadline = time.monotonic() + timeout
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get("Content-Length") or 0)
+            if declared > max_bytes:
+                raise ImageTooLargeError(f"{declared} byte")
+            received = 0
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ImageTooLargeError(f"oltre {max_bytes} byte")
+                # Il timeout di requests vale per ogni lettura: un server lento ma costante non lo supera mai
+                if time.monotonic() > deadline:
+                    raise ImageDownloadError(f"download del file {file_id} oltre {timeout:g}s")
+                spool.write(chunk)
+        spool.seek(0)
+        return spool
+    except requests.RequestException as e:
+        spool.close()
+        # "from None": anche la catena delle eccezioni conterrebbe l'URL
+        raise ImageDownloadError(f"download del file {file_id} non riuscito: {_describe_request_error(e)}") from None
+    except BaseException:
+        spool.close()
+        raise
+
+
+def encode_image(image_file, max_side=1024, quality=85):
+    """
+    Riduce e ricodifica l'immagine in JPEG (se Pillow è disponibile).
+
+    Args:
+        image_file: file binario posizionato all'inizio
+        max_side: lato lungo massimo in pixel
+        quality: qualità JPEG (1-95)
+
+    Returns:
+        bytes: immagine JPEG pronta per la codifica base64
+    """
+    if Image is None:
+        # Senza Pillow si invia la risoluzione scelta da Telegram, già compressa in JPEG
+        return image_file.read()
+
+    with Image.open(image_file) as image:
+        # Per i JPEG la riduzione avviene già in decodifica, senza espandere l'originale in memoria
+        image.draft("RGB", (max_side, max_side))
+        image = image.convert("RGB")
+        image.thumbnail((max_side, max_side))
+        output = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        with output:
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            output.seek(0)
+            return output.read()
+
+
+def fetch_photo_base64(photo_sizes, get_file_url, target_size=1024, max_bytes=10 * 1024 * 1024,
+                       spool_size=1024 * 1024, quality=85, timeout=30):
+    """
+    Sceglie, scarica e prepara una foto di Telegram.
+
+    Args:
+        photo_sizes: lista di PhotoSize del messaggio
+        get_file_url: funzione file_id -> URL di download (es. bot.get_file_url)
+
+    Returns:
+        str: JPEG codificato in base64
+    """
+    size = select_photo_size(photo_sizes, target_size)
+    logger.info(f"Download della foto {size.width}x{size.height} ({size.file_size or '?'} byte)")
+    try:
+        # Anche la richiesta getFile passa da un URL con il token del bot
+        url = get_file_url(size.file_id)
+    except requests.RequestException as e:
+        raise ImageDownloadError(f"getFile per il file {size.file_id} non riuscito: "
+                                 f"{_describe_request_error(e)}") from None
+    with download_to_spool(url, max_bytes, spool_size, timeout, size.file_id) as spool:
+        data = encode_image(spool, target_size, quality)
+    return base64.b64encode(data).decode("ascii")
@@ -0,0 +1,145 @@
+"""
+Elezione di un processo leader tra i worker del server web (es. gunicorn -w N).
+
+Ogni worker importa app.py, ma bot, controlli periodici e keep-alive devono
+girare una sola volta per host: li avvia solo il worker che ottiene il lock
+esclusivo (flock) su `lock_path`. Il sistema operativo rilascia il lock
+quando il processo termina, quindi se il leader muore uno degli altri worker
+lo sostituisce al tentativo successivo.
+
+Il leader pubblica periodicamente il proprio stato in un file JSON
+(`SharedStatus`) che gli altri worker leggono per la dashboard; le richieste
+di riavvio ricevute da un worker non leader vengono passate al leader con un
+file di richiesta.
+
+Senza `fcntl` (Windows) il processo si considera sempre leader.
+"""
+import os
+import json
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """Lock di file non bloccante che designa un solo processo leader per host"""
+
+    def __init__(self, lock_path, retry_interval=10):
+        """
+        Args:
+            lock_path: file su cui acquisire il lock
+            retry_interval: secondi tra due tentativi dei processi non leader
+        """
+        self.lock_path = lock_path
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._fd = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def try_acquire(self):
+        """Prova ad acquisire il lock senza attendere; restituisce True se il processo è leader"""
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            logger.warning("fcntl non disponibile: elezione del leader disattivata, questo processo è il leader")
+            self.is_leader = True
+            return True
+
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        # Il file contiene il PID del leader, utile per la diagnostica
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        self.is_leader = True
+        logger.info(f"Processo {os.getpid()} eletto leader ({self.lock_path})")
+        return True
+
+    def start(self, on_elected):
+        """
+        Partecipa all'elezione: `on_elected` viene chiamata una sola volta, quando
+        questo processo diventa leader (subito o al primo tentativo riuscito).
+        """
+        if self.try_acquire():
+            on_elected()
+            return
+
+        logger.info(f"Processo {os.getpid()} non leader, nuovo tentativo ogni {self.retry_interval}s")
+
+        def retry_loop():
+            while not self._stop.wait(self.retry_interval):
+                if self.try_acquire():
+                    on_elected()
+                    return
+
+        self._thread = threading.Thread(target=retry_loop, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def leader_pid(self):
+        """PID del leader attuale, letto dal file di lock (None se sconosciuto)"""
+        try:
+            with open(self.lock_path, 'r') as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+
+class SharedStatus:
+    """Stato pubblicato dal leader in un file JSON, letto dagli altri worker"""
+
+    def __init__(self, path):
+        self.path = path
+        self.restart_request_path = path + ".restart"
+
+    def write(self, status):
+        """Sostituisce atomicamente il file di stato"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".status-")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Errore nella scrittura dello stato condiviso: {e}")
+
+    def read(self):
+        """Ultimo stato pubblicato dal leader, o None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def request_restart(self):
+        """Chiede al leader di riavviare il bot"""
+        try:
+            with open(self.restart_request_path, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        except OSError as e:
+            logger.error(f"Errore nella richiesta di riavvio al leader: {e}")
+            return False
+
+    def consume_restart_request(self):
+        """Usato dal leader: True se un worker ha chiesto un riavvio (la richiesta viene rimossa)"""
+        try:
+            os.remove(self.restart_request_path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Errore nella lettura della richiesta di riavvio: {e}")
+            return False
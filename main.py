@@ -0,0 +1,5 @@
+# Entry point per gunicorn (gunicorn main:app): con più worker solo il leader avvia il bot
+from app import app, main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Instradamento dei messaggi ricevuti dal bot, comune ai runtime telebot e asincrono.
+
+Ogni messaggio viene analizzato una sola volta da `parse_message` (tipo di
+chat, prefisso "toniai" dei gruppi, comando e menzione del bot) in un
+`RoutedMessage`; `MessageRouter` lo consegna poi all'handler del comando,
+cercandolo in una tabella, o all'handler dei messaggi normali.
+
+Regole nei gruppi:
+- `toniai <testo>` → messaggio per l'AI (senza il prefisso)
+- `toniai /comando` e `/comando@nome_bot` → comando
+- tutto il resto viene ignorato
+"""
+import logging
+from bot_messages import GROUP_TRIGGER, GROUP_CHAT_TYPES
+
+logger = logging.getLogger(__name__)
+
+
+class RoutedMessage:
+    """Messaggio già analizzato, con i campi usati dagli handler"""
+
+    __slots__ = ("message", "chat_id", "chat_type", "is_group", "user_id", "username", "first_name",
+                 "text", "command", "args", "mention", "has_photo")
+
+    def __init__(self, message, chat_id, chat_type, is_group, user_id, username, first_name,
+                 text, command, args, mention, has_photo):
+        self.message = message  # messaggio originale del runtime, per rispondere
+        self.chat_id = chat_id
+        self.chat_type = chat_type
+        self.is_group = is_group
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.text = text  # testo senza il prefisso dei gruppi
+        self.command = command  # nome del comando in minuscolo, senza "/" e "@nome_bot", o None
+        self.args = args  # testo dopo il comando
+        self.mention = mention  # nome del bot indicato in /comando@nome_bot, o None
+        self.has_photo = has_photo
+
+
+def parse_message(message, bot_username=None):
+    """
+    Analizza un messaggio (telebot o python-telegram-bot).
+
+    Args:
+        message: messaggio ricevuto
+        bot_username: username del bot, se noto; i comandi indirizzati ad altri bot vengono ignorati
+
+    Returns:
+        RoutedMessage, o None se il bot deve ignorare il messaggio
+    """
+    chat_type = message.chat.type
+    is_group = chat_type in GROUP_CHAT_TYPES
+    has_photo = bool(message.photo)
+    text = message.text or message.caption or ""
+
+    triggered = False
+    if is_group:
+        triggered = text[:len(GROUP_TRIGGER)].lower() == GROUP_TRIGGER
+        if triggered:
+            text = text[len(GROUP_TRIGGER):].strip()
+
+    command = args = mention = None
+    if text.startswith("/"):
+        head, _, args = text.partition(" ")
+        command, _, mention = head[1:].partition("@")
+        command = command.lower()
+        mention = mention or None
+        args = args.strip()
+        if mention and bot_username and mention.lower() != bot_username.lower():
+            return None
+        # Nei gruppi senza prefisso solo /comando@nome_bot è rivolto a questo bot
+        if is_group and not triggered and not mention:
+            return None
+        if not command:
+            command = None
+    elif is_group and not triggered:
+        return None
+
+    user = message.from_user
+    return RoutedMessage(
+        message, message.chat.id, chat_type, is_group, user.id, user.username, user.first_name,
+        text, command, args, mention, has_photo
+    )
+
+
+class MessageRouter:
+    """Tabella dei comandi e handler di default per i messaggi analizzati"""
+
+    def __init__(self):
+        self._commands = {}
+        self._photo = None
+        self._default = None
+
+    def command(self, name):
+        """Decoratore che registra l'handler di un comando"""
+        def register(handler):
+            self._commands[name] = handler
+            return handler
+        return register
+
+    def photo(self, handler):
+        """Decoratore che registra l'handler dei messaggi con foto"""
+        self._photo = handler
+        return handler
+
+    def default(self, handler):
+        """Decoratore che registra l'handler dei messaggi normali (e dei comandi sconosciuti)"""
+        self._default = handler
+        return handler
+
+    def resolve(self, routed):
+        """Handler a cui consegnare il messaggio, o None"""
+        if routed.command is not None:
+            handler = self._commands.get(routed.command)
+            if handler is not None:
+                return handler
+        if routed.has_photo and self._photo is not None:
+            return self._photo
+        return self._default
+
+    def dispatch(self, routed):
+        """Chiama l'handler del messaggio e ne restituisce il risultato (una coroutine per gli handler async)"""
+        handler = self.resolve(routed)
+        if handler is None:
+            return None
+        logger.debug(f"Messaggio di {routed.user_id} in {routed.chat_type} {routed.chat_id} "
+                     f"instradato a {handler.__name__}")
+        return handler(routed)
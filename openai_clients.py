@@ -0,0 +1,140 @@
+"""
+Client OpenAI condivisi dal processo, con pool di connessioni HTTP riutilizzabile.
+
+Tutti i moduli (handler del bot, controllo di stato della dashboard) devono
+ottenere il client da qui invece di istanziare `OpenAI(...)`: così le
+connessioni keep-alive (e HTTP/2, se il pacchetto `h2` è installato) vengono
+riutilizzate e l'handshake TLS non si paga a ogni richiesta.
+"""
+import time
+import logging
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from config import (OPENAI_API_KEY, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    OPENAI_KEEPALIVE_EXPIRY, OPENAI_TIMEOUT, OPENAI_CONNECT_TIMEOUT, OPENAI_HTTP2)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401 - richiesto da httpx per HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+
+
+class PoolMetrics:
+    """Contatori delle richieste HTTP inviate tramite un client condiviso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.responses = 0
+        self.errors = 0  # risposte con codice >= 400
+        self.total_latency = 0.0
+
+    def on_request(self, request):
+        request.extensions["toniai_start"] = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+
+    def on_response(self, response):
+        start = response.request.extensions.get("toniai_start")
+        with self._lock:
+            self.responses += 1
+            if response.status_code >= 400:
+                self.errors += 1
+            if start is not None:
+                self.total_latency += time.perf_counter() - start
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "responses": self.responses,
+                "errors": self.errors,
+                "avg_latency_ms": round(self.total_latency / self.responses * 1000, 1) if self.responses else None,
+            }
+
+
+_metrics = PoolMetrics()
+_async_metrics = PoolMetrics()
+
+
+def _http_options():
+    """Parametri comuni dei client httpx"""
+    return {
+        "http2": OPENAI_HTTP2 and HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        ),
+        "timeout": httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    }
+
+
+def get_openai_client():
+    """Client OpenAI sincrono condiviso dal processo (creato al primo utilizzo)"""
+    global _client
+    with _lock:
+        if _client is None:
+            options = _http_options()
+            http_client = DefaultHttpxClient(
+                event_hooks={"request": [_metrics.on_request], "response": [_metrics.on_response]},
+                **options
+            )
+            # I tentativi ripetuti sono gestiti da resilience.py, con scadenza e circuit breaker
+            _client = OpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+            logger.info(f"Client OpenAI condiviso creato (HTTP/2: {options['http2']})")
+        return _client
+
+
+def get_async_openai_client():
+    """Client OpenAI asincrono condiviso dal processo (creato al primo utilizzo)"""
+    global _async_client
+
+    async def on_request(request):
+        _async_metrics.on_request(request)
+
+    async def on_response(response):
+        _async_metrics.on_response(response)
+
+    with _lock:
+        if _async_client is None:
+            http_client = DefaultAsyncHttpxClient(
+                event_hooks={"request": [on_request], "response": [on_response]},
+                **_http_options()
+            )
+            _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+        return _async_client
+
+
+def _connection_stats(http_client):
+    """Connessioni aperte e inattive del pool httpcore sottostante"""
+    try:
+        connections = http_client._transport._pool.connections
+    except AttributeError:
+        return {}
+    return {
+        "connections": len(connections),
+        "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+    }
+
+
+def get_pool_stats():
+    """Metriche dei pool di connessioni dei client condivisi creati finora"""
+    stats = {
+        "http2_available": HTTP2_AVAILABLE,
+        "max_connections": OPENAI_MAX_CONNECTIONS,
+        "max_keepalive_connections": OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    }
+    if _client is not None:
+        stats["sync"] = {**_metrics.snapshot(), **_connection_stats(_client._client)}
+    if _async_client is not None:
+        stats["async"] = {**_async_metrics.snapshot(), **_connection_stats(_async_client._client)}
+    return stats
@@ -1,31 +1,165 @@
 import base64
 import os
-from openai import OpenAI
-from config import OPENAI_API_KEY, OPENAI_MODEL, DEFAULT_SYSTEM_MESSAGE, MAX_TOKENS, TEMPERATURE
+from config import (OPENAI_MODEL, DEFAULT_SYSTEM_MESSAGE, MAX_TOKENS, TEMPERATURE,
+                    CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_TTL, CONVERSATION_CACHE_MAX_BYTES,
+                    CONVERSATION_PERSISTENCE_ENABLED, CONVERSATION_DB_PATH, CONVERSATION_FLUSH_INTERVAL,
+                    MAX_CONVERSATION_HISTORY, CONVERSATION_TOKEN_BUDGET, CONVERSATION_SUMMARIZE_EVICTED,
+                    CONVERSATION_SUMMARY_TOKENS, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES,
+                    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_HISTORY, SEMANTIC_CACHE_ENABLED,
+                    SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_DIMENSIONS,
+                    SEMANTIC_CACHE_MINE_CHATS, RATE_LIMIT_ENABLED, RATE_LIMIT_RPM, RATE_LIMIT_TPM,
+                    RATE_LIMIT_USER_RPM, RATE_LIMIT_USER_TPM, RATE_LIMIT_PRIVATE_MAX_WAIT,
+                    RATE_LIMIT_GROUP_MAX_WAIT, OPENAI_REQUEST_DEADLINE, OPENAI_RETRY_ATTEMPTS,
+                    OPENAI_RETRY_BASE_DELAY, OPENAI_RETRY_MAX_DELAY, CIRCUIT_FAILURE_RATIO, CIRCUIT_MIN_CALLS,
+                    CIRCUIT_WINDOW, CIRCUIT_OPEN_SECONDS, HEDGING_ENABLED, HEDGE_MODEL, HEDGE_PERCENTILE,
+                    HEDGE_WINDOW, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY, HEDGE_MAX_DELAY,
+                    SINGLE_FLIGHT_ENABLED, IMAGE_TOKEN_ESTIMATE)
+from conversation_cache import ConversationCache
+from response_cache import ResponseCache, response_cache_key
+from semantic_cache import SemanticCache
+from resilience import ResilientCaller, CircuitBreaker, CircuitOpenError
+from singleflight import SingleFlight
+from hedging import Hedger, LatencyTracker, stream_text
+from rate_limiter import RateLimiter, PRIORITY_PRIVATE, PRIORITY_GROUP
+from bot_messages import (FALLBACK_DEFAULT_RESPONSE, BUSY_RESPONSE, EMPTY_TRIGGER_RESPONSE,
+                          DEBUG_FORBIDDEN_RESPONSE, fallback_responder)
+from conversation_store import ConversationStore
+from token_counter import count_tokens, count_message_tokens
+from openai_clients import get_openai_client, get_async_openai_client
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize the OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# Shared OpenAI clients with a pooled HTTP connection
+openai_client = get_openai_client()
+# Async client used by the asyncio bot runtime
+async_openai_client = get_async_openai_client()
+
+# System message shared by every conversation instead of one copy per user (never mutate it)
+SYSTEM_PROMPT = {"role": "system", "content": DEFAULT_SYSTEM_MESSAGE}
+
+# Token count of the shared system prompt, computed once
+SYSTEM_PROMPT_TOKENS = count_message_tokens(SYSTEM_PROMPT)
+
+# User-facing messages for a failed completion
+QUOTA_ERROR_RESPONSE = (
+    "Mi dispiace, ma al momento non posso accedere all'intelligenza artificiale "
+    "a causa di un problema con il limite di utilizzo. "
+    "Il proprietario del bot è stato avvisato del problema. "
+    "Riprova più tardi."
+)
+API_ERROR_RESPONSE = (
+    "Mi dispiace, ma sto avendo problemi a connettermi all'intelligenza artificiale. "
+    "Riprova tra qualche momento."
+)
+IMAGE_ERROR_RESPONSE = "Non sono riuscito ad analizzare l'immagine. Riprova più tardi."
+
+# Confirmation of the /reset command
+RESET_RESPONSE = "Conversation history has been reset."
+
+# Seconds admissions are paused after a provider 429 without a usable Retry-After header
+RATE_LIMIT_DEFAULT_PAUSE = 5.0
+
+# Maximum characters kept from each dropped message in the local summary
+SUMMARY_LINE_CHARS = 200
+
+# Estimated fixed cost in bytes of one history entry (dict and strings), used for memory accounting
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def estimate_message_size(message):
+    """Approximate resident size in bytes of one history entry"""
+    return MESSAGE_OVERHEAD_BYTES + len(message["content"].encode("utf-8"))
+
 
 class Conversation:
-    """Class to handle conversation history and context for a user"""
+    """
+    Class to handle conversation history and context for a user.
+
+    The history is trimmed by token budget rather than by a fixed number of
+    messages: the oldest turns are dropped until the prompt (system prompt,
+    optional summary and history) fits in CONVERSATION_TOKEN_BUDGET, with
+    MAX_CONVERSATION_HISTORY as an upper bound on the number of messages.
+    Token counts are computed once per message and cached alongside it.
+    """
 
     def __init__(self, user_id):
         self.user_id = user_id
-        self.messages = [{"role": "system", "content": DEFAULT_SYSTEM_MESSAGE}]
+        self.messages = [SYSTEM_PROMPT]
+        self.token_counts = [SYSTEM_PROMPT_TOKENS]  # cached token count of each entry of self.messages
+        self.summary = None  # condensed text of the turns dropped from the history, if enabled
+        self.summary_tokens = 0
+        self.size_bytes = 0  # estimated size of the history, shared system prompt excluded
+        self.on_resize = None  # callback(delta_bytes) set by the conversation cache
+
+    @classmethod
+    def from_history(cls, user_id, history):
+        """Rebuild a conversation from a saved history (messages without the system prompt)"""
+        conversation = cls(user_id)
+        conversation.messages = [SYSTEM_PROMPT] + history
+        conversation.token_counts = [SYSTEM_PROMPT_TOKENS] + [count_message_tokens(message) for message in history]
+        conversation.size_bytes = sum(estimate_message_size(message) for message in history)
+        conversation.size_bytes += conversation._trim()
+        return conversation
+
+    @property
+    def total_tokens(self):
+        """Estimated prompt tokens of the whole conversation"""
+        return sum(self.token_counts) + self.summary_tokens
 
     def add_message(self, role, content):
         """Add a message to the conversation history"""
-        self.messages.append({"role": role, "content": content})
+        message = {"role": role, "content": content}
+        self.messages.append(message)
+        self.token_counts.append(count_message_tokens(message))
+        delta = estimate_message_size(message)
+
+        # Keep conversation history within the token budget
+        delta += self._trim()
+
+        self.size_bytes += delta
+        if self.on_resize is not None:
+            self.on_resize(delta)
 
-        # Keep conversation history at a reasonable size
-        if len(self.messages) > 10:  # Keep system message plus last 9 exchanges
-            self.messages = [self.messages[0]] + self.messages[-9:]
+    def _trim(self):
+        """Drop the oldest turns until the budget is met; returns the size delta in bytes"""
+        dropped = []
+        # The system prompt and the latest message are always kept, even if together they exceed the budget
+        while len(self.messages) > 2 and (
+                len(self.messages) - 1 > MAX_CONVERSATION_HISTORY or
+                self.total_tokens > CONVERSATION_TOKEN_BUDGET):
+            dropped.append(self.messages.pop(1))
+            self.token_counts.pop(1)
+
+        if dropped and CONVERSATION_SUMMARIZE_EVICTED:
+            self._summarize(dropped)
+
+        return -sum(estimate_message_size(message) for message in dropped)
+
+    def _summarize(self, dropped):
+        """Fold dropped turns into a compact local summary, bounded by CONVERSATION_SUMMARY_TOKENS"""
+        lines = self.summary.split("\n") if self.summary else []
+        for message in dropped:
+            content = message["content"] if isinstance(message["content"], str) else "[contenuto non testuale]"
+            content = " ".join(content.split())
+            if len(content) > SUMMARY_LINE_CHARS:
+                content = content[:SUMMARY_LINE_CHARS] + "…"
+            lines.append(f"{message['role']}: {content}")
+
+        # Oldest lines go first when the summary outgrows its own budget
+        while lines and count_tokens("\n".join(lines)) > CONVERSATION_SUMMARY_TOKENS:
+            lines.pop(0)
+
+        self.summary = "\n".join(lines) if lines else None
+        self.summary_tokens = count_message_tokens(self._summary_message()) if self.summary else 0
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"Earlier in this conversation:\n{self.summary}"}
 
     def get_messages(self):
         """Get all messages in the conversation"""
+        if self.summary:
+            return [self.messages[0], self._summary_message()] + self.messages[1:]
         return self.messages
 
 
@@ -33,79 +167,519 @@ class OpenAIHandler:
     """Class to handle interactions with the OpenAI API"""
 
     def __init__(self):
-        self.conversations = {}  # Dictionary to store conversations by user_id
+        # Conversations survive restarts: changes are written behind to a local store
+        self.store = None
+        if CONVERSATION_PERSISTENCE_ENABLED:
+            self.store = ConversationStore(CONVERSATION_DB_PATH, flush_interval=CONVERSATION_FLUSH_INTERVAL)
+
+        # Bounded LRU cache of conversations by user_id, with idle expiry
+        self.conversations = ConversationCache(
+            self._load_conversation,
+            max_entries=CONVERSATION_CACHE_MAX_ENTRIES,
+            ttl=CONVERSATION_CACHE_TTL,
+            max_bytes=CONVERSATION_CACHE_MAX_BYTES,
+            on_change=self.store.mark_dirty if self.store else None
+        )
+
+        # Optional cache of responses to identical, context-free requests
+        self.response_cache = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL)
+
+        # Optional similarity-based cache of answers to single-turn questions
+        self.semantic_cache = None
+        if SEMANTIC_CACHE_ENABLED:
+            self.semantic_cache = SemanticCache(
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                dimensions=SEMANTIC_CACHE_DIMENSIONS
+            )
+            if not self.semantic_cache.available:
+                logger.warning("SEMANTIC_CACHE_ENABLED is set but numpy is not installed: "
+                               "the semantic cache is disabled")
+                self.semantic_cache = None
+            elif SEMANTIC_CACHE_MINE_CHATS:
+                from chat_logger import chat_logger
+                # Canned, error and fallback replies in the logs are not answers worth reusing
+                canned = (QUOTA_ERROR_RESPONSE, API_ERROR_RESPONSE, IMAGE_ERROR_RESPONSE, RESET_RESPONSE,
+                          BUSY_RESPONSE, EMPTY_TRIGGER_RESPONSE, DEBUG_FORBIDDEN_RESPONSE)
+                # Persisted conversations keep their context across idle periods: only the first
+                # exchange of each user starts from scratch
+                session_gap = None if CONVERSATION_PERSISTENCE_ENABLED else CONVERSATION_CACHE_TTL
+                self.semantic_cache.mine_in_background(
+                    chat_logger.storage,
+                    exclude=canned + fallback_responder.responses(),
+                    session_gap=session_gap
+                )
+
+        # Optional client-side admission control, to stay under the provider rate limits
+        self.rate_limiter = None
+        if RATE_LIMIT_ENABLED:
+            self.rate_limiter = RateLimiter(
+                requests_per_minute=RATE_LIMIT_RPM,
+                tokens_per_minute=RATE_LIMIT_TPM,
+                user_requests_per_minute=RATE_LIMIT_USER_RPM,
+                user_tokens_per_minute=RATE_LIMIT_USER_TPM,
+                max_wait={PRIORITY_PRIVATE: RATE_LIMIT_PRIVATE_MAX_WAIT, PRIORITY_GROUP: RATE_LIMIT_GROUP_MAX_WAIT}
+            )
+
+        # Deadlines and retries of every completion call; the circuit breaker, when open,
+        # makes calls fail fast with CircuitOpenError so the bot answers with fallback responses
+        self.resilience = ResilientCaller(
+            breaker=CircuitBreaker(
+                failure_ratio=CIRCUIT_FAILURE_RATIO,
+                min_calls=CIRCUIT_MIN_CALLS,
+                window=CIRCUIT_WINDOW,
+                open_seconds=CIRCUIT_OPEN_SECONDS
+            ) if CIRCUIT_FAILURE_RATIO > 0 else None,
+            max_attempts=OPENAI_RETRY_ATTEMPTS,
+            base_delay=OPENAI_RETRY_BASE_DELAY,
+            max_delay=OPENAI_RETRY_MAX_DELAY,
+            deadline=OPENAI_REQUEST_DEADLINE
+        )
+
+        # Optional hedged requests for private chats, raced against a late primary request
+        self.hedger = None
+        if HEDGING_ENABLED:
+            self.hedger = Hedger(LatencyTracker(
+                window=HEDGE_WINDOW,
+                percentile=HEDGE_PERCENTILE,
+                min_samples=HEDGE_MIN_SAMPLES,
+                default_delay=HEDGE_DEFAULT_DELAY,
+                min_delay=HEDGE_MIN_DELAY,
+                max_delay=HEDGE_MAX_DELAY
+            ))
+
+        # Identical context-free requests in flight at the same time share one API call
+        self.single_flight = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+
+    def _load_conversation(self, user_id):
+        """Cache miss: rehydrate the saved conversation, if any, or start a new one"""
+        if self.store is not None:
+            history = self.store.load(user_id)
+            if history:
+                logger.info(f"Restored conversation for user {user_id} ({len(history)} messages)")
+                return Conversation.from_history(user_id, history)
+        return Conversation(user_id)
 
     def get_conversation(self, user_id):
         """Get or create conversation for a user"""
-        if user_id not in self.conversations:
-            self.conversations[user_id] = Conversation(user_id)
-        return self.conversations[user_id]
+        return self.conversations.get(user_id)
 
     def reset_conversation(self, user_id):
         """Reset a user's conversation history"""
-        self.conversations[user_id] = Conversation(user_id)
-        return "Conversation history has been reset."
+        self.conversations.set(user_id, Conversation(user_id))
+        return RESET_RESPONSE
+
+    def get_cache_stats(self):
+        """Hit, eviction and memory statistics of the conversation cache"""
+        return self.conversations.stats()
+
+    def get_response_cache_stats(self):
+        """Hit statistics of the response caches, or None when both are disabled"""
+        if self.response_cache is None and self.semantic_cache is None:
+            return None
+        return {
+            "exact": self.response_cache.stats() if self.response_cache else None,
+            "semantic": self.semantic_cache.stats() if self.semantic_cache else None
+        }
+
+    def get_rate_limit_stats(self):
+        """Admission statistics of the rate limiter, or None when it is disabled"""
+        return self.rate_limiter.stats() if self.rate_limiter else None
+
+    def get_resilience_stats(self):
+        """Retry and circuit breaker statistics of the completion calls"""
+        return self.resilience.stats()
+
+    def get_hedging_stats(self):
+        """How often hedged requests were sent and won, or None when hedging is disabled"""
+        return self.hedger.stats() if self.hedger else None
+
+    def get_single_flight_stats(self):
+        """Calls made and requests served by an identical in-flight call, or None when disabled"""
+        return self.single_flight.stats() if self.single_flight else None
+
+    def _start_turn(self, user_id, message_text):
+        """
+        Add the user message to the conversation.
+
+        Returns the conversation and whether the request may be answered from the
+        response caches or share an identical in-flight call: stateful conversations
+        (more than RESPONSE_CACHE_MAX_HISTORY earlier messages, or a summary) bypass them.
+        """
+        conversation = self.get_conversation(user_id)
+        cacheable = ((self.response_cache is not None or self.semantic_cache is not None or
+                      self.single_flight is not None) and
+                     not conversation.summary and
+                     len(conversation.messages) - 1 <= RESPONSE_CACHE_MAX_HISTORY)
+        conversation.add_message("user", message_text)
+
+        if not cacheable and self.response_cache is not None:
+            self.response_cache.record_bypass()
+        return conversation, cacheable
+
+    def _cached_response(self, user_id, conversation, message_text, cacheable):
+        """
+        Answer from the exact-match cache, then from the semantic cache.
 
-    def analyze_image(self, user_id, base64_image):
-        """Analizza un'immagine usando GPT-4o"""
+        Returns the response cache key of the request (None if not cacheable) and the
+        cached response, already added to the conversation, or None on a miss.
+        """
+        if not cacheable:
+            return None, None
+
+        cache_key = None
+        cached = None
+        if self.response_cache is not None:
+            cache_key = response_cache_key(conversation.get_messages(), OPENAI_MODEL, TEMPERATURE)
+            cached = self.response_cache.get(cache_key)
+        # Only single-turn questions are matched by similarity: their answer does not depend on context
+        if cached is None and self.semantic_cache is not None and len(conversation.messages) == 2:
+            cached = self.semantic_cache.lookup(message_text)
+            if cached is not None and cache_key is not None:
+                self.response_cache.set(cache_key, cached)
+
+        if cached is not None:
+            logger.info(f"Response cache hit for user {user_id}")
+            conversation.add_message("assistant", cached)
+        return cache_key, cached
+
+    def _store_response(self, cache_key, conversation, message_text, response):
+        """Save a complete response in the caches that apply to the request"""
+        if cache_key is not None:
+            self.response_cache.set(cache_key, response)
+        if self.semantic_cache is not None and len(conversation.messages) == 3 and \
+                conversation.messages[1]["content"] == message_text:
+            self.semantic_cache.add(message_text, response)
+
+    @staticmethod
+    def _request_tokens(conversation):
+        """Token estimate reserved for a completion: the prompt plus the maximum response length"""
+        return conversation.total_tokens + MAX_TOKENS
+
+    def _admit(self, user_id, estimate, priority):
+        """Wait for rate limiter capacity; False if the request must be turned away"""
+        if self.rate_limiter is None or self.rate_limiter.acquire(user_id, estimate, priority):
+            return True
+        logger.warning(f"Rate limit: request of user {user_id} rejected after the maximum wait")
+        return False
+
+    async def _admit_async(self, user_id, estimate, priority):
+        """Same as _admit, without blocking the event loop"""
+        if self.rate_limiter is None or await self.rate_limiter.acquire_async(user_id, estimate, priority):
+            return True
+        logger.warning(f"Rate limit: request of user {user_id} rejected after the maximum wait")
+        return False
+
+    def _settle(self, user_id, estimate, used_tokens):
+        """Correct the reserved token estimate with the actual usage of the request"""
+        if self.rate_limiter is not None and used_tokens:
+            self.rate_limiter.adjust(user_id, used_tokens - estimate)
+
+    def _note_error(self, error):
+        """Pause admissions when the provider answers 429 for a rate limit (not an exhausted quota)"""
+        if self.rate_limiter is None or getattr(error, "status_code", None) != 429 or \
+                "insufficient_quota" in str(error):
+            return
+        response = getattr(error, "response", None)
         try:
-            logger.info(f"Invio immagine a OpenAI GPT-4o per l'utente {user_id}")
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "Descrivi dettagliatamente l'immagine inviata."},
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
+            pause = float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            pause = RATE_LIMIT_DEFAULT_PAUSE
+        self.rate_limiter.pause(pause)
+
+    def _use_hedging(self, priority):
+        """Hedging only applies to private chats, where latency matters most"""
+        return self.hedger is not None and priority == PRIORITY_PRIVATE
+
+    def _hedge_admitted(self, user_id, estimate):
+        """The hedge is an extra request: it is sent only if the rate limiter has capacity right now"""
+        return self.rate_limiter is None or \
+            self.rate_limiter.acquire(user_id, estimate, PRIORITY_PRIVATE, timeout=0)
+
+    def _refund_hedge_loser(self, user_id):
+        """
+        Settle the reservation of the losing request of a hedged pair.
+
+        The loser is cancelled before it answers: its prompt is counted as used,
+        the tokens reserved for its response are given back.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.adjust(user_id, -MAX_TOKENS)
+
+    def _stream_opener(self, model, messages):
+        """Function opening a streamed completion, as expected by the hedger"""
+        return lambda: self.resilience.call(
+            openai_client.chat.completions.create,
+            model=model,
+            messages=messages,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            stream=True
+        )
+
+    def _async_stream_opener(self, model, messages):
+        """Coroutine function opening a streamed completion with the async client"""
+        return lambda: self.resilience.call_async(
+            async_openai_client.chat.completions.create,
+            model=model,
+            messages=messages,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            stream=True
+        )
+
+    def _hedged_fragments(self, user_id, messages, estimate):
+        """Text fragments of the first of the primary and hedge requests to answer"""
+        return self.hedger.stream(
+            self._stream_opener(OPENAI_MODEL, messages),
+            self._stream_opener(HEDGE_MODEL, messages),
+            allow_hedge=lambda: self._hedge_admitted(user_id, estimate),
+            on_loser=lambda: self._refund_hedge_loser(user_id)
+        )
+
+    def _complete(self, user_id, messages, estimate, priority):
+        """
+        Send one completion request, through the rate limiter.
+
+        Returns the response text, or None if the rate limiter turned the request away.
+        """
+        if not self._admit(user_id, estimate, priority):
+            return None
+
+        logger.info(f"Sending request to OpenAI for user {user_id}")
+        try:
+            if self._use_hedging(priority):
+                assistant_response = "".join(self._hedged_fragments(user_id, messages, estimate))
+                self._settle(user_id, estimate, estimate - MAX_TOKENS + count_tokens(assistant_response))
+                return assistant_response
+
+            response = self.resilience.call(
+                openai_client.chat.completions.create,
+                model=OPENAI_MODEL,
+                messages=messages,
                 max_tokens=MAX_TOKENS,
                 temperature=TEMPERATURE
             )
+        except Exception as e:
+            self._note_error(e)
+            raise
+        self._settle(user_id, estimate, response.usage.total_tokens if response.usage else None)
+        return response.choices[0].message.content
 
-            return response.choices[0].message.content
+    async def _complete_async(self, user_id, messages, estimate, priority):
+        """Same as _complete, with the async client"""
+        if not await self._admit_async(user_id, estimate, priority):
+            return None
 
-        except Exception as e:
-            logger.error(f"Errore nell'analisi immagine: {e}")
-            return "Non sono riuscito ad analizzare l'immagine. Riprova più tardi."
-    
-    def generate_response(self, user_id, message_text):
-        """Generate a response using OpenAI API"""
-        conversation = self.get_conversation(user_id)
-        conversation.add_message("user", message_text)
-        
+        logger.info(f"Sending async request to OpenAI for user {user_id}")
         try:
-            logger.info(f"Sending request to OpenAI for user {user_id}")
-            response = openai_client.chat.completions.create(
+            if self._use_hedging(priority):
+                assistant_response = await self.hedger.complete_async(
+                    self._async_stream_opener(OPENAI_MODEL, messages),
+                    self._async_stream_opener(HEDGE_MODEL, messages),
+                    allow_hedge=lambda: self._hedge_admitted(user_id, estimate),
+                    on_loser=lambda: self._refund_hedge_loser(user_id)
+                )
+                self._settle(user_id, estimate, estimate - MAX_TOKENS + count_tokens(assistant_response))
+                return assistant_response
+
+            response = await self.resilience.call_async(
+                async_openai_client.chat.completions.create,
                 model=OPENAI_MODEL,
-                messages=conversation.get_messages(),
+                messages=messages,
                 max_tokens=MAX_TOKENS,
                 temperature=TEMPERATURE
             )
+        except Exception as e:
+            self._note_error(e)
+            raise
+        self._settle(user_id, estimate, response.usage.total_tokens if response.usage else None)
+        return response.choices[0].message.content
 
-            assistant_response = response.choices[0].message.content
-            conversation.add_message("assistant", assistant_response)
+    def _flight_key(self, conversation, cacheable):
+        """Key shared by identical in-flight requests, or None if the request must not be coalesced"""
+        if self.single_flight is None or not cacheable:
+            return None
+        return response_cache_key(conversation.get_messages(), OPENAI_MODEL, TEMPERATURE)
+
+    def _coalesced(self, conversation, cacheable, complete):
+        """Run `complete`, sharing the call with identical requests already in flight"""
+        key = self._flight_key(conversation, cacheable)
+        if key is None:
+            return complete()
+        result, shared = self.single_flight.do(key, complete)
+        if shared:
+            logger.info(f"Response shared with an identical in-flight request for user {conversation.user_id}")
+        return result
 
-            return assistant_response
+    async def _coalesced_async(self, conversation, cacheable, complete):
+        """Same as _coalesced, for a coroutine function"""
+        key = self._flight_key(conversation, cacheable)
+        if key is None:
+            return await complete()
+        result, shared = await self.single_flight.do_async(key, complete)
+        if shared:
+            logger.info(f"Response shared with an identical in-flight request for user {conversation.user_id}")
+        return result
 
+    def analyze_image(self, user_id, base64_image, caption=None, priority=PRIORITY_PRIVATE):
+        """Analizza un'immagine usando GPT-4o; la didascalia, se presente, accompagna l'immagine"""
+        content = [
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{base64_image}"
+                }
+            }
+        ]
+        if caption:
+            content.append({"type": "text", "text": caption})
+        messages = [
+            {"role": "system", "content": "Descrivi dettagliatamente l'immagine inviata."},
+            {"role": "user", "content": content}
+        ]
+
+        # L'immagine pesa nei limiti del provider come il testo: passa dal rate limiter con una stima fissa
+        estimate = IMAGE_TOKEN_ESTIMATE + count_message_tokens(messages[0]) + \
+            count_tokens(caption or "") + MAX_TOKENS
+        if not self._admit(user_id, estimate, priority):
+            return BUSY_RESPONSE
+
+        try:
+            logger.info(f"Invio immagine a OpenAI GPT-4o per l'utente {user_id}")
+            response = self.resilience.call(
+                openai_client.chat.completions.create,
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE
+            )
+        except Exception as e:
+            self._note_error(e)
+            logger.error(f"Errore nell'analisi immagine: {e}")
+            return IMAGE_ERROR_RESPONSE
+
+        self._settle(user_id, estimate, response.usage.total_tokens if response.usage else None)
+        return response.choices[0].message.content
+
+    def generate_response(self, user_id, message_text, priority=PRIORITY_PRIVATE):
+        """
+        Generate a response using OpenAI API.
+
+        `priority` (PRIORITY_PRIVATE or PRIORITY_GROUP) orders the request in the
+        rate limiter queue when capacity is short.
+        """
+        conversation, cacheable = self._start_turn(user_id, message_text)
+        cache_key, cached = self._cached_response(user_id, conversation, message_text, cacheable)
+        if cached is not None:
+            return cached
+
+        estimate = self._request_tokens(conversation)
+        try:
+            assistant_response = self._coalesced(
+                conversation, cacheable,
+                lambda: self._complete(user_id, conversation.get_messages(), estimate, priority)
+            )
+        except CircuitOpenError:
+            # Let the bot answer with its fallback responses without waiting for the API
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            if "insufficient_quota" in str(e):
-                return (
-                    "Mi dispiace, ma al momento non posso accedere all'intelligenza artificiale "
-                    "a causa di un problema con il limite di utilizzo. "
-                    "Il proprietario del bot è stato avvisato del problema. "
-                    "Riprova più tardi."
-                )
+            return self._error_response(e)
+
+        if assistant_response is None:
+            return BUSY_RESPONSE
+        conversation.add_message("assistant", assistant_response)
+        if cacheable:
+            self._store_response(cache_key, conversation, message_text, assistant_response)
+        return assistant_response
+
+    def generate_response_stream(self, user_id, message_text, priority=PRIORITY_PRIVATE):
+        """
+        Generate a response using the OpenAI streaming API.
+
+        Yields the text fragments as they arrive; the full response is added to the
+        conversation once the stream ends. If the request fails before any text is
+        produced, the error message is yielded instead.
+        """
+        conversation, cacheable = self._start_turn(user_id, message_text)
+        cache_key, cached = self._cached_response(user_id, conversation, message_text, cacheable)
+        if cached is not None:
+            yield cached
+            return
+
+        estimate = self._request_tokens(conversation)
+        if not self._admit(user_id, estimate, priority):
+            yield BUSY_RESPONSE
+            return
+
+        fragments = []
+        completed = False
+        try:
+            logger.info(f"Sending streaming request to OpenAI for user {user_id}")
+            if self._use_hedging(priority):
+                deltas = self._hedged_fragments(user_id, conversation.get_messages(), estimate)
             else:
-                return (
-                    "Mi dispiace, ma sto avendo problemi a connettermi all'intelligenza artificiale. "
-                    "Riprova tra qualche momento."
-                )
+                # Retries cover opening the stream; a stream cut short is not restarted
+                deltas = stream_text(self._stream_opener(OPENAI_MODEL, conversation.get_messages())())
+
+            for delta in deltas:
+                fragments.append(delta)
+                yield delta
+            completed = True
+
+        except CircuitOpenError:
+            # Let the bot answer with its fallback responses without waiting for the API
+            raise
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            self._note_error(e)
+            if not fragments:
+                yield self._error_response(e)
+                return
+
+        # Keep in the history whatever was delivered to the user, even if the stream was cut short
+        if fragments:
+            assistant_response = "".join(fragments)
+            # The stream reports no usage: the completion is counted locally
+            self._settle(user_id, estimate, estimate - MAX_TOKENS + count_tokens(assistant_response))
+            conversation.add_message("assistant", assistant_response)
+            # Only complete responses are reused
+            if completed and cacheable:
+                self._store_response(cache_key, conversation, message_text, assistant_response)
+
+    async def generate_response_async(self, user_id, message_text, priority=PRIORITY_PRIVATE):
+        """Generate a response using the async OpenAI client (asyncio bot runtime)"""
+        conversation, cacheable = self._start_turn(user_id, message_text)
+        cache_key, cached = self._cached_response(user_id, conversation, message_text, cacheable)
+        if cached is not None:
+            return cached
+
+        estimate = self._request_tokens(conversation)
+        try:
+            assistant_response = await self._coalesced_async(
+                conversation, cacheable,
+                lambda: self._complete_async(user_id, conversation.get_messages(), estimate, priority)
+            )
+        except CircuitOpenError:
+            # Let the bot answer with its fallback responses without waiting for the API
+            raise
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            return self._error_response(e)
+
+        if assistant_response is None:
+            return BUSY_RESPONSE
+        conversation.add_message("assistant", assistant_response)
+        if cacheable:
+            self._store_response(cache_key, conversation, message_text, assistant_response)
+        return assistant_response
+
+    @staticmethod
+    def _error_response(error):
+        """User-facing message for a failed completion"""
+        if "insufficient_quota" in str(error):
+            return QUOTA_ERROR_RESPONSE
+        return API_ERROR_RESPONSE
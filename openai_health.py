@@ -0,0 +1,96 @@
+"""
+Controllo periodico in background dello stato dell'API OpenAI.
+
+Il risultato dell'ultimo controllo (stato, orario e latenza) viene tenuto in
+cache: la dashboard lo legge senza effettuare chiamate all'API, invece di
+inviare una richiesta di completamento a ogni caricamento della pagina.
+"""
+import time
+import logging
+import datetime
+import threading
+from openai_clients import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+# Stato, colore del badge e testo mostrato nella dashboard
+STATUS_DISPLAY = {
+    "active": ("success", "Attivo"),
+    "quota_exceeded": ("warning", "Quota superata"),
+    "error": ("danger", "Errore"),
+    "unknown": ("secondary", "In verifica"),
+}
+
+
+class OpenAIHealthProber:
+    """Thread che verifica periodicamente l'API OpenAI e conserva l'ultimo risultato"""
+
+    def __init__(self, interval=300, probe="models", model="gpt-4o-mini", timeout=10.0):
+        """
+        Args:
+            interval: secondi tra due controlli
+            probe: "models" (elenco modelli, non consuma token) o "completion"
+                (completamento minimo, rileva anche la quota esaurita)
+            model: modello usato dal controllo "completion"
+            timeout: secondi massimi di un controllo
+        """
+        self.client = get_openai_client()
+        self.interval = interval
+        self.timeout = timeout
+        self.probe_type = probe
+        self.model = model
+        self._lock = threading.Lock()
+        self._status = {
+            "status": "unknown",
+            "error": None,
+            "latency_ms": None,
+            "checked_at": None,
+        }
+        self._thread = None
+
+    def probe(self):
+        """Esegue subito un controllo, aggiorna la cache e restituisce il nuovo stato"""
+        start = time.perf_counter()
+        try:
+            if self.probe_type == "completion":
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": "ping"}],
+                    max_tokens=1,
+                    timeout=self.timeout
+                )
+            else:
+                self.client.models.list(timeout=self.timeout)
+            status, error = "active", None
+        except Exception as e:
+            error = str(e)
+            status = "quota_exceeded" if "insufficient_quota" in error else "error"
+            logger.warning(f"Controllo API OpenAI fallito: {error}")
+
+        result = {
+            "status": status,
+            "error": error,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "checked_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._status = result
+        return dict(result)
+
+    def get_status(self):
+        """Ultimo stato noto, senza chiamate di rete"""
+        with self._lock:
+            return dict(self._status)
+
+    def _probe_loop(self):
+        while True:
+            self.probe()
+            time.sleep(self.interval)
+
+    def start(self):
+        """Avvia il thread di controllo periodico"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._probe_loop, name="openai-health", daemon=True)
+        self._thread.start()
+        logger.info(f"Controllo API OpenAI avviato ({self.probe_type}, ogni {self.interval} secondi)")
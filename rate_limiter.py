@@ -0,0 +1,272 @@
+"""
+Controllo di ammissione delle chiamate a OpenAI (rate limiting lato client).
+
+Ogni richiesta deve ottenere, prima di essere inviata, un "gettone" da quattro
+token bucket: richieste al minuto e token al minuto, sia globali sia per
+utente. I bucket si ricaricano in modo continuo, quindi brevi raffiche
+vengono assorbite finché c'è capacità, poi le richieste attendono in coda
+invece di ricevere un 429 dal provider.
+
+In coda passano prima le chat private (`PRIORITY_PRIVATE`) e poi il traffico
+dei gruppi (`PRIORITY_GROUP`); a parità di priorità vale l'ordine di arrivo.
+Un utente fermo sul proprio limite non blocca gli altri. Ogni priorità ha
+un'attesa massima: se la capacità non arriva in tempo (o si sa già che non
+arriverà) la richiesta viene rifiutata subito.
+
+I token di una richiesta sono stimati all'ammissione (prompt + max_tokens) e
+poi corretti con `adjust` quando si conosce il consumo reale. Se il provider
+risponde comunque 429, `pause` sospende tutte le ammissioni per il tempo
+indicato da Retry-After.
+"""
+import time
+import bisect
+import asyncio
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Priorità delle richieste: valori più bassi passano prima
+PRIORITY_PRIVATE = 0
+PRIORITY_GROUP = 1
+
+# Attesa massima tra due controlli di una richiesta asincrona in coda
+ASYNC_POLL_INTERVAL = 0.25
+
+
+class TokenBucket:
+    """Bucket che si ricarica di `per_minute` unità al minuto, fino a `per_minute` unità"""
+
+    def __init__(self, per_minute, now):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Secondi prima che `amount` unità siano disponibili (0 se lo sono già)"""
+        self._refill(now)
+        # Una richiesta più grande della capacità passa quando il bucket è pieno
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount, now):
+        """Preleva `amount` unità (negativo per restituirle); il livello può scendere sotto zero"""
+        self._refill(now)
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Ticket:
+    """Richiesta in attesa di ammissione"""
+    __slots__ = ("order", "user_id", "tokens")
+
+    def __init__(self, order, user_id, tokens):
+        self.order = order  # (priorità, numero di arrivo)
+        self.user_id = user_id
+        self.tokens = tokens
+
+    def __lt__(self, other):
+        return self.order < other.order
+
+
+class RateLimiter:
+    """Token bucket globali e per utente con coda a priorità e attese limitate"""
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=30000, user_requests_per_minute=10,
+                 user_tokens_per_minute=10000, max_wait=None, max_users=10000):
+        """
+        Args:
+            requests_per_minute: richieste al minuto di tutto il bot (0 = nessun limite)
+            tokens_per_minute: token al minuto di tutto il bot (0 = nessun limite)
+            user_requests_per_minute: richieste al minuto di un singolo utente (0 = nessun limite)
+            user_tokens_per_minute: token al minuto di un singolo utente (0 = nessun limite)
+            max_wait: secondi massimi di attesa per priorità, es. {PRIORITY_PRIVATE: 20, PRIORITY_GROUP: 5}
+            max_users: utenti di cui si conservano i bucket (i meno recenti vengono scartati)
+        """
+        now = time.monotonic()
+        self._global = [TokenBucket(limit, now) if limit else None
+                        for limit in (requests_per_minute, tokens_per_minute)]
+        self._user_limits = (user_requests_per_minute, user_tokens_per_minute)
+        self.max_wait = max_wait or {PRIORITY_PRIVATE: 20.0, PRIORITY_GROUP: 5.0}
+        self.max_users = max_users
+
+        self._cond = threading.Condition()
+        self._users = OrderedDict()  # user_id -> [bucket richieste, bucket token]
+        self._waiting = []  # ticket in coda, ordinati per priorità e arrivo
+        self._arrivals = itertools.count()
+        self._paused_until = 0.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.pauses = 0
+
+    def _user_buckets(self, user_id, now):
+        buckets = self._users.get(user_id)
+        if buckets is None:
+            buckets = [TokenBucket(limit, now) if limit else None for limit in self._user_limits]
+            self._users[user_id] = buckets
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return buckets
+
+    @staticmethod
+    def _buckets_wait(buckets, tokens, now):
+        """Attesa imposta da una coppia (richieste, token) di bucket"""
+        requests_bucket, tokens_bucket = buckets
+        wait = 0.0
+        if requests_bucket is not None:
+            wait = requests_bucket.wait_time(1, now)
+        if tokens_bucket is not None:
+            wait = max(wait, tokens_bucket.wait_time(tokens, now))
+        return wait
+
+    def _user_wait(self, ticket, now):
+        return self._buckets_wait(self._user_buckets(ticket.user_id, now), ticket.tokens, now)
+
+    def _global_wait(self, tokens, now):
+        return max(self._buckets_wait(self._global, tokens, now), self._paused_until - now)
+
+    def _poll(self, ticket, deadline):
+        """
+        Prova ad ammettere il ticket; va chiamata con il lock acquisito.
+
+        Returns:
+            0 se ammesso, None se va rifiutato, altrimenti i secondi di attesa stimati
+        """
+        now = time.monotonic()
+        # Una scadenza già raggiunta (timeout=0) ammette solo se la capacità c'è adesso
+        remaining = max(deadline - now, 0.0)
+
+        # Limite dell'utente: riguarda solo lui, gli altri in coda non ne sono bloccati
+        user_wait = self._user_wait(ticket, now)
+        if user_wait > remaining:
+            return None
+        if user_wait:
+            return user_wait
+
+        # Capacità globale: spetta alla prima richiesta in coda che non è ferma sul proprio limite
+        for other in self._waiting:
+            if other is ticket:
+                break
+            if not self._user_wait(other, now):
+                wait = self._global_wait(other.tokens, now)
+                return None if remaining <= 0 else min(max(wait, 0.01), remaining)
+
+        global_wait = self._global_wait(ticket.tokens, now)
+        if global_wait > remaining:
+            return None
+        if global_wait:
+            return global_wait
+
+        for buckets in (self._global, self._user_buckets(ticket.user_id, now)):
+            requests_bucket, tokens_bucket = buckets
+            if requests_bucket is not None:
+                requests_bucket.consume(1, now)
+            if tokens_bucket is not None:
+                tokens_bucket.consume(ticket.tokens, now)
+        return 0
+
+    def _enqueue(self, user_id, tokens, priority):
+        ticket = _Ticket((priority, next(self._arrivals)), user_id, tokens)
+        bisect.insort(self._waiting, ticket)
+        return ticket
+
+    def _dequeue(self, ticket, admitted, waited):
+        self._waiting.remove(ticket)
+        if admitted:
+            self.admitted += 1
+            self.total_wait += waited
+        else:
+            self.rejected += 1
+        # Chi era dietro in coda può riprovare
+        self._cond.notify_all()
+
+    def acquire(self, user_id, tokens, priority=PRIORITY_PRIVATE, timeout=None):
+        """
+        Attende (bloccando il thread) la capacità per una richiesta di `tokens` token.
+
+        Args:
+            timeout: attesa massima in secondi (default: quella della priorità; 0 = nessuna attesa)
+
+        Returns:
+            bool: True se la richiesta è ammessa, False se l'attesa massima è superata
+        """
+        start = time.monotonic()
+        deadline = start + (self.max_wait.get(priority, 0) if timeout is None else timeout)
+        with self._cond:
+            ticket = self._enqueue(user_id, tokens, priority)
+            admitted = False
+            try:
+                while True:
+                    wait = self._poll(ticket, deadline)
+                    if wait is None:
+                        return False
+                    if wait == 0:
+                        admitted = True
+                        return True
+                    self._cond.wait(wait)
+            finally:
+                self._dequeue(ticket, admitted, time.monotonic() - start)
+
+    async def acquire_async(self, user_id, tokens, priority=PRIORITY_PRIVATE):
+        """Come `acquire`, ma attende senza bloccare l'event loop"""
+        start = time.monotonic()
+        deadline = start + self.max_wait.get(priority, 0)
+        with self._cond:
+            ticket = self._enqueue(user_id, tokens, priority)
+        admitted = False
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(ticket, deadline)
+                if wait is None:
+                    return False
+                if wait == 0:
+                    admitted = True
+                    return True
+                await asyncio.sleep(min(wait, ASYNC_POLL_INTERVAL))
+        finally:
+            with self._cond:
+                self._dequeue(ticket, admitted, time.monotonic() - start)
+
+    def adjust(self, user_id, tokens):
+        """Corregge la stima dei token di una richiesta ammessa (positivo: consumati in più)"""
+        if not tokens:
+            return
+        with self._cond:
+            now = time.monotonic()
+            for buckets in (self._global, self._user_buckets(user_id, now)):
+                if buckets[1] is not None:
+                    buckets[1].consume(tokens, now)
+            if tokens < 0:
+                self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Sospende le ammissioni per `seconds` secondi (es. dopo un 429 del provider)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.pauses += 1
+        logger.warning(f"Limite di richieste del provider raggiunto, ammissioni sospese per {seconds:g}s")
+
+    def stats(self):
+        """Richieste ammesse, rifiutate e in coda, attesa media in millisecondi"""
+        with self._cond:
+            return {
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "waiting": len(self._waiting),
+                "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+                "pauses": self.pauses,
+                "paused_seconds": max(0.0, round(self._paused_until - time.monotonic(), 1))
+            }
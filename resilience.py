@@ -0,0 +1,270 @@
+"""
+Tentativi ripetuti, scadenze e circuit breaker per le chiamate a OpenAI.
+
+`ResilientCaller.call` esegue una chiamata dell'SDK con una scadenza
+complessiva: ogni tentativo riceve come `timeout` il tempo che resta, e solo
+gli errori transitori (timeout, connessione, 408/409/429 per limite di
+richieste, 5xx) vengono ritentati, dopo un'attesa esponenziale con jitter
+casuale ("full jitter") che non supera mai la scadenza. Errori come 400, 401
+o la quota esaurita tornano subito al chiamante.
+
+Il `CircuitBreaker` conta gli esiti delle chiamate in una finestra di tempo:
+quando la quota di errori transitori supera la soglia il circuito si apre e
+per `open_seconds` le chiamate falliscono subito con `CircuitOpenError`,
+senza attendere timeout, così gli handler passano direttamente alle risposte
+di riserva. Trascorso quel tempo una sola chiamata di prova decide se
+richiudere il circuito o riaprirlo.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Codici HTTP per cui un nuovo tentativo può riuscire
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Il circuito è aperto: la chiamata non viene nemmeno tentata"""
+
+
+def is_retryable(error):
+    """Indica se l'errore è transitorio (e quindi conta come guasto del servizio)"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        return False
+    if status_code == 429 and "insufficient_quota" in str(error):
+        # Quota esaurita: ritentare non serve
+        return False
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+
+class CircuitBreaker:
+    """Circuito chiuso / aperto / semiaperto basato sulla quota di errori recenti"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_ratio=0.5, min_calls=10, window=60.0, open_seconds=30.0):
+        """
+        Args:
+            failure_ratio: quota di errori (0-1) nella finestra oltre la quale il circuito si apre
+            min_calls: chiamate minime nella finestra prima di valutare la quota
+            window: secondi di storia considerati
+            open_seconds: secondi in cui il circuito resta aperto prima della chiamata di prova
+        """
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (istante, riuscita)
+        self._failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened = 0
+        self.short_circuited = 0
+
+    def _prune(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            _, ok = self._outcomes.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def before_call(self):
+        """
+        Da chiamare prima di ogni tentativo: solleva CircuitOpenError se il circuito è aperto.
+
+        Returns:
+            bool: True se il tentativo è la chiamata di prova del circuito semiaperto
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            now = time.monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                # Una sola chiamata di prova alla volta
+                self._trial_in_flight = True
+                return True
+            self.short_circuited += 1
+        raise CircuitOpenError("OpenAI circuit breaker is open")
+
+    def record(self, ok):
+        """Registra l'esito di un tentativo"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if ok:
+                    logger.info("Circuit breaker OpenAI richiuso dopo la chiamata di prova")
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, ok))
+            if not ok:
+                self._failures += 1
+            self._prune(now)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls and \
+                    self._failures / len(self._outcomes) >= self.failure_ratio:
+                self._open(now)
+
+    def release_trial(self):
+        """Libera la chiamata di prova terminata senza esito (es. annullata): la prossima chiamata la sostituisce"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self.opened += 1
+        logger.warning(f"Circuit breaker OpenAI aperto per {self.open_seconds:g}s: "
+                       f"le richieste useranno le risposte di riserva")
+
+    def stats(self):
+        """Stato del circuito e quota di errori nella finestra"""
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "state": self._state,
+                "calls_in_window": len(self._outcomes),
+                "failure_ratio": round(self._failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+                "opened": self.opened,
+                "short_circuited": self.short_circuited
+            }
+
+
+class ResilientCaller:
+    """Esegue le chiamate all'API con scadenza, tentativi ripetuti e circuit breaker"""
+
+    def __init__(self, breaker=None, max_attempts=3, base_delay=0.5, max_delay=8.0, deadline=30.0):
+        """
+        Args:
+            breaker: CircuitBreaker condiviso (None = nessun circuito)
+            max_attempts: tentativi massimi per chiamata, il primo compreso
+            base_delay: attesa base prima del secondo tentativo, raddoppiata a ogni tentativo
+            max_delay: attesa massima tra due tentativi
+            deadline: secondi complessivi concessi a una chiamata, tentativi e attese compresi
+        """
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _backoff(self, attempt):
+        """Attesa con full jitter prima del tentativo successivo al numero `attempt`"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _before_attempt(self, attempt):
+        """Conta il tentativo; restituisce True se è la chiamata di prova del circuito"""
+        trial = self.breaker is not None and self.breaker.before_call()
+        with self._lock:
+            if attempt == 1:
+                self.calls += 1
+            else:
+                self.retries += 1
+        return trial
+
+    def _after_error(self, error, attempt, deadline):
+        """
+        Registra un tentativo fallito e decide se ritentare.
+
+        Returns:
+            secondi da attendere prima del nuovo tentativo, o None per propagare l'errore
+        """
+        retryable = is_retryable(error)
+        if self.breaker is not None:
+            # Gli errori della richiesta (400, quota...) non indicano un servizio degradato
+            self.breaker.record(not retryable)
+        if retryable and attempt < self.max_attempts:
+            delay = self._backoff(attempt)
+            remaining = deadline - time.monotonic()
+            if delay < remaining - 0.1:
+                logger.warning(f"Chiamata OpenAI fallita ({error}), tentativo {attempt + 1} tra {delay:.2f}s")
+                return delay
+        with self._lock:
+            self.failures += 1
+        return None
+
+    def _record_success(self):
+        if self.breaker is not None:
+            self.breaker.record(True)
+
+    def call(self, fn, **kwargs):
+        """Esegue `fn(**kwargs, timeout=...)` con la politica di resilienza"""
+        deadline = time.monotonic() + self.deadline
+        attempt = 1
+        while True:
+            trial = self._before_attempt(attempt)
+            try:
+                result = fn(**kwargs, timeout=max(deadline - time.monotonic(), 0.1))
+            except Exception as e:
+                delay = self._after_error(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Tentativo interrotto senza esito (task annullato, KeyboardInterrupt...):
+                # la chiamata di prova non può restare "in corso" per sempre
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self._record_success()
+            return result
+
+    async def call_async(self, fn, **kwargs):
+        """Come `call`, per le funzioni del client asincrono"""
+        deadline = time.monotonic() + self.deadline
+        attempt = 1
+        while True:
+            trial = self._before_attempt(attempt)
+            try:
+                result = await fn(**kwargs, timeout=max(deadline - time.monotonic(), 0.1))
+            except Exception as e:
+                delay = self._after_error(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Tentativo interrotto senza esito (task annullato, KeyboardInterrupt...):
+                # la chiamata di prova non può restare "in corso" per sempre
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self._record_success()
+            return result
+
+    def stats(self):
+        """Chiamate, tentativi aggiuntivi, chiamate fallite e stato del circuito"""
+        with self._lock:
+            stats = {"calls": self.calls, "retries": self.retries, "failures": self.failures}
+        if self.breaker is not None:
+            stats["circuit"] = self.breaker.stats()
+        return stats
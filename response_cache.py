@@ -0,0 +1,103 @@
+"""
+Cache delle risposte di OpenAI per richieste identiche.
+
+La chiave è un hash del prompt normalizzato (minuscole, spazi compattati),
+della cronologia già ridotta al budget, del modello e della temperatura: due
+richieste con la stessa chiave riceverebbero lo stesso contesto, quindi la
+risposta salvata può essere restituita senza chiamare l'API. Le voci scadono
+dopo `ttl` secondi e oltre `max_entries` vengono scartate le meno recenti.
+"""
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(text):
+    """Forma canonica di un messaggio: minuscole e spazi compattati"""
+    return " ".join(text.lower().split())
+
+
+def response_cache_key(messages, model, temperature):
+    """
+    Chiave di cache di una richiesta di completamento.
+
+    Args:
+        messages: messaggi inviati all'API; l'ultimo è il prompt dell'utente
+        model: modello richiesto
+        temperature: temperatura richiesta
+    """
+    *history, prompt = messages
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "history": history,
+        "prompt": normalize_prompt(prompt["content"]) if isinstance(prompt["content"], str) else prompt["content"],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache LRU con scadenza delle risposte, indicizzata per chiave di richiesta"""
+
+    def __init__(self, max_entries=500, ttl=600):
+        """
+        Args:
+            max_entries: numero massimo di risposte in memoria
+            ttl: secondi dopo i quali una risposta salvata non viene più usata
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # chiave -> (risposta, orario di inserimento), dalla meno recente
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    def get(self, key):
+        """Risposta salvata per una chiave, o None se assente o scaduta"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, response):
+        """Salva la risposta a una richiesta"""
+        with self._lock:
+            self._entries[key] = (response, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_bypass(self):
+        """Conteggia una richiesta esclusa dalla cache (conversazione con cronologia)"""
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Statistiche della cache: voci, hit, miss e richieste escluse"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bypasses": self.bypasses
+            }
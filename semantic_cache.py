@@ -0,0 +1,238 @@
+"""
+Cache semantica delle risposte alle domande frequenti.
+
+Le domande vengono trasformate in vettori con un vettorizzatore a hashing
+locale (parole, coppie di parole e trigrammi di caratteri, senza modelli da
+scaricare) e confrontate per similarità del coseno con un indice NumPy delle
+coppie domanda/risposta già viste. Sopra la soglia `threshold` viene restituita
+la risposta salvata, anche se la domanda non è scritta in modo identico
+(punteggiatura, maiuscole, piccole variazioni di parole).
+
+L'indice può essere popolato all'avvio dalle chat registrate (`mine`): come a
+runtime, solo il primo scambio di ogni sessione, perché le risposte successive
+dipendono dal contesto della conversazione. Senza NumPy la cache resta
+disattivata.
+"""
+import re
+import time
+import zlib
+import datetime
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+# Peso relativo dei diversi tipi di feature nel vettore
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.5
+
+# Righe allocate inizialmente nella matrice dell'indice
+INITIAL_CAPACITY = 256
+
+# Prefisso dei messaggi registrati per le foto: la risposta dipende dall'immagine, non dal testo
+IMAGE_MESSAGE_PREFIX = "[Immagine]"
+
+
+def _features(text):
+    """Feature testuali di una domanda con il relativo peso"""
+    words = _WORD_RE.findall(text.lower())
+    for word in words:
+        yield "w:" + word, WORD_WEIGHT
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            yield "c:" + padded[i:i + 3], TRIGRAM_WEIGHT
+    for first, second in zip(words, words[1:]):
+        yield f"b:{first} {second}", BIGRAM_WEIGHT
+
+
+class HashingVectorizer:
+    """Vettorizzatore a hashing: ogni feature viene proiettata in uno spazio di dimensione fissa"""
+
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+
+    def transform(self, text):
+        """Vettore normalizzato (norma L2 = 1) di un testo, o None se il testo non ha parole"""
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in _features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # Il bit più alto decide il segno, per ridurre l'effetto delle collisioni
+            vector[h % self.dimensions] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+
+class SemanticCache:
+    """Indice di coppie domanda/risposta interrogato per similarità del coseno"""
+
+    def __init__(self, threshold=0.9, max_entries=2000, dimensions=1024):
+        """
+        Args:
+            threshold: similarità minima (0-1) perché una risposta salvata venga riutilizzata
+            max_entries: numero massimo di coppie nell'indice (oltre, si scartano le più vecchie)
+            dimensions: dimensione dei vettori del vettorizzatore a hashing
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.available = np is not None
+        if not self.available:
+            logger.warning("NumPy non installato: cache semantica disattivata")
+            return
+
+        self.vectorizer = HashingVectorizer(dimensions)
+        self._lock = threading.Lock()
+        # Matrice dei vettori, ingrandita per raddoppi fino a max_entries righe
+        self._vectors = np.zeros((min(INITIAL_CAPACITY, max_entries), dimensions), dtype=np.float32)
+        self._answers = []
+        self._keys = []
+        self._questions = {}  # domanda normalizzata -> riga dell'indice
+        self._next = 0  # prossima riga da scrivere (buffer circolare)
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+        self.mined = 0
+
+    def lookup(self, question):
+        """Risposta salvata per la domanda più simile sopra la soglia, o None"""
+        if not self.available:
+            return None
+        start = time.perf_counter()
+        vector = self.vectorizer.transform(question)
+        answer = None
+        with self._lock:
+            if vector is not None and self._size:
+                scores = self._vectors[:self._size] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    answer = self._answers[best]
+            if answer is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.lookup_time += time.perf_counter() - start
+        return answer
+
+    def add(self, question, answer):
+        """Aggiunge (o aggiorna) una coppia domanda/risposta; restituisce True se indicizzata"""
+        if not self.available or not question or not answer:
+            return False
+        vector = self.vectorizer.transform(question)
+        if vector is None:
+            return False
+        key = " ".join(_WORD_RE.findall(question.lower()))
+        with self._lock:
+            row = self._questions.get(key)
+            if row is None:
+                row = self._next
+                self._next = (self._next + 1) % self.max_entries
+                if row < self._size:
+                    # Indice pieno: la riga della coppia più vecchia viene riutilizzata
+                    del self._questions[self._keys[row]]
+                    self._keys[row] = key
+                else:
+                    if row == len(self._vectors):
+                        self._grow()
+                    self._answers.append(answer)
+                    self._keys.append(key)
+                    self._size += 1
+                self._questions[key] = row
+            self._vectors[row] = vector
+            self._answers[row] = answer
+        return True
+
+    def _grow(self):
+        """Raddoppia le righe della matrice dei vettori, senza superare max_entries"""
+        rows = min(len(self._vectors) * 2, self.max_entries)
+        vectors = np.zeros((rows, self._vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self._vectors)] = self._vectors
+        self._vectors = vectors
+
+    def mine(self, storage, exclude=(), session_gap=None):
+        """
+        Popola l'indice con le coppie domanda/risposta delle chat registrate.
+
+        Viene indicizzato solo il primo scambio di ogni sessione: il primo messaggio
+        registrato dell'utente e, se `session_gap` è indicato, il primo dopo almeno
+        `session_gap` secondi di inattività (quando la conversazione è ripartita da zero).
+
+        Args:
+            storage: backend di `chat_storage` da cui leggere le chat
+            exclude: risposte da non indicizzare (es. messaggi di errore e risposte predefinite)
+            session_gap: secondi di inattività dopo i quali il contesto non è più in uso (None = mai)
+        """
+        if not self.available:
+            return 0
+        exclude = set(exclude)
+        added = 0
+        try:
+            for user_id in storage.list_user_ids():
+                for message in _session_openers(storage.get_messages(user_id) or [], session_gap):
+                    question = message.get("user_message") or ""
+                    answer = message.get("bot_response")
+                    if answer in exclude or question.startswith(IMAGE_MESSAGE_PREFIX):
+                        continue
+                    if self.add(question, answer):
+                        added += 1
+        except Exception as e:
+            logger.error(f"Errore nel caricamento delle chat nella cache semantica: {e}")
+        with self._lock:
+            self.mined += added
+        logger.info(f"Cache semantica: {added} coppie domanda/risposta caricate dalle chat")
+        return added
+
+    def mine_in_background(self, storage, exclude=(), session_gap=None):
+        """Esegue `mine` in un thread, per non rallentare l'avvio del bot"""
+        if not self.available:
+            return
+        threading.Thread(target=self.mine, args=(storage, exclude, session_gap), name="semantic-cache-mine",
+                         daemon=True).start()
+
+    def stats(self):
+        """Statistiche della cache: voci, hit rate e latenza media delle ricerche"""
+        if not self.available:
+            return {"available": False}
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "available": True,
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "mined": self.mined,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_lookup_ms": round(self.lookup_time / lookups * 1000, 3) if lookups else None,
+                "threshold": self.threshold
+            }
+
+
+def _parse_timestamp(value):
+    """Data e ora di un messaggio registrato (formato ISO), None se assente o non valida"""
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _session_openers(messages, session_gap):
+    """Messaggi che aprono una sessione: il primo e quelli dopo `session_gap` secondi di inattività"""
+    previous = None
+    for index, message in enumerate(messages):
+        timestamp = _parse_timestamp(message.get("timestamp"))
+        if index == 0:
+            yield message
+        elif session_gap is not None and timestamp is not None and previous is not None and \
+                (timestamp - previous).total_seconds() >= session_gap:
+            yield message
+        previous = timestamp
@@ -0,0 +1,122 @@
+"""
+Deduplicazione delle richieste identiche in corso ("single flight").
+
+Quando più richieste con la stessa chiave arrivano mentre la prima è ancora
+in corso, solo la prima esegue la funzione: le altre attendono e ricevono lo
+stesso risultato (o la stessa eccezione). Finita la chiamata la chiave viene
+liberata, quindi non è una cache: una richiesta successiva esegue di nuovo
+la funzione.
+
+Un risultato None (es. richiesta rifiutata dal rate limiter per i limiti di
+chi la eseguiva) e una chiamata annullata non vengono condivisi: chi era in
+attesa riprova per conto proprio e uno di loro esegue di nuovo la funzione.
+"""
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Chiamata in corso e il suo esito"""
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Esegue una sola volta le chiamate concorrenti con la stessa chiave"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # chiave -> _Call (thread)
+        self._futures = {}  # chiave -> asyncio.Future (runtime asyncio, un solo event loop)
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Esegue `fn()` o attende la chiamata già in corso con la stessa chiave.
+
+        Returns:
+            tuple: (risultato, True se condiviso con una chiamata già in corso)
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                owner = call is None
+                if owner:
+                    call = self._calls[key] = _Call()
+                    self.calls += 1
+                else:
+                    call.waiters += 1
+                    self.coalesced += 1
+
+            if owner:
+                break
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.result is not None:
+                return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.info(f"Risultato condiviso con {call.waiters} richieste identiche")
+        return call.result, False
+
+    async def do_async(self, key, fn):
+        """Come `do`, per una coroutine function; le richieste in attesa non bloccano l'event loop"""
+        future = self._futures.get(key)
+        while future is not None:
+            with self._lock:
+                self.coalesced += 1
+            # shield: se chi attende viene annullato, la chiamata condivisa prosegue
+            result = await asyncio.shield(future)
+            if result is not None:
+                return result, True
+            # Nessun risultato da condividere (rifiuto o chiamata annullata): si riprova
+            future = self._futures.get(key)
+
+        future = self._futures[key] = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self.calls += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            # Segna l'eccezione come letta: se nessuno era in attesa asyncio non deve segnalarla
+            future.exception()
+            raise
+        except BaseException:
+            # Annullata solo la richiesta che eseguiva la chiamata: chi attende non deve
+            # ricevere CancelledError, ma riprovare per conto proprio
+            future.set_result(None)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._futures[key]
+
+    def stats(self):
+        """Chiamate eseguite e richieste servite dal risultato di una chiamata già in corso"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._futures)
+            }
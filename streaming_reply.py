@@ -0,0 +1,143 @@
+"""
+Consegna progressiva di una risposta in streaming tramite modifiche di un messaggio Telegram.
+
+Il primo frammento generato viene inviato subito come risposta; i frammenti
+successivi vengono accumulati e applicati con `edit_message_text` al massimo
+una volta ogni `min_interval` secondi, per restare nei limiti di Telegram sulle
+modifiche dei messaggi.
+
+Se una modifica intermedia fallisce (es. limite di Telegram raggiunto) il testo
+viene riapplicato al flush successivo. Il testo finale invece non ha un flush
+successivo: la modifica viene ripetuta rispettando il `retry_after` indicato da
+Telegram e, se fallisce ancora, il testo mancante viene inviato in un nuovo
+messaggio.
+"""
+import time
+import logging
+from telebot.apihelper import ApiTelegramException
+from config import STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Lunghezza massima di un messaggio Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Suffisso mostrato mentre la risposta è ancora in generazione
+TYPING_SUFFIX = " ▌"
+
+# Tentativi di applicare il testo finale prima di inviarlo in un nuovo messaggio
+FINAL_EDIT_ATTEMPTS = 3
+
+# Attesa massima in secondi concessa a un retry_after di Telegram sul testo finale
+FINAL_EDIT_MAX_WAIT = 10.0
+
+
+def _retry_after(error):
+    """Secondi di attesa richiesti da Telegram in una risposta 429 (None se non indicati)"""
+    parameters = (error.result_json or {}).get("parameters") or {}
+    return parameters.get("retry_after")
+
+
+class StreamingReply:
+    """Messaggio Telegram aggiornato progressivamente con i frammenti di una risposta"""
+
+    def __init__(self, bot, message, min_interval=STREAM_EDIT_INTERVAL):
+        """
+        Args:
+            bot: istanza TeleBot
+            message: messaggio a cui rispondere
+            min_interval: secondi minimi tra due modifiche dello stesso messaggio
+        """
+        self.bot = bot
+        self.message = message
+        self.min_interval = min_interval
+        self.text = ""             # testo completo ricevuto finora
+        self._sent_text = ""       # testo attualmente visibile nel messaggio corrente
+        self._offset = 0           # inizio, in self.text, del messaggio corrente
+        self._reply = None         # messaggio Telegram corrente
+        self._last_edit = 0.0
+        self.edits = 0
+
+    def feed(self, delta):
+        """Aggiunge un frammento; il messaggio viene aggiornato solo se è passato abbastanza tempo"""
+        if not delta:
+            return
+        self.text += delta
+
+        if self._reply is None:
+            self._flush(final=False)
+        elif time.monotonic() - self._last_edit >= self.min_interval:
+            self._flush(final=False)
+
+    def finish(self):
+        """Applica il testo finale e restituisce la risposta completa"""
+        if self.text:
+            self._flush(final=True)
+        return self.text
+
+    def _flush(self, final):
+        """Invia o modifica il messaggio con il testo accumulato"""
+        # Se il testo supera il limite di Telegram chiudi il messaggio corrente e iniziane uno nuovo
+        while len(self.text) - self._offset > TELEGRAM_MESSAGE_LIMIT - len(TYPING_SUFFIX):
+            end = self._offset + TELEGRAM_MESSAGE_LIMIT
+            if not self._show(self.text[self._offset:end], final):
+                # Il messaggio corrente non è stato chiuso: si passa al successivo solo dopo una modifica riuscita
+                return
+            self._offset = end
+            self._reply = None
+            self._sent_text = ""
+
+        visible = self.text[self._offset:]
+        if not visible.strip():
+            return
+        self._show(visible if final else visible + TYPING_SUFFIX, final)
+
+    def _show(self, text, final=False):
+        """
+        Mostra `text` nel messaggio corrente, creandolo se necessario.
+
+        Returns:
+            bool: True se il messaggio mostra `text`, False se l'aggiornamento è fallito
+        """
+        if text == self._sent_text:
+            return True
+        attempts = FINAL_EDIT_ATTEMPTS if final else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                if self._reply is None:
+                    self._reply = self.bot.reply_to(self.message, text)
+                else:
+                    self.bot.edit_message_text(text, self._reply.chat.id, self._reply.message_id)
+                    self.edits += 1
+                self._sent_text = text
+                return True
+            except ApiTelegramException as e:
+                if self._reply is not None and "message is not modified" in (e.description or ""):
+                    self._sent_text = text
+                    return True
+                logger.warning(f"Aggiornamento del messaggio in streaming non riuscito: {e}")
+                if attempt < attempts:
+                    time.sleep(min(_retry_after(e) or self.min_interval, FINAL_EDIT_MAX_WAIT))
+            finally:
+                self._last_edit = time.monotonic()
+
+        if final:
+            return self._send_remaining(text)
+        # Modifica intermedia: il testo verrà riapplicato al prossimo flush
+        return False
+
+    def _send_remaining(self, text):
+        """Invia in un nuovo messaggio la parte di `text` che il messaggio corrente non mostra"""
+        shown = self._sent_text
+        if shown.endswith(TYPING_SUFFIX):
+            shown = shown[:-len(TYPING_SUFFIX)]
+        remaining = text[len(shown):] if shown and text.startswith(shown) else text
+        if not remaining.strip():
+            return True
+        try:
+            self._reply = self.bot.send_message(self.message.chat.id, remaining)
+        except ApiTelegramException as e:
+            logger.error(f"Invio del testo finale della risposta in streaming non riuscito: {e}")
+            return False
+        self._sent_text = text
+        return True
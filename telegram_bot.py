@@ -1,264 +1,207 @@
 import telebot
 import logging
-import datetime
-from config import TELEGRAM_TOKEN, BOT_OWNER, OPENAI_MODEL
-from openai_handler import OpenAIHandler
+from config import (TELEGRAM_TOKEN, MESSAGE_WORKER_POOL_ENABLED, MESSAGE_WORKER_POOL_SIZE,
+                    MESSAGE_WORKER_POOL_MAX_PENDING, STREAMING_ENABLED, BOT_IDENTITY_REFRESH_INTERVAL,
+                    WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, IMAGE_WORKER_POOL_SIZE, IMAGE_WORKER_POOL_MAX_PENDING,
+                    IMAGE_TARGET_SIZE, IMAGE_MAX_DOWNLOAD_BYTES, IMAGE_SPOOL_MAX_MEMORY, IMAGE_JPEG_QUALITY,
+                    IMAGE_DOWNLOAD_TIMEOUT)
+from openai_handler import OpenAIHandler, IMAGE_ERROR_RESPONSE
 from chat_logger import chat_logger
+from worker_pool import KeyedWorkerPool
+from streaming_reply import StreamingReply
+from message_router import MessageRouter, parse_message
+from bot_identity import BotIdentity
+from webhook_receiver import WebhookReceiver
+from image_pipeline import fetch_photo_base64
+from rate_limiter import PRIORITY_PRIVATE, PRIORITY_GROUP
+from bot_messages import (build_welcome_message, build_help_message, build_debug_message,
+                          get_fallback_response, is_owner, EMPTY_TRIGGER_RESPONSE,
+                          DEBUG_FORBIDDEN_RESPONSE, BUSY_RESPONSE)
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 # Initialize the OpenAI handler
 openai_handler = OpenAIHandler()
+# Pool per elaborare i messaggi in parallelo tra utenti diversi, in ordine per lo stesso utente
+message_pool = None
+if MESSAGE_WORKER_POOL_ENABLED:
+    message_pool = KeyedWorkerPool(
+        max_workers=MESSAGE_WORKER_POOL_SIZE,
+        max_pending=MESSAGE_WORKER_POOL_MAX_PENDING,
+        name="message-worker"
+    )
+# Pool separato per le foto: download e analisi sono lenti e non devono occupare i thread dei messaggi
+image_pool = KeyedWorkerPool(
+    max_workers=IMAGE_WORKER_POOL_SIZE,
+    max_pending=IMAGE_WORKER_POOL_MAX_PENDING,
+    name="image-worker"
+)
+
 # Initialize the bot
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+# Con il pool attivo gli handler vengono eseguiti nel thread di polling: solo così i messaggi
+# arrivano al pool nello stesso ordine in cui Telegram li consegna
+bot = telebot.TeleBot(TELEGRAM_TOKEN, threaded=message_pool is None)
+
+# Identità del bot letta da Telegram all'avvio, senza una chiamata getMe per ogni comando
+bot_identity = BotIdentity(bot.get_me, refresh_interval=BOT_IDENTITY_REFRESH_INTERVAL)
+
+# Tabella dei comandi: ogni messaggio viene analizzato una sola volta e consegnato all'handler giusto
+router = MessageRouter()
+
+@bot.message_handler(func=lambda message: True, content_types=['text', 'photo'])
+def route_message(message):
+    """Entry point of every message: parse it once and dispatch it through the router."""
+    routed = parse_message(message, bot_identity.username)
+    if routed is None:
+        return
+    router.dispatch(routed)
 
-@bot.message_handler(commands=['start'])
-def start_command(message):
+@router.command('start')
+def start_command(routed):
     """Send a message when the command /start is issued."""
-    # Log dettagliato per i comandi
-    logger.info(f"Comando /start ricevuto: {message.text}")
-    
-    # Verifica se il messaggio è in una chat di gruppo
-    is_group_chat = message.chat.type in ['group', 'supergroup']
-    logger.info(f"Comando in gruppo: {is_group_chat}")
-    
-    # Nei gruppi, rispondi solo se il comando inizia con 'toniai' o è di tipo menzione
-    if is_group_chat:
-        # Per i comandi nei gruppi, controlla se il testo completo inizia con 'toniai'
-        message_text = message.text if message.text else ""
-        logger.info(f"Testo comando in gruppo: '{message_text}'")
-        
-        # Controlla anche se è un comando diretto al bot tramite @nome_bot
-        if (not message_text.lower().startswith('toniai') and 
-            not message_text.startswith('/start@')):
-            logger.info(f"Comando ignorato in gruppo: '{message_text}'")
-            return
-    
-    user_first_name = message.from_user.first_name
-    welcome_message = (
-        f"Ciao {user_first_name}! 👋\n\n"
-        f"Sono un bot alimentato da intelligenza artificiale utilizzando il modello {OPENAI_MODEL} di OpenAI.\n\n"
-        f"Sono stato creato da {BOT_OWNER} su Telegram.\n\n"
-    )
-    
-    # Aggiungi istruzioni specifiche in base al tipo di chat
-    if is_group_chat:
-        welcome_message += (
-            "In questa chat di gruppo risponderò solo ai messaggi che iniziano con 'toniai'.\n\n"
-            "Esempi:\n"
-            "toniai raccontami una storia\n"
-            "toniai qual è la capitale dell'Italia?\n\n"
-            "Puoi anche usare:\n"
-            "toniai /reset - Per cancellare la cronologia della conversazione\n"
-            "toniai /help - Per vedere questa guida e altre informazioni"
-        )
-    else:
-        welcome_message += (
-            "Puoi chiedermi qualsiasi cosa e cercherò di aiutarti nel migliore dei modi.\n\n"
-            "Usa /reset per cancellare la cronologia della conversazione e iniziare una nuova chat.\n"
-            "Usa /help per vedere l'elenco dei comandi disponibili e informazioni sull'uso nei gruppi."
-        )
-    
-    bot.reply_to(message, welcome_message)
+    logger.info(f"Comando /start ricevuto da {routed.user_id} in {routed.chat_type}")
+    welcome_message = build_welcome_message(routed.first_name, routed.is_group)
+    bot.reply_to(routed.message, welcome_message)
 
-@bot.message_handler(commands=['help'])
-def help_command(message):
+@router.command('help')
+def help_command(routed):
     """Send a message when the command /help is issued."""
-    # Log dettagliato per i comandi
-    logger.info(f"Comando /help ricevuto: {message.text}")
-    
-    # Verifica se il messaggio è in una chat di gruppo
-    is_group_chat = message.chat.type in ['group', 'supergroup']
-    logger.info(f"Comando in gruppo: {is_group_chat}")
-    
-    # Nei gruppi, rispondi solo se il comando inizia con 'toniai' o è di tipo menzione
-    if is_group_chat:
-        # Per i comandi nei gruppi, controlla se il testo completo inizia con 'toniai'
-        message_text = message.text if message.text else ""
-        logger.info(f"Testo comando in gruppo: '{message_text}'")
-        
-        # Controlla anche se è un comando diretto al bot tramite @nome_bot
-        if (not message_text.lower().startswith('toniai') and 
-            not message_text.startswith('/help@')):
-            logger.info(f"Comando ignorato in gruppo: '{message_text}'")
-            return
-    
-    # Ottieni il nome utente del bot
-    bot_info = bot.get_me()
-    bot_username = bot_info.username
-    
-    # Prepara il messaggio di aiuto in base al tipo di chat
-    if is_group_chat:
-        help_message = (
-            "Ecco come utilizzarmi in questa chat di gruppo:\n\n"
-            "Inizia sempre il tuo messaggio con 'toniai' per farmi rispondere.\n\n"
-            "Comandi disponibili:\n"
-            "toniai /start - Mostra messaggio di benvenuto\n"
-            "toniai /help - Mostra questa lista di comandi\n"
-            "toniai /reset - Cancella la cronologia della conversazione\n\n"
-            "Puoi anche usare: /comando@" + bot_username + "\n\n"
-            "Esempio: toniai raccontami una storia\n\n"
-            f"Questo bot utilizza il modello AI: {OPENAI_MODEL}\n"
-            f"Sviluppato da {BOT_OWNER} su Telegram."
-        )
-    else:
-        help_message = (
-            "Ecco i comandi disponibili:\n\n"
-            "/start - Inizia una conversazione con il bot\n"
-            "/help - Mostra questa lista di comandi\n"
-            "/reset - Cancella la cronologia della conversazione\n\n"
-            "Puoi semplicemente scrivermi un messaggio e io risponderò!\n\n"
-            "Nei gruppi, inizia sempre i messaggi con 'toniai' per farmi rispondere.\n\n"
-            f"Questo bot utilizza il modello AI: {OPENAI_MODEL}\n"
-            f"Sviluppato da {BOT_OWNER} su Telegram."
-        )
-    
-    bot.reply_to(message, help_message)
+    logger.info(f"Comando /help ricevuto da {routed.user_id} in {routed.chat_type}")
+
+    # Messaggio di aiuto precalcolato per il tipo di chat
+    help_message = build_help_message(routed.is_group, bot_identity.username)
 
-@bot.message_handler(commands=['reset'])
-def reset_command(message):
+    bot.reply_to(routed.message, help_message)
+
+@router.command('reset')
+def reset_command(routed):
     """Reset the conversation history for a user."""
-    # Log dettagliato per i comandi
-    logger.info(f"Comando /reset ricevuto: {message.text}")
-    
-    # Verifica se il messaggio è in una chat di gruppo
-    is_group_chat = message.chat.type in ['group', 'supergroup']
-    logger.info(f"Comando in gruppo: {is_group_chat}")
-    
-    # Nei gruppi, rispondi solo se il comando inizia con 'toniai' o è di tipo menzione
-    if is_group_chat:
-        # Per i comandi nei gruppi, controlla se il testo completo inizia con 'toniai'
-        message_text = message.text if message.text else ""
-        logger.info(f"Testo comando in gruppo: '{message_text}'")
-        
-        # Controlla anche se è un comando diretto al bot tramite @nome_bot
-        if (not message_text.lower().startswith('toniai') and 
-            not message_text.startswith('/reset@')):
-            logger.info(f"Comando ignorato in gruppo: '{message_text}'")
-            return
-    
-    user_id = message.from_user.id
-    response = openai_handler.reset_conversation(user_id)
-    bot.reply_to(message, response)
+    logger.info(f"Comando /reset ricevuto da {routed.user_id} in {routed.chat_type}")
+    # Il reset modifica la conversazione: passa dalla stessa coda dei messaggi dell'utente,
+    # così non viene applicato prima (o nel mezzo) di una risposta ancora in elaborazione
+    submit_for_user(routed, process_reset, routed)
 
-def get_fallback_response(message_text):
-    """Provide basic responses for common queries when OpenAI is not available"""
-    message_lower = message_text.lower()
-    
-    # Dictionary of common queries and their responses
-    fallback_responses = {
-        "ciao": "Ciao! Come posso aiutarti oggi?",
-        "come stai": "Sto bene, grazie! Sono qui per aiutarti.",
-        "grazie": "Prego! Sono felice di esserti stato utile.",
-        "chi sei": f"Sono un bot di assistenza creato da {BOT_OWNER} su Telegram per aiutarti con le tue domande.",
-        "chi ti ha creato": f"Sono stato creato da {BOT_OWNER} su Telegram.",
-        "chi è il tuo proprietario": f"Il mio proprietario è {BOT_OWNER} su Telegram.",
-        "cosa puoi fare": "Posso rispondere alle tue domande su vari argomenti quando l'intelligenza artificiale è disponibile. Al momento sto operando in modalità limitata.",
-        "aiuto": "Usa /help per vedere la lista dei comandi disponibili."
-    }
-    
-    # Check if the message matches any key in the dictionary
-    for key, response in fallback_responses.items():
-        if key in message_lower:
-            return response
-    
-    # Default response if no match is found
-    return "Mi dispiace, al momento non posso generare risposte personalizzate a causa di limitazioni tecniche. Prova a usare /help per vedere i comandi disponibili o riprova più tardi."
+def process_reset(routed):
+    """Reset the conversation history and confirm it to the user."""
+    response = openai_handler.reset_conversation(routed.user_id)
+    bot.reply_to(routed.message, response)
 
-@bot.message_handler(func=lambda message: True, content_types=['text', 'photo'])
-def handle_message(message):
+def submit_for_user(routed, fn, *args):
+    """Run `fn` in the user's message queue, in order with their messages (inline without the pool)."""
+    if message_pool is None:
+        fn(*args)
+        return
+    if not message_pool.submit(routed.user_id, fn, *args):
+        logger.warning(f"Coda messaggi piena, richiesta dell'utente {routed.user_id} rifiutata")
+        bot.reply_to(routed.message, BUSY_RESPONSE)
+
+@router.command('debug')
+def debug_command(routed):
+    """Comando per debugging del bot - riservato agli sviluppatori"""
+    logger.info(f"Comando /debug ricevuto da {routed.username} (ID: {routed.user_id})")
+
+    # Solo il proprietario del bot può usare questo comando
+    if not is_owner(routed.user_id, routed.username):
+        logger.info(f"Tentativo di accesso al comando debug da utente non autorizzato: {routed.username}")
+        bot.reply_to(routed.message, DEBUG_FORBIDDEN_RESPONSE)
+        return
+
+    logger.info("Accesso al debug autorizzato, generazione informazioni di debug")
+
+    # Informazioni di debug
+    debug_message = build_debug_message(
+        bot_identity.username, routed.chat_id, routed.chat_type, routed.user_id, routed.username
+    )
+
+    bot.reply_to(routed.message, debug_message, parse_mode="Markdown")
+
+@router.photo
+def handle_photo(routed):
+    """Queue a photo for analysis with GPT-4o on the image pool."""
+    logger.info(f"Foto ricevuta da {routed.user_id}, la analizzerò con GPT-4o")
+    if not image_pool.submit(routed.user_id, process_photo, routed):
+        logger.warning(f"Coda foto piena, foto dell'utente {routed.user_id} rifiutata")
+        bot.reply_to(routed.message, BUSY_RESPONSE)
+
+def process_photo(routed):
+    """Download the photo at the smallest adequate resolution, analyze it, reply and log it."""
+    bot.send_chat_action(routed.chat_id, 'typing')
+
+    try:
+        encoded_image = fetch_photo_base64(
+            routed.message.photo,
+            bot.get_file_url,
+            target_size=IMAGE_TARGET_SIZE,
+            max_bytes=IMAGE_MAX_DOWNLOAD_BYTES,
+            spool_size=IMAGE_SPOOL_MAX_MEMORY,
+            quality=IMAGE_JPEG_QUALITY,
+            timeout=IMAGE_DOWNLOAD_TIMEOUT
+        )
+        priority = PRIORITY_GROUP if routed.is_group else PRIORITY_PRIVATE
+        response = openai_handler.analyze_image(routed.user_id, encoded_image, routed.text, priority)
+    except Exception as e:
+        logger.error(f"Errore nella preparazione della foto: {e}")
+        response = IMAGE_ERROR_RESPONSE
+
+    bot.reply_to(routed.message, response)
+
+    chat_logger.log_message(
+        user_id=routed.user_id,
+        user_message=f"[Immagine] {routed.text}" if routed.text else "[Immagine]",
+        bot_response=response,
+        username=routed.username,
+        first_name=routed.first_name
+    )
+
+@router.default
+def handle_message(routed):
     """
     Handle incoming messages and generate responses.
-    In group chats, only respond when the message starts with 'toniai'.
+    In group chats, only messages starting with 'toniai' get here, without the prefix.
     In private chats, respond to all messages.
     """
-    # Log dettagliato per il debugging nei gruppi
-    logger.info(f"Ricevuto messaggio: {message}")
-    logger.info(f"Tipo di chat: {message.chat.type}")
-    
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    message_text = message.text if message.text else ""
-    username = message.from_user.username
-    first_name = message.from_user.first_name
-
-    # # 📸 Se il messaggio contiene un'immagine
-    # if message.content_type == 'photo':
-    #     logger.info("Messaggio contiene un'immagine. La analizzerò con GPT-4o.")
-    #
-    #     # Prendi la foto con la massima risoluzione
-    #     photo = message.photo[-1]
-    #     file_info = bot.get_file(photo.file_id)
-    #     downloaded_file = bot.download_file(file_info.file_path)
-    #
-    #     # Converti in base64 per l'API OpenAI
-    #     import base64
-    #     encoded_image = base64.b64encode(downloaded_file).decode('utf-8')
-    #
-    #     bot.send_chat_action(chat_id, 'typing')
-    #
-    #     # Analizza immagine con GPT-4o
-    #     response = openai_handler.analyze_image(user_id, encoded_image)
-    #
-    #     bot.reply_to(message, response)
-    #
-    #     # Log
-    #     chat_logger.log_message(
-    #         user_id=user_id,
-    #         user_message="[Immagine]",
-    #         bot_response=response,
-    #         username=username,
-    #         first_name=first_name
-    #     )
-    #     return
-    
-    # Log dettagliato del testo del messaggio
-    logger.info(f"Testo messaggio: '{message_text}'")
-    
-    # Controlla se il messaggio è in una chat di gruppo
-    is_group_chat = message.chat.type in ['group', 'supergroup']
-    logger.info(f"È una chat di gruppo: {is_group_chat}")
-    
-    # In una chat di gruppo, rispondi solo se il messaggio inizia con "toniai" (case insensitive)
-    if is_group_chat:
-        # Verifica se il messaggio è vuoto o non inizia con "toniai"
-        if not message_text:
-            logger.info("Messaggio vuoto in gruppo, ignoro")
-            return
-            
-        logger.info(f"Controllo se '{message_text}' inizia con 'toniai' (case insensitive)")
-        if not message_text.lower().startswith("toniai"):
-            # Se non inizia con "toniai", ignora il messaggio
-            logger.info(f"Ignoro messaggio in gruppo che non inizia con 'toniai': '{message_text}'")
-            return
-        
-        logger.info("Il messaggio inizia con 'toniai', procedo all'elaborazione")
-        
-        # Trova la posizione di "toniai" (case insensitive) ed estrai il resto del messaggio
-        toniai_pos = message_text.lower().find("toniai")
-        actual_message = message_text[toniai_pos + len("toniai"):].strip()
-        logger.info(f"Messaggio dopo la rimozione di 'toniai': '{actual_message}'")
-        
-        if not actual_message:
-            # Se il messaggio è solo "toniai", chiedi come posso aiutare
-            logger.info("Il messaggio contiene solo 'toniai', invio risposta predefinita")
-            bot.reply_to(message, "Ciao! Sono qui per aiutarti. Cosa vorresti sapere?")
-            return
-        
-        message_text = actual_message
-    
+    message = routed.message
+    user_id = routed.user_id
+    chat_id = routed.chat_id
+    message_text = routed.text
+    username = routed.username
+    first_name = routed.first_name
+
+    if not message_text:
+        # Nei gruppi: il messaggio contiene solo "toniai"; chiedi come posso aiutare
+        bot.reply_to(message, EMPTY_TRIGGER_RESPONSE)
+        return
+
+    # Nel rate limiter le chat private passano prima del traffico dei gruppi
+    priority = PRIORITY_GROUP if routed.is_group else PRIORITY_PRIVATE
+
+    # La generazione della risposta avviene nel pool; se è saturo rispondi subito che il bot è occupato
+    submit_for_user(routed, process_message, message, user_id, chat_id,
+                    message_text, username, first_name, priority)
+
+def process_message(message, user_id, chat_id, message_text, username, first_name, priority=PRIORITY_PRIVATE):
+    """Generate the response for a message, reply and log it."""
     # Send typing action to indicate the bot is processing
     bot.send_chat_action(chat_id, 'typing')
     
     logger.info(f"Elaborazione messaggio da utente {user_id}: {message_text}")
     
     try:
-        # Generate response using OpenAI
-        response = openai_handler.generate_response(user_id, message_text)
-        
-        # Send the response back to the user
-        bot.reply_to(message, response)
+        if STREAMING_ENABLED:
+            # Show the response while it is being generated, editing a single message
+            streaming_reply = StreamingReply(bot, message)
+            for fragment in openai_handler.generate_response_stream(user_id, message_text, priority):
+                streaming_reply.feed(fragment)
+            response = streaming_reply.finish()
+            if not response:
+                raise RuntimeError("Empty streamed response")
+        else:
+            # Generate response using OpenAI
+            response = openai_handler.generate_response(user_id, message_text, priority)
+            
+            # Send the response back to the user
+            bot.reply_to(message, response)
         
         # Log the message and response
         chat_logger.log_message(
@@ -285,87 +228,19 @@ def handle_message(message):
         )
 
 
-
-@bot.message_handler(commands=['debug'])
-def debug_command(message):
-    """Comando per debugging del bot - riservato agli sviluppatori"""
-    # Log del comando di debug
-    logger.info(f"Comando /debug ricevuto da {message.from_user.username} (ID: {message.from_user.id})")
-    
-    # Verifica se il messaggio è in una chat di gruppo
-    is_group_chat = message.chat.type in ['group', 'supergroup']
-    logger.info(f"Comando debug in gruppo: {is_group_chat}")
-    
-    # Nei gruppi, rispondi solo se il comando inizia con 'toniai' o è di tipo menzione
-    if is_group_chat:
-        message_text = message.text if message.text else ""
-        logger.info(f"Testo comando debug in gruppo: '{message_text}'")
-        
-        # Controlla anche se è un comando diretto al bot tramite @nome_bot
-        if (not message_text.lower().startswith('toniai') and 
-            not message_text.startswith('/debug@')):
-            logger.info(f"Comando debug ignorato in gruppo: '{message_text}'")
-            return
-    
-    # Solo il proprietario del bot può usare questo comando
-    # Controlliamo sia per ID che per username
-    is_owner = (str(message.from_user.id) == "713164389" or  # ID numerico del proprietario
-                message.from_user.username == "ityttmom")    # Username del proprietario
-    
-    if not is_owner:
-        logger.info(f"Tentativo di accesso al comando debug da utente non autorizzato: {message.from_user.username}")
-        bot.reply_to(message, "Comando riservato allo sviluppatore del bot.")
-        return
-        
-    logger.info("Accesso al debug autorizzato, generazione informazioni di debug")
-    
-    # Informazioni di debug
-    bot_info = bot.get_me()
-    bot_username = bot_info.username
-    
-    debug_message = f"""
-🔍 *Informazioni di Debug del Bot*
-
-👤 *Bot Username:* @{bot_username}
-⚙️ *Versione:* 1.0.2 (Debug patch 4)
-🕒 *Ultimo riavvio:* {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-🤖 *Modello AI:* {OPENAI_MODEL}
-
-*Stati interni:*
-- Chat ID attuale: `{message.chat.id}`
-- Tipo di chat: `{message.chat.type}`
-- User ID: `{message.from_user.id}`
-- Username: `{message.from_user.username}`
-
-*Formato comandi nei gruppi:*
-Per usare comandi in gruppo puoi usare:
-1. `toniai /comando`
-2. `/comando@{bot_username}`
-
-*Esempio funzionamento in gruppi:*
-• `toniai ciao` → risponde al messaggio
-• `toniai` → chiede cosa può fare
-• `toniai /reset` → cancella la conversazione
-• `/reset@{bot_username}` → cancella la conversazione
-• Messaggio senza "toniai" → viene ignorato
-
-*Log estesi:* Attivati
-*Supporto menzioni:* Attivato
-*Diagnostica gruppi:* Attivata
-
-*Per assistenza contatta {BOT_OWNER}*
-"""
-    
-    bot.reply_to(message, debug_message, parse_mode="Markdown")
-
 def run_bot():
     """Run the bot synchronously."""
     logger.info("Starting Telegram bot...")
     
     try:
-        # Ottieni e logga informazioni sul bot
-        me = bot.get_me()
+        # Ottieni e logga informazioni sul bot (restano in cache per gli handler)
+        me = bot_identity.refresh()
+        if me is None:
+            raise RuntimeError("getMe non riuscito")
         logger.info(f"Bot avviato correttamente. Username: @{me.username}, ID: {me.id}")
+
+        # getUpdates non funziona finché è impostato un webhook (es. dopo aver usato BOT_MODE=webhook)
+        bot.remove_webhook()
         
         # Avvia il polling in ascolto dei messaggi
         bot.infinity_polling(timeout=10, long_polling_timeout=5)
@@ -373,3 +248,19 @@ def run_bot():
         logger.error(f"Errore nell'avvio del bot: {e}")
     
     logger.info("Bot polling stopped")
+
+
+def start_webhook(url):
+    """
+    Start the bot in webhook mode, inside the web server process.
+
+    Returns the WebhookReceiver to which the web endpoint hands the updates.
+    """
+    logger.info("Starting Telegram bot (webhook mode)...")
+    me = bot_identity.refresh()
+    if me is not None:
+        logger.info(f"Bot avviato correttamente. Username: @{me.username}, ID: {me.id}")
+
+    receiver = WebhookReceiver(bot, WEBHOOK_SECRET, max_queue=WEBHOOK_QUEUE_SIZE)
+    receiver.register(url)
+    return receiver
@@ -0,0 +1,14 @@
+"""
+Test unitari dei moduli del bot.
+
+`config` richiede le credenziali nell'ambiente: per i test bastano valori fittizi,
+impostati qui prima che qualunque test importi i moduli del progetto.
+"""
+import os
+import sys
+
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:test-token")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("CONVERSATION_PERSISTENCE_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,59 @@
+import sys
+import time
+import tempfile
+import unittest
+
+from bot_supervisor import BotSupervisor
+
+
+def _wait_for(condition, timeout=5):
+    """Attende che `condition()` diventi vera, fallisce il test allo scadere"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condizione non raggiunta in tempo")
+        time.sleep(0.01)
+
+
+class BotSupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        # Un processo che termina subito con errore: ogni avvio è un crash
+        self.supervisor = BotSupervisor(
+            command=[sys.executable, "-c", "import sys; sys.exit(1)"],
+            log_dir=self.log_dir.name,
+            min_backoff=0.5,
+            max_backoff=0.5
+        )
+
+    def tearDown(self):
+        self.supervisor.stop()
+        self.log_dir.cleanup()
+
+    def test_start_during_backoff_does_not_skip_the_wait(self):
+        self.supervisor.start()
+        _wait_for(self.supervisor.is_restart_pending)
+
+        # Un health check che chiama start() durante l'attesa non deve avviare il processo
+        self.assertTrue(self.supervisor.start())
+        self.assertFalse(self.supervisor.is_running())
+        self.assertTrue(self.supervisor.stats()["restart_pending"])
+        self.assertEqual(self.supervisor.restarts, 0)
+
+        # Al termine dell'attesa il riavvio viene eseguito (e contato) dal supervisore
+        _wait_for(lambda: self.supervisor.restarts >= 1)
+
+    def test_stop_cancels_pending_restart(self):
+        self.supervisor.start()
+        _wait_for(self.supervisor.is_restart_pending)
+
+        self.supervisor.stop()
+        self.assertFalse(self.supervisor.is_restart_pending())
+        time.sleep(0.7)
+        self.assertEqual(self.supervisor.restarts, 0)
+        self.assertFalse(self.supervisor.is_running())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from chat_index import UserSummaryIndex
+
+
+def _write_jsonl(path, messages, mode='w'):
+    with open(path, mode, encoding='utf-8') as f:
+        for message in messages:
+            f.write(json.dumps(message) + "\n")
+
+
+def _message(n):
+    return {"user_id": 1, "timestamp": f"2024-01-01 00:00:{n:02d}", "username": f"u{n}",
+            "first_name": "Test", "user_message": f"msg {n}", "bot_response": "ok"}
+
+
+class UserSummaryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index = UserSummaryIndex(os.path.join(self.tmp, "index"))
+        self.chat_file = os.path.join(self.tmp, "chat_1.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _summary(self):
+        return self.index.get_summary(1, self.chat_file, os.stat(self.chat_file))
+
+    def test_rebuild_counts_messages(self):
+        _write_jsonl(self.chat_file, [_message(n) for n in range(3)])
+        summary = self._summary()
+        self.assertEqual(summary["message_count"], 3)
+        self.assertEqual(summary["username"], "u2")
+
+    def test_append_updates_record_incrementally(self):
+        _write_jsonl(self.chat_file, [_message(0)])
+        self._summary()
+        previous_stat = os.stat(self.chat_file)
+        _write_jsonl(self.chat_file, [_message(1)], mode='a')
+        self.index.record_append(1, self.chat_file, previous_stat, _message(1))
+        self.assertEqual(self._summary()["message_count"], 2)
+
+    def test_external_append_is_read_from_previous_offset(self):
+        _write_jsonl(self.chat_file, [_message(0), _message(1)])
+        self._summary()
+        _write_jsonl(self.chat_file, [_message(2)], mode='a')
+        summary = self._summary()
+        self.assertEqual(summary["message_count"], 3)
+        self.assertEqual(summary["username"], "u2")
+
+    def test_rewritten_file_that_grew_is_fully_rescanned(self):
+        _write_jsonl(self.chat_file, [_message(0), _message(1)])
+        self._summary()
+        # Riscrittura atomica (come --migrate) con meno messaggi ma un file più grande
+        rewritten = [dict(_message(n), bot_response="x" * 500) for n in range(3)]
+        tmp_file = self.chat_file + ".tmp"
+        _write_jsonl(tmp_file, rewritten)
+        os.replace(tmp_file, self.chat_file)
+        self.assertEqual(self._summary()["message_count"], 3)
+
+    def test_partial_line_is_counted_once_complete(self):
+        _write_jsonl(self.chat_file, [_message(0)])
+        line = json.dumps(_message(1)) + "\n"
+        with open(self.chat_file, 'a', encoding='utf-8') as f:
+            f.write(line[:10])
+        self.assertEqual(self._summary()["message_count"], 1)
+        with open(self.chat_file, 'a', encoding='utf-8') as f:
+            f.write(line[10:])
+        self.assertEqual(self._summary()["message_count"], 2)
+
+    def test_legacy_json_file(self):
+        json_file = os.path.join(self.tmp, "chat_1.json")
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump([_message(0), _message(1)], f)
+        summary = self.index.get_summary(1, json_file, os.stat(json_file))
+        self.assertEqual(summary["message_count"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from chat_storage import FileChatStorage, SQLiteChatStorage, _iter_lines_reversed
+
+
+def _message(user_id, n):
+    return {"timestamp": f"2024-01-01 00:{n // 60:02d}:{n % 60:02d}", "user_id": user_id,
+            "username": "tester", "first_name": "Test", "user_message": f"domanda {n}",
+            "bot_response": f"risposta {n}"}
+
+
+class FileChatStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = FileChatStorage(self.tmp, storage_format="jsonl", fsync_policy="never")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_append_and_read_jsonl(self):
+        for n in range(3):
+            self.storage.append_message(_message(7, n))
+        messages = self.storage.get_messages(7)
+        self.assertEqual([m["user_message"] for m in messages], ["domanda 0", "domanda 1", "domanda 2"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, "chat_7.jsonl")))
+        self.assertIsNone(self.storage.get_messages(8))
+
+    def test_corrupt_line_is_skipped(self):
+        self.storage.append_message(_message(7, 0))
+        with open(os.path.join(self.tmp, "chat_7.jsonl"), 'a', encoding='utf-8') as f:
+            f.write('{"troncato": \n')
+        self.storage.append_message(_message(7, 1))
+        self.assertEqual(len(self.storage.get_messages(7)), 2)
+
+    def test_legacy_json_is_migrated_on_first_append(self):
+        legacy = os.path.join(self.tmp, "chat_7.json")
+        with open(legacy, 'w', encoding='utf-8') as f:
+            json.dump([_message(7, 0), _message(7, 1)], f)
+        self.storage.append_message(_message(7, 2))
+        self.assertFalse(os.path.exists(legacy))
+        self.assertTrue(os.path.exists(legacy + ".bak"))
+        self.assertEqual(len(self.storage.get_messages(7)), 3)
+
+    def test_migrate_to_jsonl(self):
+        for user_id in (1, 2):
+            with open(os.path.join(self.tmp, f"chat_{user_id}.json"), 'w', encoding='utf-8') as f:
+                json.dump([_message(user_id, n) for n in range(user_id)], f)
+        self.assertEqual(self.storage.migrate_to_jsonl(), {1: 1, 2: 2})
+        self.assertEqual(sorted(self.storage.list_user_ids()), [1, 2])
+        self.assertEqual(self.storage.count_messages(2), 2)
+
+
+class PagingTest(unittest.TestCase):
+    """Stessa finestra di messaggi da entrambi i backend"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.backends = [
+            FileChatStorage(os.path.join(self.tmp, "chats"), storage_format="jsonl", fsync_policy="never"),
+            SQLiteChatStorage(os.path.join(self.tmp, "chats.db")),
+        ]
+        for storage in self.backends:
+            for n in range(25):
+                storage.append_message(_message(7, n))
+
+    def tearDown(self):
+        for storage in self.backends:
+            storage.close()
+        shutil.rmtree(self.tmp)
+
+    def test_newest_first_pages(self):
+        for storage in self.backends:
+            with self.subTest(storage=type(storage).__name__):
+                first = storage.get_messages_page(7, offset=0, limit=10)
+                last = storage.get_messages_page(7, offset=20, limit=10)
+                self.assertEqual([m["user_message"] for m in first[:2]], ["domanda 24", "domanda 23"])
+                self.assertEqual([m["user_message"] for m in last], [f"domanda {n}" for n in range(4, -1, -1)])
+
+    def test_oldest_first_pages(self):
+        for storage in self.backends:
+            with self.subTest(storage=type(storage).__name__):
+                page = storage.get_messages_page(7, offset=10, limit=3, newest_first=False)
+                self.assertEqual([m["user_message"] for m in page], ["domanda 10", "domanda 11", "domanda 12"])
+
+    def test_offset_past_end_and_count(self):
+        for storage in self.backends:
+            with self.subTest(storage=type(storage).__name__):
+                self.assertEqual(storage.get_messages_page(7, offset=100, limit=10), [])
+                self.assertEqual(storage.get_messages_page(8), [])
+                self.assertEqual(storage.count_messages(7), 25)
+                self.assertEqual(storage.count_messages(8), 0)
+
+    def test_reverse_reader_handles_lines_across_blocks(self):
+        path = os.path.join(self.tmp, "lines.txt")
+        with open(path, 'wb') as f:
+            f.write(b"".join(b"riga %d\n" % n for n in range(100)))
+            f.write(b"ultima senza a capo")
+        lines = list(_iter_lines_reversed(path, block_size=7))
+        self.assertEqual(lines[0], b"ultima senza a capo")
+        self.assertEqual(lines[1:], [b"riga %d" % n for n in range(99, -1, -1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from unittest import mock
+
+from conversation_cache import ConversationCache
+
+
+class FakeConversation:
+    """Conversazione minima: dimensione stimata e callback di ridimensionamento"""
+
+    def __init__(self, user_id, size=0):
+        self.user_id = user_id
+        self.size_bytes = size
+        self.on_resize = None
+
+    def grow(self, delta):
+        self.size_bytes += delta
+        if self.on_resize is not None:
+            self.on_resize(delta)
+
+
+class ConversationCacheTest(unittest.TestCase):
+
+    def test_lru_eviction_by_entries(self):
+        cache = ConversationCache(FakeConversation, max_entries=2, ttl=0)
+        cache.get(1)
+        cache.get(2)
+        cache.get(1)  # 2 diventa la meno recente
+        cache.get(3)
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_hits_and_misses(self):
+        cache = ConversationCache(FakeConversation, ttl=0)
+        first = cache.get(1)
+        self.assertIs(cache.get(1), first)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_byte_accounting_follows_resize_and_removal(self):
+        cache = ConversationCache(FakeConversation, ttl=0, max_bytes=0)
+        conversation = cache.get(1)
+        conversation.grow(100)
+        cache.get(2).grow(50)
+        self.assertEqual(cache.stats()["resident_bytes"], 150)
+        cache.pop(1)
+        self.assertEqual(cache.stats()["resident_bytes"], 50)
+        # Una conversazione rimossa non aggiorna più il conteggio
+        conversation.grow(1000)
+        self.assertEqual(cache.stats()["resident_bytes"], 50)
+
+    def test_set_replaces_size(self):
+        cache = ConversationCache(FakeConversation, ttl=0)
+        cache.get(1).grow(300)
+        cache.set(1, FakeConversation(1, size=20))
+        self.assertEqual(cache.stats()["resident_bytes"], 20)
+
+    def test_eviction_by_bytes_keeps_most_recent(self):
+        cache = ConversationCache(FakeConversation, ttl=0, max_bytes=100)
+        cache.get(1).grow(60)
+        cache.get(2).grow(60)
+        self.assertNotIn(1, cache)
+        self.assertIn(2, cache)
+        # Da sola oltre il limite: resta comunque in cache
+        cache.get(2).grow(500)
+        self.assertIn(2, cache)
+        self.assertEqual(cache.stats()["resident_bytes"], 560)
+
+    def test_ttl_expiration(self):
+        cache = ConversationCache(FakeConversation, ttl=10)
+        with mock.patch("conversation_cache.time.monotonic", return_value=100.0):
+            cache.get(1).grow(10)
+        with mock.patch("conversation_cache.time.monotonic", return_value=105.0):
+            cache.get(2)
+        with mock.patch("conversation_cache.time.monotonic", return_value=111.0):
+            cache.get(2)
+        self.assertNotIn(1, cache)
+        stats = cache.stats()
+        self.assertEqual((stats["expirations"], stats["resident_bytes"]), (1, 0))
+
+    def test_on_change_callback(self):
+        changes = []
+        cache = ConversationCache(FakeConversation, ttl=0, on_change=lambda user_id, _: changes.append(user_id))
+        cache.get(1).grow(5)
+        cache.set(2, FakeConversation(2))
+        self.assertEqual(changes, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from fallback_responder import PhraseMatcher, FallbackResponder
+
+
+class PhraseMatcherTest(unittest.TestCase):
+
+    def test_match_is_case_insensitive_substring(self):
+        matcher = PhraseMatcher([(["ciao"], 0, "saluto")])
+        self.assertEqual(matcher.match("Beh, CIAO a tutti"), "saluto")
+        self.assertIsNone(matcher.match("buongiorno"))
+
+    def test_highest_priority_wins(self):
+        matcher = PhraseMatcher([
+            (["ciao"], 0, "saluto"),
+            (["chi sei"], 10, "presentazione"),
+        ])
+        self.assertEqual(matcher.match("ciao, chi sei?"), "presentazione")
+
+    def test_earlier_entry_wins_on_equal_priority(self):
+        matcher = PhraseMatcher([
+            (["aiuto"], 5, "prima"),
+            (["help"], 5, "seconda"),
+        ])
+        self.assertEqual(matcher.match("help aiuto"), "prima")
+
+    def test_phrase_inside_another_phrase_is_found(self):
+        # "chi" termina dentro "macchina": va trovato tramite i collegamenti di fallimento
+        matcher = PhraseMatcher([
+            (["macchinario"], 0, "lunga"),
+            (["chi"], 1, "corta"),
+        ])
+        self.assertEqual(matcher.match("macchina"), "corta")
+        self.assertEqual(matcher.match("macchinario"), "corta")
+
+    def test_overlapping_phrases(self):
+        matcher = PhraseMatcher([
+            (["abcd"], 1, "abcd"),
+            (["bc"], 0, "bc"),
+        ])
+        self.assertEqual(matcher.match("xabcx"), "bc")
+        self.assertEqual(matcher.match("xabcdx"), "abcd")
+
+    def test_empty_table(self):
+        self.assertIsNone(PhraseMatcher([]).match("qualsiasi cosa"))
+
+
+class FallbackResponderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "responses.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, table, mtime_ns):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(table, f)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_default_and_reload_on_change(self):
+        self._write([{"phrases": ["ciao"], "response": "Ciao!"}], 1_000_000_000)
+        responder = FallbackResponder(self.path, "default", reload_interval=0)
+        self.assertEqual(responder.respond("ciao"), "Ciao!")
+        self.assertEqual(responder.respond("altro"), "default")
+        self.assertEqual(responder.respond(None), "default")
+
+        self._write([{"phrases": ["ciao"], "response": "Salve!"}], 2_000_000_000)
+        self.assertEqual(responder.respond("ciao"), "Salve!")
+        self.assertEqual(set(responder.responses()), {"Salve!", "default"})
+
+    def test_invalid_file_keeps_previous_table(self):
+        self._write([{"phrases": ["ciao"], "response": "Ciao!"}], 1_000_000_000)
+        responder = FallbackResponder(self.path, "default", reload_interval=0)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write("[{non valido")
+        os.utime(self.path, ns=(3_000_000_000, 3_000_000_000))
+        self.assertEqual(responder.respond("ciao"), "Ciao!")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import time
+import asyncio
+import threading
+import unittest
+from types import SimpleNamespace
+
+from hedging import Hedger, LatencyTracker
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    """Stream sincrono che attende `delay` secondi prima del primo frammento"""
+
+    def __init__(self, texts, delay=0.0):
+        self.texts = texts
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        if self.closed.wait(self.delay):
+            raise RuntimeError("stream closed")
+        for text in self.texts:
+            if self.closed.is_set():
+                raise RuntimeError("stream closed")
+            yield _chunk(text)
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeAsyncStream:
+    def __init__(self, texts, delay=0.0):
+        self.texts = texts
+        self.delay = delay
+        self.closed = False
+        # Come lo stream dell'SDK: una seconda iterazione prosegue da dove si era fermata la prima
+        self._iterator = self._iterate()
+
+    def __aiter__(self):
+        return self._iterator
+
+    async def _iterate(self):
+        await asyncio.sleep(self.delay)
+        for text in self.texts:
+            yield _chunk(text)
+
+    async def close(self):
+        self.closed = True
+
+
+def _failing():
+    raise ConnectionError("primary down")
+
+
+class HedgerTest(unittest.TestCase):
+
+    def _hedger(self, delay=0.05):
+        return Hedger(LatencyTracker(min_samples=1000, default_delay=delay, min_delay=0, max_delay=delay))
+
+    def test_fast_primary_does_not_hedge(self):
+        hedger = self._hedger()
+        opened = []
+        text = "".join(hedger.stream(lambda: FakeStream(["a", "b"]),
+                                     lambda: opened.append("hedge") or FakeStream(["x"])))
+        self.assertEqual(text, "ab")
+        self.assertEqual(opened, [])
+        self.assertEqual(hedger.stats()["hedged"], 0)
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        hedger = self._hedger()
+        primary = FakeStream(["lento"], delay=5)
+        losers = []
+        text = "".join(hedger.stream(lambda: primary, lambda: FakeStream(["veloce"]),
+                                     on_loser=lambda: losers.append(1)))
+        self.assertEqual(text, "veloce")
+        self.assertTrue(primary.closed.wait(1))
+        self.assertEqual(losers, [1])
+        stats = hedger.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+
+    def test_refused_hedge_waits_for_primary(self):
+        hedger = self._hedger()
+        losers = []
+        text = "".join(hedger.stream(lambda: FakeStream(["ok"], delay=0.15), lambda: FakeStream(["x"]),
+                                     allow_hedge=lambda: False, on_loser=lambda: losers.append(1)))
+        self.assertEqual(text, "ok")
+        self.assertEqual(losers, [])
+
+    def test_failed_primary_falls_back_to_hedge(self):
+        hedger = self._hedger(delay=5)
+        start = time.monotonic()
+        text = "".join(hedger.stream(_failing, lambda: FakeStream(["riserva"])))
+        self.assertEqual(text, "riserva")
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(hedger.stats()["fallbacks"], 1)
+
+    def test_error_when_both_fail(self):
+        hedger = self._hedger()
+        with self.assertRaises(ConnectionError):
+            list(hedger.stream(_failing, _failing))
+
+    def test_complete_async_hedges_slow_primary(self):
+        hedger = self._hedger()
+        primary = FakeAsyncStream(["lento"], delay=5)
+        losers = []
+
+        async def open_primary():
+            return primary
+
+        async def open_hedge():
+            return FakeAsyncStream(["veloce", "!"])
+
+        async def run():
+            return await hedger.complete_async(open_primary, open_hedge, on_loser=lambda: losers.append(1))
+
+        self.assertEqual(asyncio.run(run()), "veloce!")
+        self.assertTrue(primary.closed)
+        self.assertEqual(losers, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import base64
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+
+import requests
+
+import image_pipeline
+from image_pipeline import (select_photo_size, download_to_spool, fetch_photo_base64, ImageDownloadError,
+                            ImageTooLargeError)
+
+SECRET_URL = "https://api.telegram.org/file/bot123456:SEGRETO/photos/file_1.jpg"
+
+
+def _size(width, height, file_id="f"):
+    return SimpleNamespace(width=width, height=height, file_id=file_id, file_size=None)
+
+
+class FakeResponse:
+    def __init__(self, chunks=(), status_code=200, headers=None):
+        self.chunks = chunks
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Client Error for url: {SECRET_URL}", response=self)
+
+    def iter_content(self, chunk_size):
+        return iter(self.chunks)
+
+
+class SelectPhotoSizeTest(unittest.TestCase):
+
+    def test_smallest_size_reaching_target(self):
+        sizes = [_size(90, 60), _size(1280, 853), _size(320, 213), _size(2560, 1706)]
+        self.assertEqual(select_photo_size(sizes, 1024).width, 1280)
+
+    def test_largest_when_none_reaches_target(self):
+        sizes = [_size(90, 60), _size(800, 600)]
+        self.assertEqual(select_photo_size(sizes, 1024).width, 800)
+
+
+class DownloadTest(unittest.TestCase):
+
+    def test_download_to_spool(self):
+        with mock.patch("image_pipeline.requests.get", return_value=FakeResponse([b"ab", b"cd"])):
+            with download_to_spool(SECRET_URL) as spool:
+                self.assertEqual(spool.read(), b"abcd")
+
+    def test_size_limit(self):
+        with mock.patch("image_pipeline.requests.get", return_value=FakeResponse(headers={"Content-Length": "100"})):
+            self.assertRaises(ImageTooLargeError, download_to_spool, SECRET_URL, max_bytes=10)
+        with mock.patch("image_pipeline.requests.get", return_value=FakeResponse([b"x" * 8, b"x" * 8])):
+            self.assertRaises(ImageTooLargeError, download_to_spool, SECRET_URL, max_bytes=10)
+
+    def _assert_sanitized(self, error, *expected):
+        message = str(error.exception)
+        self.assertNotIn("SEGRETO", message)
+        # Nemmeno la catena delle eccezioni deve riportare l'errore originale con l'URL
+        self.assertIsNone(error.exception.__cause__)
+        self.assertTrue(error.exception.__context__ is None or error.exception.__suppress_context__)
+        for text in expected:
+            self.assertIn(text, message)
+
+    def test_connection_error_hides_url(self):
+        failure = requests.ConnectionError(f"Max retries exceeded with url: {SECRET_URL}")
+        with mock.patch("image_pipeline.requests.get", side_effect=failure):
+            with self.assertRaises(ImageDownloadError) as error:
+                download_to_spool(SECRET_URL, file_id="file_1")
+        self._assert_sanitized(error, "file_1", "ConnectionError")
+
+    def test_http_error_hides_url(self):
+        with mock.patch("image_pipeline.requests.get", return_value=FakeResponse(status_code=404)):
+            with self.assertRaises(ImageDownloadError) as error:
+                download_to_spool(SECRET_URL, file_id="file_1")
+        self._assert_sanitized(error, "file_1", "HTTP 404")
+
+    def test_overall_deadline(self):
+        clock = iter([0.0, 1.0, 2.0, 31.0])
+        with mock.patch("image_pipeline.requests.get", return_value=FakeResponse([b"a", b"b", b"c"])), \
+                mock.patch("image_pipeline.time.monotonic", side_effect=lambda: next(clock)):
+            with self.assertRaises(ImageDownloadError) as error:
+                download_to_spool(SECRET_URL, timeout=30, file_id="file_1")
+        self._assert_sanitized(error, "file_1")
+
+    def test_get_file_error_hides_url(self):
+        def get_file_url(file_id):
+            raise requests.ConnectionError(f"Max retries exceeded with url: {SECRET_URL}")
+
+        with self.assertRaises(ImageDownloadError) as error:
+            fetch_photo_base64([_size(800, 600, "file_1")], get_file_url)
+        self._assert_sanitized(error, "file_1")
+
+    @unittest.skipIf(image_pipeline.Image is None, "Pillow non installato")
+    def test_fetch_photo_base64_downscales(self):
+        original = io.BytesIO()
+        image_pipeline.Image.new("RGB", (2000, 1000), "red").save(original, format="JPEG")
+        with mock.patch("image_pipeline.requests.get", return_value=FakeResponse([original.getvalue()])):
+            encoded = fetch_photo_base64([_size(2000, 1000)], lambda file_id: SECRET_URL, target_size=500)
+        with image_pipeline.Image.open(io.BytesIO(base64.b64decode(encoded))) as result:
+            self.assertEqual(max(result.size), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import asyncio
+import threading
+import unittest
+
+from rate_limiter import RateLimiter, TokenBucket, PRIORITY_PRIVATE, PRIORITY_GROUP
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_refill_and_wait_time(self):
+        bucket = TokenBucket(60, now=0.0)  # una unità al secondo
+        bucket.consume(60, now=0.0)
+        self.assertAlmostEqual(bucket.wait_time(2, now=0.0), 2.0)
+        self.assertEqual(bucket.wait_time(2, now=2.0), 0.0)
+
+    def test_request_larger_than_capacity_waits_for_full_bucket(self):
+        bucket = TokenBucket(60, now=0.0)
+        self.assertEqual(bucket.wait_time(1000, now=0.0), 0.0)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_admits_within_capacity(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=3, user_tokens_per_minute=0)
+        self.assertTrue(all(limiter.acquire(1, 10) for _ in range(3)))
+        self.assertEqual(limiter.stats()["admitted"], 3)
+
+    def test_rejects_when_capacity_arrives_after_deadline(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=1, user_tokens_per_minute=0)
+        self.assertTrue(limiter.acquire(1, 10))
+        start = time.monotonic()
+        # La prossima richiesta dell'utente sarà possibile tra 60 secondi: rifiuto immediato
+        self.assertFalse(limiter.acquire(1, 10, timeout=1))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(limiter.stats()["rejected"], 1)
+
+    def test_zero_timeout_admits_when_capacity_exists(self):
+        limiter = RateLimiter()
+        self.assertTrue(all(limiter.acquire(user_id, 100, timeout=0) for user_id in range(20)))
+        self.assertEqual(limiter.stats()["rejected"], 0)
+
+    def test_zero_timeout_rejects_without_waiting(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=1, user_tokens_per_minute=0)
+        self.assertTrue(limiter.acquire(1, 10, timeout=0))
+        self.assertFalse(limiter.acquire(1, 10, timeout=0))
+
+    def test_user_limit_does_not_block_other_users(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=1, user_tokens_per_minute=0)
+        self.assertTrue(limiter.acquire(1, 10))
+        self.assertFalse(limiter.acquire(1, 10, timeout=0.05))
+        self.assertTrue(limiter.acquire(2, 10, timeout=0.05))
+
+    def test_private_chats_are_admitted_before_groups(self):
+        # 600 richieste al minuto: una ogni 0,1 secondi dopo la prima
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=0,
+                              user_requests_per_minute=0, user_tokens_per_minute=0)
+        limiter._global[0].level = 0.0
+        order = []
+
+        def request(user_id, priority):
+            if limiter.acquire(user_id, 1, priority, timeout=5):
+                order.append(priority)
+
+        group = threading.Thread(target=request, args=(1, PRIORITY_GROUP))
+        group.start()
+        time.sleep(0.02)
+        private = threading.Thread(target=request, args=(2, PRIORITY_PRIVATE))
+        private.start()
+        group.join()
+        private.join()
+        self.assertEqual(order, [PRIORITY_PRIVATE, PRIORITY_GROUP])
+
+    def test_adjust_refunds_tokens(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=0, user_tokens_per_minute=100)
+        self.assertTrue(limiter.acquire(1, 100))
+        self.assertFalse(limiter.acquire(1, 50, timeout=0.05))
+        limiter.adjust(1, -60)
+        self.assertTrue(limiter.acquire(1, 50, timeout=0.05))
+
+    def test_pause_delays_admissions(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=0, user_tokens_per_minute=0)
+        limiter.pause(0.2)
+        self.assertFalse(limiter.acquire(1, 10, timeout=0.05))
+        start = time.monotonic()
+        self.assertTrue(limiter.acquire(1, 10, timeout=1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_acquire_async(self):
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0,
+                              user_requests_per_minute=1, user_tokens_per_minute=0,
+                              max_wait={PRIORITY_PRIVATE: 0.1})
+
+        async def run():
+            return [await limiter.acquire_async(1, 10) for _ in range(2)]
+
+        self.assertEqual(asyncio.run(run()), [True, False])
+        self.assertEqual(limiter.stats()["waiting"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
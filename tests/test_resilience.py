@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+import openai
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, is_retryable
+
+
+def _timeout_error():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def _status_error(status_code, body="error"):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, request=request)
+    return openai.APIStatusError(body, response=response, body=None)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def _open_breaker(self, clock):
+        breaker = CircuitBreaker(failure_ratio=0.5, min_calls=2, window=60, open_seconds=10)
+        with mock.patch("resilience.time.monotonic", side_effect=lambda: clock[0]):
+            for _ in range(2):
+                breaker.before_call()
+                breaker.record(False)
+        return breaker
+
+    def test_opens_after_failure_ratio(self):
+        clock = [100.0]
+        breaker = self._open_breaker(clock)
+        self.assertEqual(breaker.stats()["state"], CircuitBreaker.OPEN)
+        with mock.patch("resilience.time.monotonic", side_effect=lambda: clock[0]):
+            self.assertRaises(CircuitOpenError, breaker.before_call)
+
+    def test_half_open_allows_a_single_trial(self):
+        clock = [100.0]
+        breaker = self._open_breaker(clock)
+        clock[0] = 111.0
+        with mock.patch("resilience.time.monotonic", side_effect=lambda: clock[0]):
+            self.assertTrue(breaker.before_call())
+            self.assertRaises(CircuitOpenError, breaker.before_call)
+            breaker.record(True)
+            self.assertEqual(breaker.stats()["state"], CircuitBreaker.CLOSED)
+            self.assertFalse(breaker.before_call())
+
+    def test_failed_trial_reopens(self):
+        clock = [100.0]
+        breaker = self._open_breaker(clock)
+        clock[0] = 111.0
+        with mock.patch("resilience.time.monotonic", side_effect=lambda: clock[0]):
+            breaker.before_call()
+            breaker.record(False)
+            self.assertEqual(breaker.stats()["state"], CircuitBreaker.OPEN)
+            self.assertRaises(CircuitOpenError, breaker.before_call)
+
+    def test_released_trial_can_be_retried(self):
+        clock = [100.0]
+        breaker = self._open_breaker(clock)
+        clock[0] = 111.0
+        with mock.patch("resilience.time.monotonic", side_effect=lambda: clock[0]):
+            self.assertTrue(breaker.before_call())
+            breaker.release_trial()
+            self.assertTrue(breaker.before_call())
+
+
+class ResilientCallerTest(unittest.TestCase):
+
+    def test_retries_transient_errors(self):
+        caller = ResilientCaller(max_attempts=3, base_delay=0, deadline=5)
+        fn = mock.Mock(side_effect=[_timeout_error(), "ok"])
+        self.assertEqual(caller.call(fn, model="m"), "ok")
+        self.assertEqual(fn.call_count, 2)
+        self.assertEqual(caller.stats()["retries"], 1)
+
+    def test_does_not_retry_request_errors(self):
+        caller = ResilientCaller(max_attempts=3, base_delay=0, deadline=5)
+        fn = mock.Mock(side_effect=_status_error(400))
+        self.assertRaises(openai.APIStatusError, caller.call, fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_quota_error_is_not_retryable(self):
+        self.assertFalse(is_retryable(_status_error(429, "insufficient_quota")))
+        self.assertTrue(is_retryable(_status_error(429, "rate_limit_exceeded")))
+        self.assertTrue(is_retryable(_status_error(503)))
+
+    def test_cancelled_trial_releases_the_breaker(self):
+        breaker = CircuitBreaker(min_calls=1, open_seconds=0)
+        breaker.before_call()
+        breaker.record(False)
+        caller = ResilientCaller(breaker=breaker, max_attempts=1, deadline=5)
+
+        async def hanging(**kwargs):
+            await asyncio.sleep(10)
+
+        async def run():
+            task = asyncio.ensure_future(caller.call_async(hanging))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        # Senza il rilascio ogni chiamata successiva verrebbe rifiutata
+        self.assertTrue(breaker.before_call())
+
+
+if __name__ == '__main__':
+    unittest.main()
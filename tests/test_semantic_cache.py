@@ -0,0 +1,65 @@
+import unittest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+
+class FakeStorage:
+    def __init__(self, chats):
+        self.chats = chats
+
+    def list_user_ids(self):
+        return list(self.chats)
+
+    def get_messages(self, user_id):
+        return self.chats.get(user_id)
+
+
+def _exchange(timestamp, question, answer):
+    return {"timestamp": timestamp, "user_message": question, "bot_response": answer}
+
+
+@unittest.skipUnless(semantic_cache.np is not None, "numpy not installed")
+class SemanticCacheTest(unittest.TestCase):
+
+    def test_lookup_tolerates_small_variations(self):
+        cache = SemanticCache(threshold=0.8)
+        cache.add("Qual è la capitale della Francia?", "Parigi.")
+        self.assertEqual(cache.lookup("qual è la capitale della francia"), "Parigi.")
+        self.assertIsNone(cache.lookup("come si cucina la carbonara"))
+
+    def test_mine_indexes_only_session_openers(self):
+        storage = FakeStorage({1: [
+            _exchange("2024-01-01T10:00:00", "Qual è la capitale della Francia?", "Parigi."),
+            _exchange("2024-01-01T10:01:00", "e quella della Spagna?", "Madrid."),
+            _exchange("2024-01-01T15:00:00", "Quanto è alto il Monte Bianco?", "4808 metri."),
+        ]})
+        cache = SemanticCache(threshold=0.8)
+        self.assertEqual(cache.mine(storage, session_gap=3600), 2)
+        self.assertIsNone(cache.lookup("e quella della Spagna?"))
+        self.assertEqual(cache.lookup("quanto è alto il monte bianco"), "4808 metri.")
+
+        # Senza session_gap conta solo il primo scambio dell'utente
+        cache = SemanticCache(threshold=0.8)
+        self.assertEqual(cache.mine(storage), 1)
+
+    def test_mine_skips_canned_replies_and_photos(self):
+        storage = FakeStorage({
+            1: [_exchange("2024-01-01T10:00:00", "ciao come stai", "Risposta predefinita")],
+            2: [_exchange("2024-01-01T10:00:00", "[Immagine] cosa vedi", "Un gatto.")],
+        })
+        cache = SemanticCache(threshold=0.8)
+        self.assertEqual(cache.mine(storage, exclude=("Risposta predefinita",)), 0)
+
+    def test_ring_buffer_replaces_oldest(self):
+        cache = SemanticCache(threshold=0.99, max_entries=2)
+        cache.add("prima domanda diversa", "uno")
+        cache.add("seconda domanda diversa", "due")
+        cache.add("terza domanda diversa", "tre")
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNone(cache.lookup("prima domanda diversa"))
+        self.assertEqual(cache.lookup("terza domanda diversa"), "tre")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import unittest
+
+from singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def _run_concurrently(self, flight, fn, count=3):
+        """Avvia `count` chiamate con la stessa chiave mentre la prima è in corso"""
+        results = []
+        errors = []
+
+        def worker():
+            try:
+                results.append(flight.do("k", fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait(1)
+            return "risposta"
+
+        threads, results, _ = self._run_concurrently(flight, fn)
+        while flight.stats()["coalesced"] < 2:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True])
+        self.assertTrue(all(result == "risposta" for result, _ in results))
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fn():
+            release.wait(1)
+            raise ValueError("errore")
+
+        threads, _, errors = self._run_concurrently(flight, fn, count=2)
+        while flight.stats()["coalesced"] < 1:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+
+    def test_none_is_not_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                # Il primo esecutore viene rifiutato (es. dal rate limiter): chi attende riprova
+                release.wait(1)
+                return None
+            return "risposta"
+
+        threads, results, _ = self._run_concurrently(flight, fn, count=2)
+        while flight.stats()["coalesced"] < 1:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(set(results), {(None, False), ("risposta", False)})
+
+    def test_key_is_released_after_the_call(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("k", lambda: 1), (1, False))
+        self.assertEqual(flight.do("k", lambda: 2), (2, False))
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+class SingleFlightAsyncTest(unittest.TestCase):
+
+    def test_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "risposta"
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async("k", fn) for _ in range(3)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([shared for _, shared in results], [False, True, True])
+
+    def test_cancelled_owner_hands_over_to_a_follower(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "risposta"
+
+        async def run():
+            owner = asyncio.ensure_future(flight.do_async("k", fn))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flight.do_async("k", fn)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            results = await asyncio.gather(*followers)
+            return owner, results
+
+        owner, results = asyncio.run(run())
+        self.assertTrue(owner.cancelled())
+        self.assertEqual([result for result, _ in results], ["risposta", "risposta"])
+        self.assertEqual(sorted(shared for _, shared in results), [False, True])
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("errore")
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async("k", fn) for _ in range(2)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from types import SimpleNamespace
+
+from telebot.apihelper import ApiTelegramException
+
+from streaming_reply import StreamingReply, TYPING_SUFFIX, TELEGRAM_MESSAGE_LIMIT
+
+
+def _too_many_requests(retry_after=0):
+    return ApiTelegramException("editMessageText", None, {
+        "error_code": 429, "description": "Too Many Requests",
+        "parameters": {"retry_after": retry_after}
+    })
+
+
+class FakeBot:
+    """Registra i messaggi inviati; le modifiche falliscono finché `edit_failures` è positivo"""
+
+    def __init__(self, edit_failures=0):
+        self.edit_failures = edit_failures
+        self.messages = {}  # message_id -> testo
+        self.sent = []
+
+    def _new(self, text):
+        message_id = len(self.messages) + 1
+        self.messages[message_id] = text
+        self.sent.append(text)
+        return SimpleNamespace(chat=SimpleNamespace(id=1), message_id=message_id)
+
+    def reply_to(self, message, text):
+        return self._new(text)
+
+    def send_message(self, chat_id, text):
+        return self._new(text)
+
+    def edit_message_text(self, text, chat_id, message_id):
+        if self.edit_failures:
+            self.edit_failures -= 1
+            raise _too_many_requests()
+        self.messages[message_id] = text
+
+
+def _reply(bot):
+    return StreamingReply(bot, SimpleNamespace(chat=SimpleNamespace(id=1)), min_interval=0)
+
+
+class StreamingReplyTest(unittest.TestCase):
+
+    def test_final_text_replaces_typing_suffix(self):
+        bot = FakeBot()
+        reply = _reply(bot)
+        for fragment in ("Ciao", " mondo"):
+            reply.feed(fragment)
+        self.assertTrue(bot.messages[1].endswith(TYPING_SUFFIX))
+        self.assertEqual(reply.finish(), "Ciao mondo")
+        self.assertEqual(bot.messages, {1: "Ciao mondo"})
+
+    def test_final_edit_is_retried(self):
+        bot = FakeBot()
+        reply = _reply(bot)
+        reply.feed("Ciao")
+        bot.edit_failures = 2
+        reply.feed(" mondo")
+        reply.finish()
+        self.assertEqual(bot.messages, {1: "Ciao mondo"})
+
+    def test_final_edit_falls_back_to_new_message(self):
+        bot = FakeBot()
+        reply = _reply(bot)
+        reply.feed("Ciao")
+        bot.edit_failures = 100
+        reply.feed(" mondo")
+        reply.finish()
+        self.assertEqual(bot.sent, ["Ciao" + TYPING_SUFFIX, " mondo"])
+
+    def test_failed_edit_does_not_advance_to_next_message(self):
+        bot = FakeBot()
+        reply = _reply(bot)
+        reply.feed("a")
+        bot.edit_failures = 1
+        reply.feed("b" * TELEGRAM_MESSAGE_LIMIT)
+        # La chiusura del primo messaggio è fallita: nessun secondo messaggio ancora
+        self.assertEqual(len(bot.sent), 1)
+        reply.finish()
+        text = "a" + "b" * TELEGRAM_MESSAGE_LIMIT
+        self.assertEqual(bot.messages, {1: text[:TELEGRAM_MESSAGE_LIMIT], 2: text[TELEGRAM_MESSAGE_LIMIT:]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import unittest
+
+import webhook_receiver
+from webhook_receiver import WebhookReceiver, forward_update, MAX_FORWARDED_UPDATE
+
+
+class FakeBot:
+    """Bot che registra gli update ricevuti e può restare bloccato finché non viene sbloccato"""
+
+    def __init__(self, blocked=False):
+        self.updates = []
+        self.release = threading.Event()
+        if not blocked:
+            self.release.set()
+
+    def process_new_updates(self, updates):
+        self.release.wait(5)
+        self.updates.extend(updates)
+
+
+def _update(update_id):
+    return json.dumps({"update_id": update_id})
+
+
+@unittest.skipUnless(hasattr(webhook_receiver.socket, "AF_UNIX"), "socket Unix non disponibili")
+class ForwardUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, "webhook.sock")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_limit_fits_in_a_default_datagram(self):
+        # Il limite predefinito dei datagrammi Unix su Linux è circa 208KB
+        self.assertLess(MAX_FORWARDED_UPDATE, 200 * 1024)
+
+    def test_oversized_update_is_not_forwarded(self):
+        self.assertFalse(forward_update(self.socket_path, "x" * (MAX_FORWARDED_UPDATE + 1)))
+
+    def test_missing_leader_reports_failure(self):
+        self.assertFalse(forward_update(self.socket_path, _update(1)))
+
+    def test_forwarded_update_reaches_the_bot(self):
+        bot = FakeBot()
+        receiver = WebhookReceiver(bot, "secret")
+        receiver.listen(self.socket_path)
+
+        self.assertTrue(forward_update(self.socket_path, _update(7)))
+        deadline = time.monotonic() + 5
+        while not bot.updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([u.update_id for u in bot.updates], [7])
+
+    def test_full_leader_rejects_forwarding_instead_of_dropping(self):
+        bot = FakeBot(blocked=True)
+        receiver = WebhookReceiver(bot, "secret", max_queue=1)
+        receiver.listen(self.socket_path)
+
+        # Con il bot bloccato e la coda piena il socket del leader si riempie:
+        # l'invio non bloccante deve prima o poi fallire
+        sent = 0
+        while sent < 10000 and forward_update(self.socket_path, _update(sent)):
+            sent += 1
+        self.assertLess(sent, 10000)
+
+        # Ogni update inoltrato con successo viene comunque consegnato al bot
+        bot.release.set()
+        deadline = time.monotonic() + 5
+        while len(bot.updates) < sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(bot.updates), sent)
+        self.assertEqual(receiver.stats()["rejected"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
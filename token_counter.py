@@ -0,0 +1,50 @@
+"""
+Conteggio dei token per il budget delle conversazioni.
+
+Se è installato `tiktoken` viene usato il tokenizer del modello configurato;
+altrimenti si usa una stima veloce basata sui byte UTF-8 (circa 4 byte per
+token), sufficiente per tenere prevedibile la dimensione dei prompt.
+"""
+import logging
+from config import OPENAI_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Token aggiuntivi che l'API conteggia per ogni messaggio (ruolo e separatori)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Byte UTF-8 medi per token usati dalla stima senza tokenizer
+BYTES_PER_TOKEN = 4
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        _encoding = tiktoken.encoding_for_model(OPENAI_MODEL)
+    except KeyError:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Es. file del tokenizer non scaricabile: si ripiega sulla stima
+        logger.warning(f"Tokenizer tiktoken non disponibile, utilizzo la stima sui byte: {e}")
+
+
+def count_tokens(text):
+    """Numero di token di un testo (esatto con tiktoken, stimato altrimenti)"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return -(-len(text.encode("utf-8")) // BYTES_PER_TOKEN)
+
+
+def count_message_tokens(message):
+    """Numero di token di un messaggio della chat, comprensivo dell'overhead per messaggio"""
+    content = message["content"]
+    if not isinstance(content, str):
+        # Contenuti multimodali: conta solo le parti testuali
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return MESSAGE_TOKEN_OVERHEAD + count_tokens(content)
@@ -0,0 +1,158 @@
+"""
+Ricezione degli update di Telegram via webhook (BOT_MODE=webhook).
+
+Telegram invia ogni update con una POST all'endpoint del server Flask; la
+richiesta viene validata con l'header X-Telegram-Bot-Api-Secret-Token,
+accodata e confermata subito. Un thread di smistamento consegna poi gli
+update al bot telebot nell'ordine di arrivo (gli handler accodano la
+generazione delle risposte nel pool di worker), quindi niente polling e
+niente processo separato per il bot.
+
+Se la coda è piena l'endpoint risponde 503 e Telegram ritenta più tardi.
+
+Con più worker del server web il bot gira solo nel worker leader (vedi
+leader_election.py): gli altri worker inoltrano il corpo dell'update al leader
+tramite un socket Unix locale (`forward_update`). Il leader smette di leggere
+dal socket quando la sua coda è piena: l'invio non bloccante del worker fallisce
+e anche in questo caso l'endpoint risponde 503, così nessun update confermato
+a Telegram va perso.
+"""
+import os
+import hmac
+import queue
+import socket
+import logging
+import threading
+import telebot
+
+logger = logging.getLogger(__name__)
+
+# Dimensione massima di un update inoltrato tra worker: resta sotto il limite predefinito dei
+# datagrammi Unix (net.core.wmem_default, circa 208KB); gli update di Telegram sono molto più piccoli
+MAX_FORWARDED_UPDATE = 64 * 1024
+
+
+def verify_secret(secret_header, secret):
+    """Controlla il token segreto inviato da Telegram (confronto a tempo costante)"""
+    return bool(secret_header) and hmac.compare_digest(secret_header, secret)
+
+
+def forward_update(socket_path, payload):
+    """
+    Inoltra il corpo di un update al worker leader.
+
+    Returns:
+        bool: True se l'update è stato consegnato al socket del leader, False se è
+        troppo grande, il leader non è in ascolto o il suo socket è pieno
+    """
+    data = payload.encode("utf-8")
+    if len(data) > MAX_FORWARDED_UPDATE:
+        logger.error(f"Update troppo grande per essere inoltrato al leader ({len(data)} byte)")
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            # Con il leader sovraccarico l'invio fallisce subito invece di bloccare la richiesta
+            sock.setblocking(False)
+            sock.sendto(data, socket_path)
+        return True
+    except OSError as e:
+        logger.warning(f"Impossibile inoltrare l'update al leader: {e}")
+        return False
+
+
+class WebhookReceiver:
+    """Coda limitata degli update ricevuti via webhook e thread che li consegna al bot"""
+
+    def __init__(self, bot, secret, max_queue=1000):
+        """
+        Args:
+            bot: istanza telebot.TeleBot con gli handler registrati
+            secret: valore atteso nell'header X-Telegram-Bot-Api-Secret-Token
+            max_queue: numero massimo di update in attesa di smistamento
+        """
+        self.bot = bot
+        self.secret = secret
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._dispatch_loop, name="webhook-dispatch", daemon=True)
+        self._thread.start()
+
+    def verify(self, secret_header):
+        """Controlla il token segreto inviato da Telegram"""
+        return verify_secret(secret_header, self.secret)
+
+    def submit(self, payload, block=False):
+        """
+        Accoda il corpo JSON di un update.
+
+        Args:
+            payload: corpo JSON dell'update
+            block: attende che si liberi un posto invece di rifiutare l'update
+
+        Returns:
+            bool: True se accodato, False se la coda è piena
+        """
+        try:
+            self._queue.put(payload, block=block)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.received += 1
+        return True
+
+    def _dispatch_loop(self):
+        """Consegna al bot gli update accodati, uno alla volta e in ordine"""
+        while True:
+            payload = self._queue.get()
+            try:
+                update = telebot.types.Update.de_json(payload)
+                self.bot.process_new_updates([update])
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                logger.error(f"Errore nell'elaborazione di un update ricevuto via webhook: {e}")
+                with self._lock:
+                    self.errors += 1
+
+    def listen(self, socket_path):
+        """Accetta anche gli update inoltrati dagli altri worker sul socket Unix indicato"""
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(socket_path)
+
+        def receive_loop():
+            while True:
+                try:
+                    data = sock.recv(MAX_FORWARDED_UPDATE)
+                except OSError as e:
+                    logger.error(f"Errore nella ricezione degli update inoltrati: {e}")
+                    return
+                # L'update è già stato confermato a Telegram dal worker che lo ha inoltrato:
+                # con la coda piena si attende, e intanto i nuovi inoltri vengono rifiutati
+                self.submit(data.decode("utf-8"), block=True)
+
+        threading.Thread(target=receive_loop, name="webhook-forwarded", daemon=True).start()
+        logger.info(f"In ascolto degli update inoltrati dagli altri worker su {socket_path}")
+
+    def register(self, url):
+        """Imposta il webhook su Telegram verso l'URL indicato"""
+        self.bot.set_webhook(url=url, secret_token=self.secret, allowed_updates=["message"])
+        logger.info(f"Webhook Telegram impostato su {url}")
+
+    def stats(self):
+        """Contatori degli update ricevuti, rifiutati, elaborati e in coda"""
+        with self._lock:
+            return {
+                "received": self.received,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "errors": self.errors,
+                "queued": self._queue.qsize()
+            }
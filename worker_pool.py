@@ -0,0 +1,91 @@
+"""
+Pool di thread con serializzazione per chiave e coda limitata.
+
+I task con la stessa chiave (es. lo user_id) vengono eseguiti uno alla volta
+nell'ordine di invio, mentre task con chiavi diverse girano in parallelo sui
+thread del pool. Quando i task in attesa superano `max_pending`, `submit`
+rifiuta il nuovo task invece di accodarlo senza limiti.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool:
+    """Thread pool che garantisce l'ordine FIFO dei task con la stessa chiave"""
+
+    def __init__(self, max_workers=8, max_pending=100, name="worker"):
+        """
+        Args:
+            max_workers: numero di thread del pool
+            max_pending: numero massimo di task accettati (in esecuzione o in attesa)
+            name: prefisso dei nomi dei thread
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queues = {}  # chiave -> deque di task; una chiave presente ha già un thread che la serve
+        self._pending = 0
+        self._rejected = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Accoda un task per la chiave indicata.
+
+        Returns:
+            bool: True se il task è stato accettato, False se la coda è piena
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                return False
+            self._pending += 1
+
+            queue = self._queues.get(key)
+            if queue is not None:
+                # Un thread sta già servendo questa chiave: eseguirà anche questo task, in ordine
+                queue.append((fn, args, kwargs))
+                return True
+            self._queues[key] = deque([(fn, args, kwargs)])
+
+        self._executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        """Esegue in ordine i task di una chiave finché la sua coda non è vuota"""
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                # Il task resta in coda mentre è in esecuzione, così la chiave risulta occupata
+                fn, args, kwargs = queue[0]
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Errore nell'esecuzione di un task per la chiave {key}: {e}")
+            finally:
+                with self._lock:
+                    queue.popleft()
+                    self._pending -= 1
+
+    def stats(self):
+        """Statistiche correnti del pool"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "active_keys": len(self._queues),
+                "max_pending": self.max_pending,
+                "rejected": self._rejected
+            }
+
+    def shutdown(self, wait=True):
+        """Ferma il pool; con wait=True attende il completamento dei task accettati"""
+        self._executor.shutdown(wait=wait)